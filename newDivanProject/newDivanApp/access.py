@@ -0,0 +1,82 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.shortcuts import redirect
+
+from .models import Employee
+
+EMPLOYEE_CACHE_VERSION_KEY = 'current_employee:version'
+# Кеш процессный (LocMemCache), если в settings не настроен общий. Таймаут ограничивает, сколько
+# другой процесс может видеть старый уровень доступа после изменения сотрудника или должности
+EMPLOYEE_CACHE_TIMEOUT = 300
+NO_EMPLOYEE = 'no-employee'
+
+# Уровень доступа, начиная с которого открыты заказы, сотрудники и дашборд
+MANAGER_ACCESS_LVL = 2
+
+
+def _employee_cache_key(user_id):
+    version = cache.get_or_set(EMPLOYEE_CACHE_VERSION_KEY, 1, timeout=None)
+    return f'current_employee:{version}:{user_id}'
+
+
+# Сотрудник текущего пользователя вместе с должностью и отделом; один запрос на промах кеша, ноль - на попадание
+def get_current_employee(user):
+    if not user.is_authenticated:
+        return None
+    key = _employee_cache_key(user.pk)
+    employee = cache.get(key)
+    if employee is None:
+        employee = Employee.objects.select_related('position', 'department').filter(user_id=user.pk).first()
+        cache.set(key, employee or NO_EMPLOYEE, EMPLOYEE_CACHE_TIMEOUT)
+    return None if employee == NO_EMPLOYEE else employee
+
+
+# Смена версии разом делает недействительными записи всех пользователей
+def invalidate_employee_cache():
+    try:
+        cache.incr(EMPLOYEE_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(EMPLOYEE_CACHE_VERSION_KEY, 1, timeout=None)
+
+
+# request.employee - ленивый объект, поэтому отсутствие сотрудника проверяется через bool, а не is None
+def has_access(employee, min_level):
+    return bool(employee) and (employee.position.access_lvl or 0) >= min_level
+
+
+# @access_required() вместо @login_required и проверки employee.position.access_lvl в начале представления
+def access_required(min_level=MANAGER_ACCESS_LVL, redirect_to='active'):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not has_access(request.employee, min_level):
+                return redirect(redirect_to)
+            return view(request, *args, **kwargs)
+        return login_required(wrapper)
+    return decorator
+
+
+def _check_access(request, min_level):
+    if not request.user.is_authenticated:
+        return None
+    return has_access(request.employee, min_level)
+
+
+# То же для async def представлений. request.user и request.employee ленивые и читают сессию и БД
+# синхронно, поэтому вычисляются здесь в sync_to_async; дальше в представлении они уже готовы
+def async_access_required(min_level=MANAGER_ACCESS_LVL, redirect_to='active'):
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            allowed = await sync_to_async(_check_access)(request, min_level)
+            if allowed is None:
+                return redirect_to_login(request.get_full_path())
+            if not allowed:
+                return redirect(redirect_to)
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Prefetch
 from .models import *
 
 @admin.register(Employee)
@@ -36,11 +37,26 @@ class ContractAdmin(admin.ModelAdmin):
     list_filter = ['create_date', 'completion_date', 'is_prepayment_paid', 'is_postpayment_paid']
     search_fields = ['client__last_name', 'firm__short_name', 'total_value']
 
+class OrderExecutorInline(admin.TabularInline):
+    model = OrderExecutor
+    fields = ['employee', 'role', 'position']
+    extra = 0
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['number', 'contract', 'manager', 'source', 'status', 'executor1', 'executor2', 'executor3', 'comments']
-    list_filter = ['status', 'source', 'manager', 'executor1', 'executor2', 'executor3']
+    list_display = ['number', 'contract', 'manager', 'source', 'status', 'executor_names', 'comments']
+    list_filter = ['status', 'source', 'manager', 'executors']
     search_fields = ['number', 'manager__first_name', 'manager__last_name']
+    inlines = [OrderExecutorInline]
+
+    # исполнители всех заказов страницы - одним запросом
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('executor_assignments', queryset=OrderExecutor.objects.select_related('employee__position')))
+
+    @admin.display(description="Исполнители")
+    def executor_names(self, order):
+        return ', '.join(str(assignment.employee) for assignment in order.executor_assignments.all())
 
 @admin.register(TechnicalSpecification)
 class TechnicalSpecificationAdmin(admin.ModelAdmin):
@@ -52,8 +68,9 @@ class TechnicalSpecificationAdmin(admin.ModelAdmin):
 @admin.register(Activity)
 class ActivityAdmin(admin.ModelAdmin):
     list_display = ['order', 'employee', 'status', 'activity_descr', 'date_start', 'date_review', 'date_end',
-                    'total_work_cost', 'is_paid', 'payment_date', 'photo1', 'photo2', 'photo3', 'photo4']
+                    'total_work_cost', 'is_paid', 'payment_date', 'payroll_period', 'photo1', 'photo2', 'photo3', 'photo4']
     list_filter = ['status', 'date_start', 'date_end', 'is_paid']
+    readonly_fields = ['payroll_period']
     search_fields = ['order__number', 'employee__last_name']
 
 @admin.register(Material)
@@ -69,3 +86,37 @@ class PickupDeliveryAdmin(admin.ModelAdmin):
                     'delivery_date', 'delivery_time', 'delivery_type', 'delivery_guy', 'pickup_comments', 'delivery_comments']
     list_filter = ['is_picked', 'is_delivered', 'pickup_type', 'delivery_type']
     search_fields = ['order__number', 'pickup_type', 'delivery_type']
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'size', 'ref_count', 'created_at']
+    search_fields = ['name']
+
+# ведомости закрываются командой close_payroll и дальше только просматриваются
+class PayrollEntryInline(admin.TabularInline):
+    model = PayrollEntry
+    fields = ['full_name', 'position', 'type_salary', 'fixed_salary', 'piecework', 'activity_count', 'total']
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(PayrollPeriod)
+class PayrollPeriodAdmin(admin.ModelAdmin):
+    list_display = ['month', 'payment_date', 'created_at', 'created_by']
+    inlines = [PayrollEntryInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
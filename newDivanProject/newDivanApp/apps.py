@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class NewdivanappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'newDivanApp'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,29 @@
+import threading
+
+from django.db import transaction
+
+
+# Копит значения, переданные за транзакцию, и один раз после коммита передаёт их в flush(**наборы).
+# Каждый вызов add() регистрирует свой колбэк on_commit: колбэки откаченной точки сохранения Django снимает
+# сам, а набор разбирает первый сработавший колбэк - остальные находят его пустым. Хука на откат у Django нет,
+# поэтому значения из откаченной транзакции остаются в наборе и уходят со следующим сбросом; пересчёт
+# по ним ничего не меняет
+class OnCommitBatch:
+    def __init__(self, flush, *keys):
+        self.flush = flush
+        self.keys = keys
+        self._local = threading.local()
+
+    def add(self, **values):
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            pending = self._local.pending = {key: set() for key in self.keys}
+        for key, items in values.items():
+            pending[key].update(item for item in items if item is not None)
+        transaction.on_commit(self._run)
+
+    def _run(self):
+        pending = getattr(self._local, 'pending', None)
+        self._local.pending = None
+        if pending and any(pending.values()):
+            self.flush(**pending)
@@ -0,0 +1,48 @@
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+
+from .models import MediaBlob
+from .storage import is_blob_name, media_storage
+from .thumbnails import THUMBNAIL_FORMATS, THUMBNAIL_SIZES, forget_thumbnails, thumbnail_name
+
+
+# ******** СЧЁТЧИКИ ССЫЛОК НА ФАЙЛЫ В blobs/ ********* #
+# Файл удаляется с диска только когда на него не ссылается ни одна строка.
+# Имена вне blobs/ (загруженные до перехода на хранилище по содержимому) не учитываются.
+
+def add_references(names):
+    counts = Counter(name for name in names if is_blob_name(name))
+    for name, count in counts.items():
+        updated = MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + count)
+        if not updated:
+            blob, created = MediaBlob.objects.get_or_create(
+                name=name, defaults={'ref_count': count, 'size': media_storage.size(name)},
+            )
+            if not created:
+                MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + count)
+
+
+def release_references(names):
+    counts = Counter(name for name in names if is_blob_name(name))
+    for name, count in counts.items():
+        MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') - count)
+    orphaned = list(MediaBlob.objects.filter(name__in=counts, ref_count__lte=0).values_list('name', flat=True))
+    if orphaned:
+        MediaBlob.objects.filter(name__in=orphaned, ref_count__lte=0).delete()
+        transaction.on_commit(lambda: _delete_files(orphaned))
+
+
+def _delete_files(names):
+    # между удалением строки и коммитом тот же файл могли загрузить заново
+    still_used = set(MediaBlob.objects.filter(name__in=names).values_list('name', flat=True))
+    for name in names:
+        if name in still_used:
+            continue
+        media_storage.delete(name)
+        for size in THUMBNAIL_SIZES:
+            for fmt in THUMBNAIL_FORMATS:
+                default_storage.delete(thumbnail_name(name, size, fmt))
+        forget_thumbnails(name)
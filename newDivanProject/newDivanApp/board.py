@@ -0,0 +1,103 @@
+from django.db.models import Case, CharField, F, OuterRef, Q, Subquery, Value, When, Window
+from django.db.models.functions import RowNumber
+
+from .models import Activity, TechnicalSpecification
+from .pagination import encode_cursor, keyset_page
+from .thumbnails import thumbnail_url
+
+# Колонки доски и статусы активностей, которые в них попадают
+BOARD_COLUMNS = {
+    'backlog': ['backlog'],
+    'to_do': ['to_do'],
+    'in_progress': ['in_progress'],
+    'in_review': ['in_review'],
+    'closed': ['closed_positive', 'closed_negative'],
+}
+
+# Сколько карточек показывать в колонке за один раз
+COLUMN_LIMITS = {
+    'backlog': 20,
+    'to_do': 20,
+    'in_progress': 20,
+    'in_review': 20,
+    'closed': 20,
+}
+
+# Завершённые растут без ограничений, поэтому грузятся только по запросу
+OPEN_COLUMNS = ['backlog', 'to_do', 'in_progress', 'in_review']
+
+# Карточки упорядочены по сроку сдачи заказа
+SORT_KEY = 'order__contract__completion_date'
+
+
+# Цвет часов на карточке: в бэклоге срок подсвечивается
+def clock_color(column):
+    return '#FF0035' if column == 'backlog' else '#4e4e4e'
+
+
+def _board_activities():
+    tech_specs = TechnicalSpecification.objects.filter(order=OuterRef('order')).order_by('id')
+    return Activity.objects.select_related('employee', 'order__contract').annotate(
+        short_descr=Subquery(tech_specs.values('short_descr')[:1]),
+        furniture_type=Subquery(tech_specs.values('furniture_type1')[:1]),
+    ).filter(short_descr__isnull=False)  # активности заказов без техзадания на доску не попадают
+
+
+def _column_expression():
+    return Case(
+        *[When(status__in=statuses, then=Value(column)) for column, statuses in BOARD_COLUMNS.items()],
+        output_field=CharField(),
+    )
+
+
+def _card(activity):
+    employee = activity.employee
+    return {
+        'id': activity.id,
+        'profile_image': thumbnail_url(employee.avatar, 48) or None,
+        'employee_name': f"{employee.first_name} {employee.last_name}",
+        'order_number': activity.order.number,
+        'short_descr': activity.short_descr,
+        'furniture_type': activity.furniture_type,
+        'completion_date': activity.order.contract.completion_date,
+    }
+
+
+# Все открытые колонки одним запросом: ROW_NUMBER() в разрезе колонки отсекает лишние карточки в базе.
+# Возвращает {колонка: {'items': [...], 'next_cursor': ...}}
+def load_board(columns=OPEN_COLUMNS):
+    statuses = [status for column in columns for status in BOARD_COLUMNS[column]]
+    activities = _board_activities().filter(status__in=statuses).annotate(
+        column=_column_expression(),
+        position=Window(RowNumber(), partition_by=[_column_expression()], order_by=[F(SORT_KEY).asc(), F('id').asc()]),
+    )
+    limit_filter = Q()
+    for column in columns:
+        limit_filter |= Q(column=column, position__lte=COLUMN_LIMITS[column] + 1)
+    activities = activities.filter(limit_filter).order_by('column', 'position')
+
+    board = {column: {'items': [], 'next_cursor': None} for column in columns}
+    last_shown = {}
+    for activity in activities:
+        column = board[activity.column]
+        if activity.position > COLUMN_LIMITS[activity.column]:
+            last = last_shown[activity.column]
+            column['next_cursor'] = encode_cursor(SORT_KEY, last.order.contract.completion_date, last.pk)
+            continue
+        column['items'].append(_card(activity))
+        last_shown[activity.column] = activity
+    return board
+
+
+# Следующая страница одной колонки по курсору ("Показать ещё" и завершённые по запросу)
+def load_column(column, cursor=None):
+    activities = _board_activities().filter(status__in=BOARD_COLUMNS[column])
+    page, next_cursor = keyset_page(activities, SORT_KEY, cursor=cursor, page_size=COLUMN_LIMITS[column])
+    return {'items': [_card(activity) for activity in page], 'next_cursor': next_cursor}
+
+
+# Карточки указанных активностей одним запросом: {id: (колонка, карточка)}. Активностей, которых нет на доске
+# (удалены или заказ без техзадания), в ответе нет
+def board_cards(activity_ids):
+    activities = _board_activities().filter(pk__in=activity_ids).annotate(column=_column_expression())
+    return {activity.pk: (activity.column, _card(activity)) for activity in activities}
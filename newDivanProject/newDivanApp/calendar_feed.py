@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import Activity, Contract, Order, PickupDelivery
+
+# Самый длинный запрашиваемый период: годовой обзор плюс запас на неполные недели по краям
+MAX_RANGE_DAYS = 400
+# updated_at ставится при сохранении, а видна строка после коммита. Токен отстаёт от текущего времени
+# на этот запас, чтобы строка из ещё не закоммиченной транзакции не потерялась; недавние изменения
+# клиент может получить повторно
+SYNC_OVERLAP = timedelta(minutes=5)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+# ******** ТОКЕН СИНХРОНИЗАЦИИ ********* #
+
+# Токен - момент в секундах, после которого клиенту нужны изменения. Округлён до минуты, поэтому
+# повторные запросы без изменений в течение минуты получают тот же ответ и тот же ETag
+def make_sync_token():
+    moment = timezone.now() - SYNC_OVERLAP
+    return str(int((moment - _EPOCH).total_seconds()) // 60 * 60)
+
+
+def parse_sync_token(token):
+    return _EPOCH + timedelta(seconds=int(token))
+
+
+# ******** СОБЫТИЯ ********* #
+
+def _person(last_name, first_name):
+    return f"{last_name} {first_name}" if last_name else None
+
+
+def _event(event_id, kind, title, day, order_number, employee, event_time=None, done=False):
+    return {
+        'id': event_id, 'type': kind, 'title': title, 'date': day.isoformat(),
+        'time': event_time.strftime('%H:%M') if event_time else None,
+        'order_number': order_number, 'employee': employee, 'done': done,
+    }
+
+
+def _in_range(day, start, end):
+    return day is not None and start <= day <= end
+
+
+# Даты строки и события, которые они дают: (поле даты, тип события, подпись)
+TRANSFER_DATES = (
+    ('pickup_date', 'pickup', "Забор"),
+    ('delivery_date', 'delivery', "Доставка"),
+)
+DEADLINE_DATES = (
+    ('completion_date', 'deadline', "Срок по договору"),
+)
+ACTIVITY_DATES = (
+    ('date_start', 'activity_start', "Начало работ"),
+    ('date_review', 'activity_review', "Проверка работ"),
+    ('date_end', 'activity_end', "Окончание работ"),
+)
+
+
+def _transfer_event(row, field, kind, label):
+    prefix = field.split('_')[0]
+    done = row['is_picked'] if prefix == 'pickup' else row['is_delivered']
+    return _event(f"{kind}-{row['pk']}", kind, f"{label} {row['order__number']}", row[field], row['order__number'],
+                  _person(row[f'{prefix}_guy__last_name'], row[f'{prefix}_guy__first_name']),
+                  row[f'{prefix}_time'], done)
+
+
+def _deadline_event(row, field, kind, label):
+    return _event(f"{kind}-{row['pk']}", kind, f"{label} {row['num']}", row[field], row['order_number'],
+                  _person(row['client__last_name'], row['client__first_name']), done=row['is_postpayment_paid'])
+
+
+def _activity_event(row, field, kind, label):
+    return _event(f"{kind}-{row['pk']}", kind, f"{label} {row['order__number']}", row[field], row['order__number'],
+                  _person(row['employee__last_name'], row['employee__first_name']),
+                  done=row['status'] == 'closed_positive')
+
+
+# ******** ЗАПРОСЫ ПО ДИАПАЗОНУ ********* #
+
+# Каждый источник читается одним запросом по индексированным датам; несколько дат одной строки
+# объединяются через OR, который PostgreSQL выполняет объединением индексных сканов
+def _range_filter(dates, start, end):
+    condition = Q()
+    for field, _, _ in dates:
+        condition |= Q(**{f'{field}__range': (start, end)})
+    return condition
+
+
+def _transfer_rows(rows):
+    return rows.values('pk', 'order__number', 'pickup_date', 'pickup_time', 'is_picked', 'pickup_guy__last_name',
+                       'pickup_guy__first_name', 'delivery_date', 'delivery_time', 'is_delivered',
+                       'delivery_guy__last_name', 'delivery_guy__first_name')
+
+
+def _deadline_rows(rows):
+    first_order = Order.objects.filter(contract=OuterRef('pk')).order_by('pk').values('number')[:1]
+    return rows.annotate(order_number=Subquery(first_order)).values(
+        'pk', 'num', 'completion_date', 'is_postpayment_paid', 'order_number', 'client__last_name',
+        'client__first_name')
+
+
+def _activity_rows(rows):
+    return rows.values('pk', 'order__number', 'date_start', 'date_review', 'date_end', 'status',
+                       'employee__last_name', 'employee__first_name')
+
+
+# (модель, даты, выборка полей, построение события)
+SOURCES = [
+    (PickupDelivery, TRANSFER_DATES, _transfer_rows, _transfer_event),
+    (Contract, DEADLINE_DATES, _deadline_rows, _deadline_event),
+    (Activity, ACTIVITY_DATES, _activity_rows, _activity_event),
+]
+
+
+# События за [start, end] из всех источников - по одному запросу на источник.
+# С since отдаются только события строк, изменённых после токена, а ids перечисляет все события периода
+# (ещё по одному лёгкому запросу на источник): чего нет в ids, клиент удаляет у себя - так видны удаления
+# и переносы на даты вне периода
+def calendar_events(start, end, since=None):
+    events, ids = [], []
+    sync_token = make_sync_token()
+    for model, dates, select, build in SOURCES:
+        in_range = model.objects.filter(_range_filter(dates, start, end))
+        rows = select(in_range)
+        if since is not None:
+            rows = rows.filter(updated_at__gt=since)
+            date_fields = [field for field, _, _ in dates]
+            for pk, *days in in_range.values_list('pk', *date_fields):
+                ids.extend(f"{kind}-{pk}" for (_, kind, _), day in zip(dates, days) if _in_range(day, start, end))
+        for row in rows:
+            events.extend(build(row, field, kind, label) for field, kind, label in dates
+                          if _in_range(row[field], start, end))
+    events.sort(key=lambda event: (event['date'], event['time'] or '', event['id']))
+    result = {'start': start.isoformat(), 'end': end.isoformat(), 'events': events,
+              'sync_token': sync_token}
+    if since is not None:
+        result['ids'] = sorted(ids)
+    return result
+
+
+# ******** ЭКСПОРТ В ICALENDAR (RFC 5545) ********* #
+
+# Длительность событий со временем (забор и доставка); остальные события - на весь день
+TIMED_EVENT_DURATION = 'PT1H'
+
+
+def _ical_text(value):
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+# Строки длиннее 75 байт переносятся, продолжение начинается с пробела; UTF-8 символы не разрываются
+def _fold(line):
+    parts, current = [], ''
+    for char in line:
+        if len((current + char).encode()) > (75 if not parts else 74):
+            parts.append(current)
+            current = ''
+        current += char
+    parts.append(current)
+    return '\r\n '.join(parts)
+
+
+def _utc_stamp(moment):
+    return moment.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _ical_event(event, stamp):
+    day = datetime.strptime(event['date'], '%Y-%m-%d')
+    lines = ['BEGIN:VEVENT', f"UID:{event['id']}@newdivan", f'DTSTAMP:{stamp}']
+    if event['time']:
+        # время в базе хранится местным (TIME_ZONE), в календарь уходит в UTC
+        moment = timezone.make_aware(datetime.combine(day.date(), datetime.strptime(event['time'], '%H:%M').time()))
+        lines += [f'DTSTART:{_utc_stamp(moment)}', f'DURATION:{TIMED_EVENT_DURATION}']
+    else:
+        lines += [f'DTSTART;VALUE=DATE:{day:%Y%m%d}', f'DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}']
+    description = [f"Заказ {event['order_number']}" if event['order_number'] else '', event['employee'] or '']
+    lines += [f"SUMMARY:{_ical_text(event['title'])}",
+              f"DESCRIPTION:{_ical_text('; '.join(part for part in description if part))}",
+              f"CATEGORIES:{event['type'].upper()}",
+              'END:VEVENT']
+    return lines
+
+
+def ical_calendar(events):
+    stamp = _utc_stamp(timezone.now())
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//NewDivan//CRM//RU', 'CALSCALE:GREGORIAN',
+             'METHOD:PUBLISH', f"X-WR-CALNAME:{_ical_text('Новый диван')}"]
+    for event in events:
+        lines.extend(_ical_event(event, stamp))
+    lines.append('END:VCALENDAR')
+    return ''.join(_fold(line) + '\r\n' for line in lines)
@@ -0,0 +1,119 @@
+import logging
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .models import (Activity, ChangeLogEntry, Contract, Employee, Material, Order, OrderExecutor, PickupDelivery,
+                     TechnicalSpecification)
+
+logger = logging.getLogger(__name__)
+
+# Модели, изменения которых попадают в журнал. Сигналы пишут его для save() и delete(),
+# массовые операции (bulk_create, update, bulk_update) - явными вызовами log_changes
+LOGGED_MODELS = [Order, OrderExecutor, Contract, TechnicalSpecification, Material, PickupDelivery, Activity, Employee]
+
+CHANGES_PAGE_SIZE = 500
+MAX_CHANGES_PAGE_SIZE = 5000
+# В PostgreSQL id выдаётся при вставке, а видна строка после коммита: транзакция, взявшая id раньше,
+# может закоммититься позже соседней. Недостающий id может держать только пишущая транзакция, начатая
+# до вставки записи за пропуском (начатая позже получит id больше), поэтому выдача стоит на пропуске,
+# пока такая транзакция идёт (сколько бы она ни длилась - close_payroll, импорт). Пропуск от отката
+# держит выдачу, только пока идёт транзакция, параллельная записи за ним. Время вставки и начала
+# транзакций берётся с часов СУБД, GAP_SLACK - запас на порядок вычисления времени и id в одной строке.
+# Ограничения: транзакция дольше MAX_GAP_WAIT (или сессия, зависшая в "idle in transaction") выдачу
+# больше не держит - пропуск считается откатом, и её записи, закоммиченные позже, в выдачу не попадут.
+# Транзакции чужих сессий видны в pg_stat_activity только роли с правами на них (или с pg_read_all_stats);
+# если часть сессий не видна, выдача на пропусках не стоит вовсе
+GAP_SLACK = timedelta(seconds=1)
+MAX_GAP_WAIT = timedelta(hours=1)
+
+
+def _order_id(instance):
+    if isinstance(instance, Order):
+        return instance.pk
+    return getattr(instance, 'order_id', None)
+
+
+# created_at - время вставки строки по часам СУБД: с ним сравнивается начало транзакций (см. _gap_pending).
+# Now() в PostgreSQL - начало запроса, а в массовой вставке строки получают id по ходу её выполнения
+class _InsertTime(Now):
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="CLOCK_TIMESTAMP()", **extra_context)
+
+
+def log_change(instance, action):
+    ChangeLogEntry.objects.create(model=type(instance).__name__, object_id=instance.pk, action=action,
+                                  order_id=_order_id(instance), created_at=_InsertTime())
+
+
+# Для массовых операций: одна вставка на все строки. Вызывать в той же транзакции, что и сама операция
+def log_changes(instances, action):
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(model=type(instance).__name__, object_id=instance.pk, action=action,
+                       order_id=_order_id(instance), created_at=_InsertTime())
+        for instance in instances
+    ], batch_size=1000)
+
+
+# Изменения после курсора по возрастанию id. next_cursor - id последней отданной записи;
+# has_more - есть ли ещё записи за пределами страницы
+def changes_since(cursor, limit=CHANGES_PAGE_SIZE):
+    rows = list(ChangeLogEntry.objects.filter(id__gt=cursor).order_by('id')
+                .values('id', 'model', 'object_id', 'action', 'order_id', 'created_at')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if connection.vendor == 'postgresql':
+        activity = None
+        previous = cursor
+        for index, row in enumerate(rows):
+            if row['id'] != previous + 1:
+                activity = activity or _write_activity()
+                # запись из пропуска могла закоммититься между чтением страницы и проверкой транзакций
+                if _gap_pending(row, *activity) or _gap_filled(previous, row['id']):
+                    rows, has_more = rows[:index], True
+                    break
+            previous = row['id']
+
+    return {
+        'changes': rows,
+        'next_cursor': rows[-1]['id'] if rows else cursor,
+        'has_more': has_more,
+    }
+
+
+# Текущее время СУБД и начало самой ранней из идущих пишущих транзакций (None, если таких нет
+# или не все сессии базы видны). Транзакция получает backend_xid при первой записи,
+# поэтому читающие сессии выдачу не держат
+def _write_activity():
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT statement_timestamp(),
+                   min(xact_start) FILTER (WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()),
+                   bool_and(pg_has_role('pg_read_all_stats', 'USAGE') OR pg_has_role(usesysid, 'USAGE'))
+            FROM pg_stat_activity
+            WHERE datname = current_database()
+        """)
+        now, oldest_write_start, all_visible = cursor.fetchone()
+    if all_visible is False:
+        logger.warning("Роли БД не видны транзакции части сессий в pg_stat_activity, "
+                       "пропуски в журнале изменений не ждут незакоммиченных записей")
+        return now, None
+    return now, oldest_write_start
+
+
+def _gap_filled(previous, next_id):
+    return ChangeLogEntry.objects.filter(id__gt=previous, id__lt=next_id).exists()
+
+
+# Пропуск перед row ещё может заполниться: идёт транзакция, начатая до записи row
+def _gap_pending(row, now, oldest_write_start):
+    if oldest_write_start is None or row['created_at'] < now - MAX_GAP_WAIT:
+        return False
+    return oldest_write_start <= row['created_at'] + GAP_SLACK
+
+
+def prune_change_log(older_than):
+    return ChangeLogEntry.objects.filter(created_at__lt=timezone.now() - older_than).delete()[0]
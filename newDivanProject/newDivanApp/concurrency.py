@@ -0,0 +1,31 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+
+# Параллельно имеет смысл ходить только в серверную СУБД: SQLite пишет и читает один файл,
+# а в тестах TestCase данные видны лишь в соединении основного потока.
+# Настройкой ASYNC_QUERY_CONCURRENCY параллельность можно принудительно включить или выключить
+def concurrency_enabled():
+    return getattr(settings, 'ASYNC_QUERY_CONCURRENCY', connection.vendor != 'sqlite')
+
+
+def _run_in_own_connection(call):
+    try:
+        return call()
+    finally:
+        # поток из пула asgiref открыл своё соединение; закрываем его по правилам CONN_MAX_AGE
+        close_old_connections()
+
+
+# Выполняет независимые синхронные вызовы с запросами к БД из асинхронного представления.
+# Каждый вызов идёт в отдельном потоке со своим соединением, поэтому запросы выполняются одновременно,
+# а не друг за другом в общем потоке sync_to_async. Результаты возвращаются в порядке вызовов
+async def gather_queries(*calls):
+    if not concurrency_enabled():
+        return await sync_to_async(lambda: [call() for call in calls])()
+    return await asyncio.gather(*(
+        sync_to_async(_run_in_own_connection, thread_sensitive=False)(call) for call in calls
+    ))
@@ -0,0 +1,26 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+
+# JSON-ответ с ETag по содержимому. Браузер хранит ответ и перезапрашивает его с If-None-Match;
+# если данные не изменились, уходит пустой 304 вместо повторной выгрузки
+def conditional_json_response(request, data):
+    content = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, sort_keys=True).encode()
+    etag = '"%s"' % hashlib.md5(content, usedforsecurity=False).hexdigest()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json')
+    return set_revalidation_headers(response, etag)
+
+
+# private - ответ зависит от пользователя, no-cache - хранить можно, но перед использованием сверять.
+# Vary: страницы и их AJAX-списки открываются по одному адресу и не должны подменять друг друга в кеше
+def set_revalidation_headers(response, etag):
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['X-Requested-With'])
+    return response
@@ -0,0 +1,70 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+
+from .concurrency import gather_queries
+from .models import Employee, Order, OrderListRow
+from .versions import get_table_versions
+
+# Таблицы, из которых считаются показатели; их версии (TableVersion) входят в ключ снимка
+DASHBOARD_TABLES = ['order', 'contract', 'employee']
+# Снимок сбрасывается сменой версий; таймаут только не даёт кешу копить снимки старых версий
+DASHBOARD_CACHE_TIMEOUT = 60 * 10
+DASHBOARD_CARDS_LIMIT = 12
+
+COMPLETED_STATUSES = ['closed', 'delivered']
+QUEUE_STATUSES = ['to_do', 'registered', 'to_pickup', 'is_picked', 'to_deliver']
+IN_PROGRESS_STATUSES = ['in_progress', 'in_review', 'suspended']
+
+
+# Все показатели по заказам считаются одним запросом с условной агрегацией
+def compute_order_kpis():
+    kpis = Order.objects.aggregate(
+        total_orders=Count('id'),
+        total_contract_value=Sum('contract__total_value'),
+        completed_count=Count('id', filter=Q(status__in=COMPLETED_STATUSES)),
+        queue_count=Count('id', filter=Q(status__in=QUEUE_STATUSES)),
+        in_progress_count=Count('id', filter=Q(status__in=IN_PROGRESS_STATUSES)),
+    )
+    if kpis['total_contract_value'] is None:
+        kpis['total_contract_value'] = 0  # Handling cases where there are no orders/contracts
+    return kpis
+
+
+def compute_dashboard_kpis():
+    kpis = compute_order_kpis()
+    kpis['total_employees'] = Employee.objects.count()
+    return kpis
+
+
+# Версии таблиц лежат в БД и меняются сигналами и bump_table_versions в той же транзакции, что и данные,
+# поэтому изменение из любого процесса меняет ключ во всех процессах. CACHES в settings.py не задан,
+# и у каждого процесса свой LocMemCache: каждый процесс пересчитывает снимок для новой версии сам
+def _cache_key():
+    return 'dashboard:kpis:' + ':'.join(str(version) for version in get_table_versions(DASHBOARD_TABLES))
+
+
+def get_dashboard_kpis():
+    key = _cache_key()
+    kpis = cache.get(key)
+    if kpis is None:
+        kpis = compute_dashboard_kpis()
+        cache.set(key, kpis, DASHBOARD_CACHE_TIMEOUT)
+    return kpis
+
+
+# Асинхронный вариант: агрегат по заказам и число сотрудников считаются одновременно
+async def aget_dashboard_kpis():
+    key = await sync_to_async(_cache_key)()
+    kpis = await cache.aget(key)
+    if kpis is None:
+        kpis, total_employees = await gather_queries(compute_order_kpis, Employee.objects.count)
+        kpis['total_employees'] = total_employees
+        await cache.aset(key, kpis, DASHBOARD_CACHE_TIMEOUT)
+    return kpis
+
+
+# Карточки дашборда: незавершённые заказы с ближайшей датой сдачи
+def get_dashboard_orders(limit=DASHBOARD_CARDS_LIMIT):
+    return (OrderListRow.objects.exclude(status__in=COMPLETED_STATUSES)
+            .order_by('completion_date', 'order_id')[:limit])
@@ -0,0 +1,162 @@
+import re
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Employee, PickupDelivery
+from .versions import bump_table_versions
+from .changelog import log_changes
+
+# Должность выездных сотрудников; другие можно передать в plan_day явно
+CREW_POSITION = 'Курьер'
+
+DAY_START = time(9)
+DAY_END = time(21)
+# Окно прибытия, если у забора или доставки указано время; без времени подходит весь рабочий день
+TIME_WINDOW = timedelta(hours=2)
+SERVICE_TIME = timedelta(minutes=30)
+# Адреса не геокодируются: переезд в пределах одной улицы считается коротким, между улицами - длинным
+SAME_ZONE_TRAVEL = timedelta(minutes=15)
+OTHER_ZONE_TRAVEL = timedelta(minutes=45)
+MAX_STOPS_PER_CREW = 12
+
+_HOUSE_PART = re.compile(r'^(д|дом|кв|корп|стр|к|г|город)\b\.?', re.IGNORECASE)
+
+
+# Улица из адреса вида "г. Санкт-Петербург, ул. Ленина, д. 5": город, дом и квартира отбрасываются
+def address_zone(address):
+    parts = [part.strip().lower() for part in (address or '').split(',')]
+    streets = [part for part in parts if part and not _HOUSE_PART.match(part)]
+    return streets[-1].replace('ё', 'е') if streets else ''
+
+
+# Точка маршрута: забор или доставка одной строки PickupDelivery с окном прибытия
+class Stop:
+    def __init__(self, row_id, kind, order_number, address, window_start, window_end):
+        self.row_id = row_id
+        self.kind = kind  # 'pickup' или 'delivery'
+        self.order_number = order_number
+        self.address = address
+        self.zone = address_zone(address)
+        self.window_start = window_start
+        self.window_end = window_end
+
+
+# Маршрут сотрудника: когда он освободится, на какой улице будет и какие точки уже взял
+class Route:
+    def __init__(self, employee_id, name, free_at):
+        self.employee_id = employee_id
+        self.name = name
+        self.free_at = free_at
+        self.zone = None
+        self.stops = []  # [(Stop, время прибытия)]
+
+
+def travel_time(from_zone, to_zone):
+    if from_zone is None:
+        return timedelta(0)  # первая точка: выезд к ней в начале дня не считается
+    return SAME_ZONE_TRAVEL if from_zone and from_zone == to_zone else OTHER_ZONE_TRAVEL
+
+
+# Жадная вставка: точки идут по возрастанию конца окна, каждая достаётся экипажу, который раньше всех
+# сможет её закончить, не нарушив окно, конец рабочего дня и MAX_STOPS_PER_CREW. При равенстве
+# выигрывает менее загруженный экипаж. O(точек x экипажей), без запросов к БД
+def assign_stops(stops, routes, day_end, capacity=MAX_STOPS_PER_CREW):
+    unassigned = []
+    for stop in sorted(stops, key=lambda stop: (stop.window_end, stop.window_start, stop.zone, stop.row_id)):
+        best, best_key = None, None
+        for route in routes:
+            if len(route.stops) >= capacity:
+                continue
+            arrival = max(route.free_at + travel_time(route.zone, stop.zone), stop.window_start)
+            finish = arrival + SERVICE_TIME
+            if arrival > stop.window_end or finish > day_end:
+                continue
+            key = (finish, len(route.stops), route.employee_id)
+            if best_key is None or key < best_key:
+                best, best_key = (route, arrival), key
+        if best is None:
+            unassigned.append(stop)
+            continue
+        route, arrival = best
+        route.stops.append((stop, arrival))
+        route.free_at, route.zone = arrival + SERVICE_TIME, stop.zone
+    return unassigned
+
+
+# ******** ПЛАН НА ДЕНЬ ********* #
+
+def _at(day, moment):
+    return datetime.combine(day, moment)
+
+
+def _window(day, planned_time):
+    if planned_time is None:
+        return _at(day, DAY_START), _at(day, DAY_END) - SERVICE_TIME
+    start = _at(day, planned_time)
+    return start, start + TIME_WINDOW
+
+
+# Незавершённые заборы курьером и доставки курьером на день - один запрос с адресами клиентов.
+# Вместе с точками возвращаются текущие ответственные строк: bulk_update пишет оба поля сразу
+def day_stops(day, lock=False):
+    rows = PickupDelivery.objects.filter(
+        Q(pickup_type='pickup', pickup_date=day, is_picked=False)
+        | Q(delivery_type='delivery', delivery_date=day, is_delivered=False)
+    ).values('pk', 'order_id', 'order__number', 'order__contract__client__address', 'pickup_type', 'pickup_date',
+             'pickup_time', 'pickup_guy_id', 'is_picked', 'delivery_type', 'delivery_date', 'delivery_time',
+             'delivery_guy_id', 'is_delivered')
+    if lock:
+        rows = rows.select_for_update(of=('self',))
+    stops, current = [], {}
+    for row in rows:
+        current[row['pk']] = {'pickup': row['pickup_guy_id'], 'delivery': row['delivery_guy_id'],
+                              'order': row['order_id']}
+        for kind, done in (('pickup', 'is_picked'), ('delivery', 'is_delivered')):
+            if row[f'{kind}_type'] == kind and row[f'{kind}_date'] == day and not row[done]:
+                stops.append(Stop(row['pk'], kind, row['order__number'], row['order__contract__client__address'] or '',
+                                  *_window(day, row[f'{kind}_time'])))
+    return stops, current
+
+
+def crew_routes(day, crew=None):
+    if crew is None:
+        crew = Employee.objects.filter(position__name=CREW_POSITION, status__in=['working', 'probation'])
+    return [Route(employee.pk, f"{employee.last_name} {employee.first_name}", _at(day, DAY_START))
+            for employee in crew.order_by('pk').only('pk', 'last_name', 'first_name')]
+
+
+# Распределяет все незавершённые заборы и доставки дня между экипажами (crew - queryset сотрудников,
+# по умолчанию работающие курьеры) и записывает назначения одним bulk_update. Точки, которые не поместились
+# ни в один маршрут, сохраняют прежнего ответственного и возвращаются в unassigned. С commit=False только
+# считает план
+def plan_day(day, crew=None, commit=True):
+    with transaction.atomic():
+        # строки дня блокируются до записи: параллельное ручное назначение не потеряется при записи плана
+        stops, current = day_stops(day, lock=commit)
+        routes = crew_routes(day, crew)
+        unassigned = assign_stops(stops, routes, _at(day, DAY_END))
+        if commit:
+            save_routes(routes, current)
+    return {'day': day, 'routes': routes, 'unassigned': unassigned}
+
+
+def save_routes(routes, current):
+    guys = {pk: dict(kinds) for pk, kinds in current.items()}
+    for route in routes:
+        for stop, _ in route.stops:
+            guys[stop.row_id][stop.kind] = route.employee_id
+    now = timezone.now()
+    rows = [PickupDelivery(pk=pk, order_id=kinds['order'], pickup_guy_id=kinds['pickup'],
+                           delivery_guy_id=kinds['delivery'], updated_at=now)
+            for pk, kinds in guys.items() if kinds != current[pk]]
+    if not rows:
+        return 0
+    # один UPDATE ... SET ... = CASE WHEN pk = ... на все строки дня (SQLite режет его на пачки по лимиту
+    # параметров); сигналы post_save не отправляются, поэтому версия таблицы и журнал изменений пишутся явно
+    PickupDelivery.objects.bulk_update(rows, ['pickup_guy', 'delivery_guy', 'updated_at'])
+    bump_table_versions(PickupDelivery)
+    log_changes(rows, 'update')
+    return len(rows)
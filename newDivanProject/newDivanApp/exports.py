@@ -0,0 +1,238 @@
+import csv
+import re
+import zipfile
+from datetime import date
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .filters import filter_employees, filter_orders, staff_filters
+from .models import Employee, Order, OrderListRow, TechnicalSpecification
+
+# Строк на одну выборку из курсора: память процесса не зависит от размера выгрузки
+EXPORT_CHUNK_SIZE = 2000
+# Сколько строк листа XLSX сжимается и отдаётся клиенту за раз
+XLSX_ROWS_PER_WRITE = 500
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+# ******** СТРОКИ ВЫГРУЗОК ********* #
+
+ORDER_EXPORT_HEADER = [
+    "Номер заказа", "Договор", "Дата договора", "Срок выполнения", "Клиент", "Телефон клиента",
+    "Стоимость заказа", "Стоимость работ", "Предоплата", "Предоплата внесена", "Остаток", "Оплата внесена",
+    "Тип мебели", "Тип работ", "Описание ТЗ", "Статус", "Статус оплаты", "Менеджер", "Исполнители",
+]
+
+ORDER_EXPORT_FIELDS = [
+    'number', 'order__contract__num', 'create_date', 'completion_date',
+    'order__contract__client__last_name', 'order__contract__client__first_name',
+    'order__contract__client__middle_name', 'order__contract__client__contact_number',
+    'total_value', 'total_work_cost', 'order__contract__prepayment_value', 'order__contract__is_prepayment_paid',
+    'order__contract__postpayment_value', 'order__contract__is_postpayment_paid',
+    'furniture_type', 'work_type', 'description', 'status', 'payment_status', 'manager', 'executors',
+]
+
+
+# Заказы с теми же фильтрами, что и таблица orders_view. Читается плоская OrderListRow плюс договор и клиент
+# одним JOIN-ом; строки идут из курсора пачками по EXPORT_CHUNK_SIZE
+def order_export_rows(params):
+    orders = filter_orders(OrderListRow.objects.all(), params).order_by('-create_date', '-order_id')
+
+    statuses = dict(Order.ORDER_STATUS)
+    payment_statuses = dict(Order.PAYMENT_STATUSES)
+    furniture_types = dict(TechnicalSpecification.FURNITURE_TYPES)
+    work_types = dict(TechnicalSpecification.WORK_TYPES)
+
+    for (number, contract_num, create_date, completion_date, last_name, first_name, middle_name, phone,
+         total_value, total_work_cost, prepayment, prepayment_paid, postpayment, postpayment_paid,
+         furniture_type, work_type, description, status, payment_status, manager, executors) in (
+            orders.values_list(*ORDER_EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)):
+        yield [
+            number, contract_num, create_date, completion_date,
+            ' '.join(part for part in (last_name, first_name, middle_name) if part), phone,
+            total_value, total_work_cost, prepayment, prepayment_paid, postpayment, postpayment_paid,
+            furniture_types.get(furniture_type, furniture_type), work_types.get(work_type, work_type), description,
+            statuses.get(status, status), payment_statuses.get(payment_status, payment_status),
+            (manager or {}).get('full_name', ''), ', '.join(executor['full_name'] for executor in executors or []),
+        ]
+
+
+STAFF_EXPORT_HEADER = [
+    "ФИО", "Должность", "Подразделение", "Статус", "Дата приема", "Дата увольнения", "Тип оплаты", "Зарплата",
+]
+
+
+# Паспортные данные и реквизиты в выгрузку не попадают
+def staff_export_rows(params):
+    employees, rank = filter_employees(Employee.objects.all(), staff_filters(params))
+    employees = employees.order_by('search_key', 'pk') if rank is None else (
+        employees.annotate(search_rank=rank).order_by('-search_rank', 'search_key', 'pk'))
+
+    statuses = dict(Employee.STATUS_CHOICES)
+    salary_types = dict(Employee.SALARY_CHOICES)
+    fields = ['last_name', 'first_name', 'middle_name', 'position__name', 'department__name', 'status',
+              'employment_date', 'termination_date', 'type_salary', 'salary']
+    for (last_name, first_name, middle_name, position, department, status, employment_date, termination_date,
+         type_salary, salary) in employees.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [
+            ' '.join(part for part in (last_name, first_name, middle_name) if part), position, department,
+            statuses.get(status, status), employment_date, termination_date,
+            salary_types.get(type_salary, type_salary), salary,
+        ]
+
+
+# ******** ФОРМАТЫ ********* #
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return "Да" if value else "Нет"
+    if isinstance(value, date):
+        return value.strftime('%d.%m.%Y')
+    return str(value)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+# CSV для Excel с русской локалью: BOM, разделитель ";" и десятичная запятая
+def csv_stream(header, rows):
+    writer = csv.writer(_Echo(), delimiter=';')
+    yield '\ufeff' + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([
+            str(value).replace('.', ',') if isinstance(value, Decimal) else _text(value) for value in row
+        ])
+
+
+# Символы, которые запрещены в XML 1.0 и ломают файл при открытии
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+
+
+def _xlsx_cell(value):
+    if isinstance(value, (int, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_INVALID.sub('', _text(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(row):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>'
+
+
+# Пишет ZIP в поток: ZipFile без seek() дописывает размеры файлов после их данных
+class _ZipStream:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+# Минимальная книга XLSX из одного листа. Строки записываются как встроенные строки (без общей таблицы
+# строк), поэтому лист формируется и сжимается по ходу чтения курсора, а не собирается в памяти целиком
+def xlsx_stream(header, rows, sheet_name):
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml', _XLSX_WORKBOOK.format(escape(sheet_name, {'"': '&quot;'})))
+        yield stream.pop()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                         '<sheetData>' + _xlsx_row(header)).encode())
+            batch = []
+            for row in rows:
+                batch.append(_xlsx_row(row))
+                if len(batch) >= XLSX_ROWS_PER_WRITE:
+                    sheet.write(''.join(batch).encode())
+                    batch.clear()
+                    data = stream.pop()
+                    if data:
+                        yield data
+            sheet.write((''.join(batch) + '</sheetData></worksheet>').encode())
+    yield stream.pop()
+
+
+def export_stream(header, rows, fmt, sheet_name):
+    if fmt == 'xlsx':
+        return xlsx_stream(header, rows, sheet_name)
+    return (chunk.encode('utf-8') for chunk in csv_stream(header, rows))
+
+
+def export_response(header, rows, fmt, name, sheet_name):
+    response = StreamingHttpResponse(export_stream(header, rows, fmt, sheet_name), content_type=EXPORT_FORMATS[fmt])
+    filename = f"{name}_{timezone.localdate():%Y-%m-%d}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# Запись выгрузки в файл для команд export_orders и export_staff; возвращает число строк
+def write_export(path, header, rows, fmt, sheet_name):
+    counter = {'rows': 0}
+
+    def counted(rows):
+        for row in rows:
+            counter['rows'] += 1
+            yield row
+
+    with open(path, 'wb') as file:
+        for chunk in export_stream(header, counted(rows), fmt, sheet_name):
+            file.write(chunk)
+    return counter['rows']
@@ -0,0 +1,53 @@
+from .models import OrderExecutor
+from .search import order_search_filter, search_employees
+
+# Фильтры списков заказов и сотрудников. Общие для AJAX-таблиц, выгрузок и команд export_*,
+# поэтому параметры принимаются словарём (request.GET или опции команды)
+
+
+def filter_orders(orders, params):
+    # Поиск по номеру, описанию ТЗ, клиенту и телефону через поисковый индекс (см. search.py)
+    if params.get('search_query'):
+        orders = orders.filter(order_search_filter(params['search_query']))
+
+    # Фильтрация по статусу заказа
+    if params.get('status'):
+        orders = orders.filter(status=params['status'])
+
+    # Фильтрация по типу мебели
+    if params.get('type'):
+        orders = orders.filter(furniture_type=params['type'])
+
+    # Фильтрация по статусу оплаты
+    if params.get('payment_status'):
+        orders = orders.filter(payment_status=params['payment_status'])
+
+    # Заказы исполнителя - поиск по индексу (employee, order) таблицы OrderExecutor
+    if str(params.get('executor') or '').isdigit():
+        orders = orders.filter(order_id__in=OrderExecutor.objects.filter(employee_id=params['executor'])
+                               .values('order_id'))
+
+    if params.get('start_date') and params.get('end_date'):
+        orders = orders.filter(create_date__range=[params['start_date'], params['end_date']])
+    return orders
+
+
+STAFF_FILTERS = ['search_name', 'status', 'department', 'payment_type']
+
+
+# Непустые фильтры списка сотрудников из GET-параметров; они же - ключ кеша для числа строк
+def staff_filters(params):
+    return {name: params[name].strip() for name in STAFF_FILTERS if (params.get(name) or '').strip()}
+
+
+def filter_employees(employees, filters):
+    rank = None
+    if 'search_name' in filters:
+        employees, rank = search_employees(employees, filters['search_name'])
+    if 'status' in filters:
+        employees = employees.filter(status=filters['status'])
+    if 'department' in filters:
+        employees = employees.filter(department_id=filters['department'])
+    if 'payment_type' in filters:
+        employees = employees.filter(type_salary=filters['payment_type'])
+    return employees, rank
@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import render_to_string
+
+from .access import MANAGER_ACCESS_LVL
+from .board import board_cards, clock_color
+from .changelog import changes_since
+from .concurrency import gather_queries
+from .models import ChangeLogEntry, Order
+from .read_models import build_order_rows, format_orders_data
+
+logger = logging.getLogger('newDivanApp.live_updates')
+
+# Журнал изменений опрашивается одной задачей на процесс, сколько бы вкладок ни было открыто
+POLL_INTERVAL = 1
+# Сколько последних пачек хранится для переподключения по Last-Event-ID
+HISTORY_SIZE = 100
+# Клиент, который не успевает забирать сообщения, отключается и получает reset
+CLIENT_QUEUE_SIZE = 50
+# Комментарий раз в HEARTBEAT секунд не даёт прокси закрыть молчащее соединение
+HEARTBEAT = 15
+# Django 4.2 не замечает отключения клиента посреди потока, поэтому поток закрывается сам, а EventSource
+# переподключается с Last-Event-ID и получает пропущенное из истории
+STREAM_LIFETIME = 300
+RETRY_MS = 3000
+# Больше страниц журнала за один опрос не читается: остальное уйдёт следующим опросом
+MAX_PAGES_PER_POLL = 10
+
+# Бэклог на доске видят только руководители (см. active.html)
+BACKLOG_ACCESS_LVL = 4
+
+# Изменения этих моделей меняют строку в списке заказов
+ORDER_ROW_MODELS = {'Order', 'OrderExecutor', 'Contract', 'TechnicalSpecification'}
+# Если объект за пачку и создан, и изменён, и удалён, побеждает последнее по важности действие
+ACTION_PRIORITY = ['update', 'create', 'delete']
+
+RESET = 'event: reset\ndata: {}\n\n'
+
+
+def sse_message(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event}', f'data: {json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+def _actions(changes, model):
+    actions = {}
+    for change in changes:
+        if change['model'] != model:
+            continue
+        previous = actions.get(change['object_id'], change['action'])
+        actions[change['object_id']] = max(previous, change['action'], key=ACTION_PRIORITY.index)
+    return actions
+
+
+# ******** ДЕЛЬТЫ ********* #
+
+# Строки таблицы заказов для заказов, затронутых изменениями, - те же данные, что отдаёт orders_view.
+# Строки строятся по исходным таблицам: OrderListRow пересчитывается после коммита и может ещё не успеть
+def order_deltas(changes):
+    actions = _actions(changes, 'Order')
+    order_ids = set(actions)
+    order_ids.update(change['order_id'] for change in changes
+                     if change['model'] in ORDER_ROW_MODELS and change['order_id'])
+    contract_ids = {change['object_id'] for change in changes if change['model'] == 'Contract'}
+    if contract_ids:
+        order_ids.update(Order.objects.filter(contract_id__in=contract_ids).values_list('pk', flat=True))
+    if not order_ids:
+        return []
+
+    rows = build_order_rows(order_ids)
+    found = {row.order_id: data for row, data in zip(rows, format_orders_data(rows))}
+    deltas = []
+    for order_id in sorted(order_ids):
+        if order_id not in found:
+            deltas.append({'id': order_id, 'action': 'delete'})
+        else:
+            action = 'create' if actions.get(order_id) == 'create' else 'update'
+            deltas.append({'id': order_id, 'action': action, 'row': found[order_id]})
+    return deltas
+
+
+# Карточки доски: куда переместить (колонка и готовая разметка activity_cards.html) или что убрать
+def activity_deltas(changes):
+    actions = _actions(changes, 'Activity')
+    if not actions:
+        return []
+    cards = board_cards([pk for pk, action in actions.items() if action != 'delete'])
+    deltas = []
+    for pk in sorted(actions):
+        if pk not in cards:
+            deltas.append({'id': pk, 'action': 'delete'})
+            continue
+        column, card = cards[pk]
+        html = render_to_string('activity_cards.html', {'activities': [card], 'clock_color': clock_color(column)})
+        deltas.append({'id': pk, 'action': actions[pk], 'column': column, 'html': html})
+    return deltas
+
+
+def _without_backlog(deltas):
+    return [{'id': delta['id'], 'action': 'delete'} if delta.get('column') == 'backlog' else delta
+            for delta in deltas]
+
+
+# Пачка сообщений по одной странице журнала. Сообщения сериализуются один раз на пачку,
+# клиенты получают одни и те же строки
+def build_batch(page):
+    cursor = page['next_cursor']
+    orders = order_deltas(page['changes'])
+    activities = activity_deltas(page['changes'])
+    public = _without_backlog(activities)
+    return {
+        'cursor': cursor,
+        'orders': sse_message('orders', {'changes': orders}, cursor) if orders else None,
+        'activities': sse_message('activities', {'changes': activities}, cursor) if activities else None,
+        'activities_public': sse_message('activities', {'changes': public}, cursor) if public else None,
+    }
+
+
+def collect_batches(cursor):
+    batches = []
+    for _ in range(MAX_PAGES_PER_POLL):
+        page = changes_since(cursor)
+        if not page['changes']:
+            break
+        batches.append(build_batch(page))
+        cursor = page['next_cursor']
+        if not page['has_more']:
+            break
+    return batches
+
+
+def latest_change_id():
+    return ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+# ******** РАССЫЛКА ********* #
+
+class Client:
+    def __init__(self, access_lvl):
+        self.access_lvl = access_lvl
+        self.queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+
+    def messages(self, batch):
+        messages = []
+        if self.access_lvl >= MANAGER_ACCESS_LVL and batch['orders']:
+            messages.append(batch['orders'])
+        activities = batch['activities'] if self.access_lvl >= BACKLOG_ACCESS_LVL else batch['activities_public']
+        if activities:
+            messages.append(activities)
+        return messages
+
+    # False - очередь переполнена, клиента пора отключать
+    def send(self, batch):
+        try:
+            for message in self.messages(batch):
+                self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def reset(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESET)
+
+
+# Общая для процесса рассылка: пока подключён хотя бы один клиент, задача раз в interval читает журнал
+# изменений с курсора, строит пачку дельт и раскладывает её по очередям клиентов. Число запросов зависит
+# от числа изменений, а не от числа клиентов. Без клиентов задача завершается и базу не опрашивает
+class Broadcaster:
+    def __init__(self, interval=POLL_INTERVAL, history_size=HISTORY_SIZE):
+        self.interval = interval
+        self.clients = set()
+        self.history = deque(maxlen=history_size)
+        self.history_start = 0  # курсор, с которого история полна
+        self.cursor = 0
+        self.task = None
+
+    def running(self):
+        return (self.task is not None and not self.task.done()
+                and self.task.get_loop() is asyncio.get_running_loop())
+
+    async def _start(self):
+        cursor = await sync_to_async(latest_change_id)()
+        if self.running():  # пока шёл запрос, задачу мог запустить другой клиент
+            return
+        # клиенты остановленной задачи или чужого цикла событий больше ничего не получат
+        for client in self.clients:
+            client.reset()
+        self.clients.clear()
+        self.history.clear()
+        self.cursor = self.history_start = cursor
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def subscribe(self, access_lvl, last_event_id=None):
+        if not self.running():
+            await self._start()
+        client = Client(access_lvl)
+        if last_event_id is not None:
+            # пропущенное восстанавливается из истории; если её не хватает - клиент перечитывает всё сам
+            if self.history_start <= last_event_id <= self.cursor:
+                for batch in self.history:
+                    if batch['cursor'] > last_event_id:
+                        client.send(batch)
+            else:
+                client.reset()
+        self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        self.clients.discard(client)
+
+    def publish(self, batch):
+        if len(self.history) == self.history.maxlen:
+            self.history_start = self.history[0]['cursor']
+        self.history.append(batch)
+        self.cursor = batch['cursor']
+        for client in list(self.clients):
+            if not client.send(batch):
+                client.reset()
+                self.clients.discard(client)
+
+    async def poll(self):
+        # в отдельном потоке со своим соединением, если СУБД это позволяет (см. concurrency.py)
+        [batches] = await gather_queries(lambda: collect_batches(self.cursor))
+        for batch in batches:
+            self.publish(batch)
+
+    async def _run(self):
+        while self.clients:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Ошибка при чтении журнала изменений")
+
+    # Поток сообщений одного клиента для StreamingHttpResponse
+    async def stream(self, access_lvl, last_event_id=None):
+        client = await self.subscribe(access_lvl, last_event_id)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + STREAM_LIFETIME
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            while True:
+                timeout = min(HEARTBEAT, deadline - loop.time())
+                if timeout <= 0:
+                    break
+                try:
+                    message = await asyncio.wait_for(client.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                yield message
+                if message is RESET:
+                    break
+        finally:
+            self.unsubscribe(client)
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from newDivanApp.concurrency import concurrency_enabled
+from newDivanApp.management.commands.benchmark_views import git_revision, percentile
+from newDivanApp.models import Order
+
+# (название, имя маршрута, GET-параметры, AJAX-запрос); 'order_numbers' - пакет случайных номеров
+SCENARIOS = [
+    ('orders_list', 'orders', {'page_size': 50}, True),
+    ('orders_filtered', 'orders', {'status': 'in_progress', 'type': 'soft'}, True),
+    ('staff_list', 'staff', None, True),
+    ('order_data', 'get_order_data', 'order_numbers', True),
+    ('dashboard_kpis', 'dashboard_kpis', None, True),
+]
+ORDER_DATA_BATCH = 20
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает пропускную способность JSON-эндпоинтов под WSGI (потоки) и ASGI (одна петля событий) "
+            "при одинаковом числе одновременных клиентов. Запросы идут в обработчики Django внутри процесса, "
+            "без сети, поэтому разница показывает именно стоимость синхронной и асинхронной обработки")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help="Пользователь, под которым открываются страницы")
+        parser.add_argument('--requests', type=int, default=200, help="Запросов на сценарий и обработчик")
+        parser.add_argument('--concurrency', type=int, default=10, help="Одновременных клиентов")
+        parser.add_argument('--only', nargs='*', help="Запустить только перечисленные сценарии")
+        parser.add_argument('--output', help="Сохранить результаты в JSON-файл")
+
+    def handle(self, *args, **options):
+        try:
+            self.user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['username']} не найден")
+
+        self.order_numbers = list(Order.objects.order_by('?').values_list('number', flat=True)[:ORDER_DATA_BATCH * 10])
+        connections.close_all()
+
+        results = {}
+        # AsyncClient всегда шлёт Host: testserver, как и тестовый клиент под manage.py test
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, url_name, params, ajax in SCENARIOS:
+                if options['only'] and name not in options['only']:
+                    continue
+                requests = self.build_requests(reverse(url_name), params, options['requests'])
+                headers = {'X-Requested-With': 'XMLHttpRequest'} if ajax else {}
+                results[name] = {
+                    'wsgi': self.run_wsgi(requests, headers, options['concurrency']),
+                    'asgi': asyncio.run(self.run_asgi(requests, headers, options['concurrency'])),
+                }
+                self.print_result(name, results[name])
+
+        if options['output']:
+            report = {
+                'revision': git_revision(),
+                'time': datetime.now(timezone.utc).isoformat(),
+                'vendor': connection.vendor,
+                'concurrent_queries': concurrency_enabled(),
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    def build_requests(self, url, params, count):
+        requests = []
+        for i in range(count):
+            data = params
+            if params == 'order_numbers':
+                start = i * ORDER_DATA_BATCH % max(len(self.order_numbers), 1)
+                data = {'order_numbers': ','.join(self.order_numbers[start:start + ORDER_DATA_BATCH])}
+            requests.append((url, data))
+        return requests
+
+    def make_client(self, client_class):
+        client = client_class()
+        client.force_login(self.user)
+        return client
+
+    # Каждый клиент работает в своём потоке и отправляет запросы друг за другом, как поток WSGI-сервера
+    def run_wsgi(self, requests, headers, concurrency):
+        clients = [self.make_client(Client) for _ in range(concurrency)]
+        latencies, statuses = [], set()
+
+        def worker(client, chunk):
+            try:
+                for url, data in chunk:
+                    start = time.perf_counter()
+                    response = client.get(url, data, headers=headers)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    statuses.add(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(client, requests[i::concurrency]))
+                   for i, client in enumerate(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.summary(latencies, statuses, time.perf_counter() - start)
+
+    # Те же клиенты, но корутинами в одной петле событий, как под ASGI-сервером
+    async def run_asgi(self, requests, headers, concurrency):
+        # force_login пишет сессию синхронно, поэтому клиенты готовятся вне петли событий
+        clients = [await sync_to_async(self.make_client)(AsyncClient) for _ in range(concurrency)]
+        latencies, statuses = [], set()
+
+        async def worker(client, chunk):
+            for url, data in chunk:
+                start = time.perf_counter()
+                response = await client.get(url, data, headers=headers)
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses.add(response.status_code)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client, requests[i::concurrency]) for i, client in enumerate(clients)))
+        return self.summary(latencies, statuses, time.perf_counter() - start)
+
+    def summary(self, latencies, statuses, elapsed):
+        return {
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'statuses': sorted(statuses),
+        }
+
+    def print_result(self, name, result):
+        for handler in ('wsgi', 'asgi'):
+            line = result[handler]
+            self.stdout.write(
+                f"{name:<16} {handler}  {line['rps']:>8} запр/с  p50 {line['p50_ms']:>8} мс  "
+                f"p95 {line['p95_ms']:>8} мс  статусы {line['statuses']}"
+            )
@@ -0,0 +1,90 @@
+import json
+import random
+import time
+from datetime import date, datetime, time as day_time, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from newDivanApp.dispatch import DAY_END, DAY_START, Route, Stop, _at, _window, assign_stops, plan_day
+from newDivanApp.management.commands.benchmark_views import git_revision, percentile
+from newDivanApp.synthetic import STREETS
+
+
+class Command(BaseCommand):
+    help = ("Замеряет время планирования дня диспетчером: на сгенерированных в памяти точках "
+            "и, с --date, на реальном дне из базы без записи назначений")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stops', type=int, default=300, help="Точек за день")
+        parser.add_argument('--crews', type=int, default=30, help="Выездных сотрудников")
+        parser.add_argument('--repeat', type=int, default=20, help="Сколько раз планировать")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--date', help="ГГГГ-ММ-ДД: дополнительно спланировать этот день из базы (без записи)")
+        parser.add_argument('--output', help="Сохранить результаты в JSON-файл")
+
+    def handle(self, *args, **options):
+        day = date.today()
+        stops = self.generated_stops(day, options)
+        results = {'generated': self.measure(lambda: self.generated_day(day, stops, options['crews']),
+                                             options['repeat'])}
+        if options['date']:
+            try:
+                real_day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError(f"Неверная дата: {options['date']}")
+            results['database'] = self.measure(lambda: self.database_day(real_day), options['repeat'])
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<10} точек {result['stops']:>5}  распределено {result['assigned']:>5}  "
+                f"p50 {result['p50_ms']:>8} мс  p95 {result['p95_ms']:>8} мс  макс {result['max_ms']:>8} мс"
+            )
+
+        if options['output']:
+            report = {
+                'revision': git_revision(),
+                'time': datetime.now(timezone.utc).isoformat(),
+                'stops': options['stops'],
+                'crews': options['crews'],
+                'repeat': options['repeat'],
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    # Заказы на одной из STREETS; у половины точек указано время, остальные - в любое время дня
+    def generated_stops(self, day, options):
+        rng = random.Random(options['seed'])
+        stops = []
+        for i in range(options['stops']):
+            planned = day_time(rng.randint(9, 18), rng.choice([0, 30])) if rng.random() < 0.5 else None
+            stops.append(Stop(i, rng.choice(['pickup', 'delivery']), f"НД-{i}",
+                              f"г. Санкт-Петербург, ул. {rng.choice(STREETS)}, д. {rng.randint(1, 120)}",
+                              *_window(day, planned)))
+        return stops
+
+    # замеряется только распределение: маршруты каждый раз новые, точки общие
+    def generated_day(self, day, stops, crews):
+        routes = [Route(i, f"Курьер {i}", _at(day, DAY_START)) for i in range(crews)]
+        unassigned = assign_stops(stops, routes, _at(day, DAY_END))
+        return len(stops), len(stops) - len(unassigned)
+
+    # вместе с запросом точек и сотрудников
+    def database_day(self, day):
+        plan = plan_day(day, commit=False)
+        assigned = sum(len(route.stops) for route in plan['routes'])
+        return assigned + len(plan['unassigned']), assigned
+
+    def measure(self, run, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            stops, assigned = run()
+            timings.append((time.perf_counter() - start) * 1000)
+        return {
+            'stops': stops,
+            'assigned': assigned,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'max_ms': round(max(timings), 2),
+        }
@@ -0,0 +1,154 @@
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from newDivanApp.models import Order
+from newDivanApp.querybudget import QueryRecorder
+
+# (название, имя маршрута, GET-параметры, AJAX-запрос)
+SCENARIOS = [
+    ('main', 'main', None, False),
+    ('orders_page', 'orders', None, False),
+    ('orders_list', 'orders', {'page_size': 50}, True),
+    ('orders_sorted', 'orders', {'sort': 'total_value', 'direction': 'desc'}, True),
+    ('orders_filtered', 'orders', {'status': 'in_progress', 'type': 'soft'}, True),
+    ('orders_search', 'orders', {'search_query': 'диван'}, True),
+    ('active', 'active', None, False),
+    ('staff_page', 'staff', None, False),
+    ('staff_list', 'staff', None, True),
+    ('staff_search', 'staff', {'search_name': 'иванов'}, True),
+    ('order_data', 'get_order_data', 'order_number', True),
+    ('calendar_month', 'calendar_events', None, True),
+]
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(share * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Замеряет задержку (p50/p95/p99), число запросов к БД и пиковую память основных страниц. "
+            "Данные для замеров создаются командой generate_data")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help="Пользователь, под которым открываются страницы")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--memory-iterations', type=int, default=3,
+                            help="Сколько запросов повторить под tracemalloc для замера памяти и числа запросов к БД")
+        parser.add_argument('--only', nargs='*', help="Запустить только перечисленные сценарии")
+        parser.add_argument('--host', default='localhost', help="Значение заголовка Host (должно быть в ALLOWED_HOSTS)")
+        parser.add_argument('--output', help="Сохранить результаты в JSON-файл")
+        parser.add_argument('--compare', help="JSON-файл предыдущего прогона для сравнения")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['username']} не найден")
+
+        client = Client(HTTP_HOST=options['host'])
+        client.force_login(user)
+        order_numbers = list(Order.objects.order_by('?').values_list('number', flat=True)[:options['iterations']])
+
+        results = {}
+        for name, url_name, params, ajax in SCENARIOS:
+            if options['only'] and name not in options['only']:
+                continue
+            results[name] = self.run_scenario(client, url_name, params, ajax, order_numbers, options)
+            self.print_result(name, results[name])
+
+        report = {
+            'revision': git_revision(),
+            'time': datetime.now(timezone.utc).isoformat(),
+            'vendor': connection.vendor,
+            'orders': Order.objects.count(),
+            'iterations': options['iterations'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def run_scenario(self, client, url_name, params, ajax, order_numbers, options):
+        headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if ajax else {}
+        url = reverse(url_name)
+        latencies, queries, peaks, statuses = [], [], [], set()
+
+        def request_data(i):
+            if params == 'order_number':
+                return {'order_number': order_numbers[i % len(order_numbers)]} if order_numbers else {}
+            return params
+
+        # tracemalloc и запись запросов замедляют обработку, поэтому задержка замеряется отдельным
+        # проходом без них, а память и число запросов - следующим
+        for i in range(options['warmup'] + options['iterations']):
+            start = time.perf_counter()
+            response = client.get(url, request_data(i), **headers)
+            elapsed = time.perf_counter() - start
+            if i < options['warmup']:
+                continue
+            latencies.append(elapsed * 1000)
+            statuses.add(response.status_code)
+
+        for i in range(max(1, options['memory_iterations'])):
+            recorder = QueryRecorder()
+            tracemalloc.start()
+            with connection.execute_wrapper(recorder):
+                response = client.get(url, request_data(i), **headers)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            queries.append(recorder.count)
+            peaks.append(peak / 1024)
+            statuses.add(response.status_code)
+
+        return {
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'mean_ms': round(statistics.mean(latencies), 2),
+            'queries': max(queries),
+            'peak_kb': round(max(peaks), 1),
+            'statuses': sorted(statuses),
+        }
+
+    def print_result(self, name, result):
+        self.stdout.write(
+            f"{name:<16} p50 {result['p50_ms']:>8} мс  p95 {result['p95_ms']:>8} мс  p99 {result['p99_ms']:>8} мс  "
+            f"запросов {result['queries']:>3}  память {result['peak_kb']:>8} КБ  статусы {result['statuses']}"
+        )
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        self.stdout.write(f"\nСравнение с {path} (ревизия {baseline.get('revision')}):")
+        for name, result in results.items():
+            before = baseline['results'].get(name)
+            if not before:
+                continue
+            change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            line = (f"{name:<16} p95 {before['p95_ms']} -> {result['p95_ms']} мс ({change:+.1f}%)  "
+                    f"запросов {before['queries']} -> {result['queries']}  "
+                    f"память {before['peak_kb']} -> {result['peak_kb']} КБ")
+            self.stdout.write(self.style.ERROR(line) if change > 10 else line)
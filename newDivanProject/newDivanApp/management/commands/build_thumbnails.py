@@ -0,0 +1,34 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from newDivanApp.read_models import rebuild_order_rows
+from newDivanApp.thumbnails import IMAGE_FIELDS, generate_thumbnails, thumbnails_exist
+
+
+class Command(BaseCommand):
+    help = "Строит миниатюры для уже загруженных аватаров и фотографий"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Перестроить и уже существующие миниатюры")
+
+    def handle(self, *args, **options):
+        created = 0
+        for model_name, field_names in IMAGE_FIELDS.items():
+            model = apps.get_model('newDivanApp', model_name)
+            has_image = Q()
+            for field_name in field_names:
+                has_image |= Q(**{f'{field_name}__gt': ''})
+            for instance in model.objects.filter(has_image).only(*field_names).iterator(chunk_size=500):
+                for field_name in field_names:
+                    fieldfile = getattr(instance, field_name)
+                    if not fieldfile:
+                        continue
+                    if not options['force'] and thumbnails_exist(fieldfile.name):
+                        continue
+                    created += generate_thumbnails(fieldfile, force=True)
+            self.stdout.write(f"{model_name}: готово")
+
+        # адреса миниатюр хранятся в строках списка заказов
+        rebuild_order_rows()
+        self.stdout.write(self.style.SUCCESS(f"Создано миниатюр: {created}"))
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from newDivanApp.payroll import close_payroll
+
+
+def _date(value, fmt):
+    try:
+        return datetime.strptime(value, fmt).date()
+    except ValueError:
+        raise CommandError(f"Неверная дата: {value}")
+
+
+class Command(BaseCommand):
+    help = ("Закрывает зарплатную ведомость за месяц: оклады и сдельная оплата за выполненные активности. "
+            "Включённые активности отмечаются оплаченными")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', required=True, help="ГГГГ-ММ")
+        parser.add_argument('--payment-date', help="ГГГГ-ММ-ДД, по умолчанию сегодня")
+
+    def handle(self, *args, **options):
+        month = _date(options['month'], '%Y-%m')
+        payment_date = _date(options['payment_date'], '%Y-%m-%d') if options['payment_date'] else None
+        try:
+            period = close_payroll(month, payment_date)
+        except ValidationError as error:
+            raise CommandError(error.messages[0])
+        entries = period.entries.count()
+        self.stdout.write(self.style.SUCCESS(f"{period}: сотрудников {entries}"))
@@ -0,0 +1,51 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from newDivanApp.blobs import add_references
+from newDivanApp.changelog import log_changes
+from newDivanApp.read_models import rebuild_order_rows
+from newDivanApp.storage import is_blob_name, media_storage
+from newDivanApp.thumbnails import IMAGE_FIELDS, build_thumbnails
+from newDivanApp.versions import bump_table_versions
+
+
+class Command(BaseCommand):
+    help = ("Переносит загруженные ранее изображения в хранилище по содержимому (blobs/): "
+            "одинаковые файлы схлопываются в один, ссылки на него считаются в MediaBlob")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete-originals', action='store_true',
+                            help="Удалить старые файлы после переноса")
+
+    def handle(self, *args, **options):
+        moved = {}
+        for model_name, field_names in IMAGE_FIELDS.items():
+            model = apps.get_model('newDivanApp', model_name)
+            for field_name in field_names:
+                rows = model.objects.exclude(**{f'{field_name}__isnull': True}).exclude(**{field_name: ''})
+                for pk, name in rows.values_list('pk', field_name).iterator(chunk_size=500):
+                    if is_blob_name(name):
+                        continue
+                    if name not in moved:
+                        if not media_storage.exists(name):
+                            self.stderr.write(f"Файл не найден: {name}")
+                            continue
+                        with media_storage.open(name, 'rb') as file:
+                            moved[name] = media_storage.save(name, file)
+                    # update() не отправляет сигналы, поэтому ссылка и журнал изменений учитываются явно
+                    with transaction.atomic():
+                        model.objects.filter(pk=pk).update(**{field_name: moved[name]})
+                        add_references([moved[name]])
+                        bump_table_versions(model)
+                        log_changes(model.objects.filter(pk=pk), 'update')
+            self.stdout.write(f"{model_name}: готово")
+
+        blobs = set(moved.values())
+        for blob_name in blobs:
+            build_thumbnails(media_storage, blob_name)
+        if options['delete_originals']:
+            for name in moved:
+                media_storage.delete(name)
+        rebuild_order_rows()
+        self.stdout.write(self.style.SUCCESS(f"Перенесено файлов: {len(moved)}, уникальных: {len(blobs)}"))
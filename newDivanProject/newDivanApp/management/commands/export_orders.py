@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from newDivanApp.exports import EXPORT_FORMATS, ORDER_EXPORT_HEADER, order_export_rows, write_export
+
+
+class Command(BaseCommand):
+    help = "Выгружает заказы в CSV или XLSX с теми же фильтрами, что и таблица заказов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', required=True, help="Путь к файлу выгрузки")
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--search', dest='search_query', default='')
+        parser.add_argument('--status', default='')
+        parser.add_argument('--type', default='', help="Тип мебели")
+        parser.add_argument('--payment-status', default='')
+        parser.add_argument('--executor', default='', help="id сотрудника-исполнителя")
+        parser.add_argument('--start-date', default='', help="ГГГГ-ММ-ДД, вместе с --end-date")
+        parser.add_argument('--end-date', default='')
+
+    def handle(self, *args, **options):
+        count = write_export(options['output'], ORDER_EXPORT_HEADER, order_export_rows(options),
+                             options['format'], "Заказы")
+        self.stdout.write(self.style.SUCCESS(f"Выгружено заказов: {count} -> {options['output']}"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from newDivanApp.exports import EXPORT_FORMATS, STAFF_EXPORT_HEADER, staff_export_rows, write_export
+
+
+class Command(BaseCommand):
+    help = "Выгружает сотрудников в CSV или XLSX с теми же фильтрами, что и список сотрудников"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', required=True, help="Путь к файлу выгрузки")
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--search', dest='search_name', default='', help="Поиск по ФИО")
+        parser.add_argument('--status', default='')
+        parser.add_argument('--department', default='', help="id подразделения")
+        parser.add_argument('--payment-type', default='')
+
+    def handle(self, *args, **options):
+        count = write_export(options['output'], STAFF_EXPORT_HEADER, staff_export_rows(options),
+                             options['format'], "Сотрудники")
+        self.stdout.write(self.style.SUCCESS(f"Выгружено сотрудников: {count} -> {options['output']}"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from newDivanApp.synthetic import SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    help = "Заполняет базу синтетическими заказами, сотрудниками и клиентами для нагрузочных замеров"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0, help="Зерно генератора: одинаковое зерно даёт одинаковые данные")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--username', help="Создать пользователя-менеджера для входа в систему")
+        parser.add_argument('--password', default='benchmark')
+
+    def handle(self, *args, **options):
+        generator = SyntheticDataGenerator(
+            options['orders'], seed=options['seed'], batch_size=options['batch_size'],
+            username=options['username'], password=options['password'], stdout=self.stdout,
+        )
+        generator.generate()
+        self.stdout.write(self.style.SUCCESS(f"Создано заказов: {options['orders']}"))
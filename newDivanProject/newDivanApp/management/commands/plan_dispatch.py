@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from newDivanApp.dispatch import plan_day
+from newDivanApp.models import Employee
+
+
+class Command(BaseCommand):
+    help = ("Распределяет заборы и доставки курьером на день между выездными сотрудниками "
+            "и записывает ответственных")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', required=True, help="ГГГГ-ММ-ДД")
+        parser.add_argument('--crew', type=int, nargs='*', help="id сотрудников; по умолчанию работающие курьеры")
+        parser.add_argument('--dry-run', action='store_true', help="Показать план, ничего не записывая")
+
+    def handle(self, *args, **options):
+        try:
+            day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"Неверная дата: {options['date']}")
+        crew = Employee.objects.filter(pk__in=options['crew']) if options['crew'] else None
+
+        plan = plan_day(day, crew, commit=not options['dry_run'])
+        if not plan['routes']:
+            raise CommandError("Нет сотрудников для выезда")
+        for route in plan['routes']:
+            self.stdout.write(f"{route.name}: точек {len(route.stops)}")
+            for stop, arrival in route.stops:
+                kind = "забор" if stop.kind == 'pickup' else "доставка"
+                self.stdout.write(f"  {arrival:%H:%M}  {kind:<8} {stop.order_number:<12} {stop.address}")
+        for stop in plan['unassigned']:
+            self.stdout.write(self.style.WARNING(
+                f"Не распределено: {stop.order_number} ({stop.kind}), окно {stop.window_start:%H:%M}-"
+                f"{stop.window_end:%H:%M}"))
+        planned = sum(len(route.stops) for route in plan['routes'])
+        self.stdout.write(self.style.SUCCESS(f"Распределено точек: {planned}, без маршрута: {len(plan['unassigned'])}"))
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from newDivanApp.changelog import prune_change_log
+
+
+class Command(BaseCommand):
+    help = ("Удаляет старые записи журнала изменений. Потребитель, отставший дольше срока хранения, "
+            "должен перечитать данные целиком и продолжить с последнего курсора")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help="Сколько дней хранить записи")
+
+    def handle(self, *args, **options):
+        count = prune_change_log(timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f"Удалено записей журнала: {count}"))
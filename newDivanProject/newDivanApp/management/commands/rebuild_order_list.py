@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from newDivanApp.read_models import rebuild_order_rows
+
+
+class Command(BaseCommand):
+    help = "Полностью пересобирает таблицу OrderListRow по данным заказов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rebuild_order_rows(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Пересобрано строк: {count}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from newDivanApp.reports import rebuild_revenue_rollup
+
+
+class Command(BaseCommand):
+    help = "Полностью пересчитывает сводку выручки RevenueRollup по договорам, заказам и ТЗ"
+
+    def handle(self, *args, **options):
+        count = rebuild_revenue_rollup()
+        self.stdout.write(self.style.SUCCESS(f"Строк сводки: {count}"))
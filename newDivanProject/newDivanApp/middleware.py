@@ -0,0 +1,63 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils.functional import SimpleLazyObject
+
+from .access import get_current_employee
+from .querybudget import (QueryBudgetExceeded, QueryRecorder, budget_for, check_budget, configure_report,
+                          get_budget_config, logger, write_report)
+
+
+# Считает запросы к БД по каждому HTTP-запросу и сверяет их с бюджетом представления.
+# Включается настройкой QUERY_BUDGET['ENABLED'], в том числе на продакшене.
+# Только синхронный: execute_wrapper видит соединение своего потока, поэтому при включённом учёте
+# async-представления выполняются через async_to_sync. Запросы, которые gather_queries выполняет
+# параллельно в других потоках, в учёт не попадают
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_budget_config()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        configure_report(self.config)
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.view_name if match else request.path
+        budget = budget_for(url_name, self.config)
+        violations = check_budget(recorder, budget)
+        write_report(url_name, request.path, recorder, budget, violations)
+
+        if violations:
+            message = f"Превышен бюджет запросов для {url_name}: " + '; '.join(violations)
+            if self.config['RAISE']:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+# request.employee - сотрудник текущего пользователя с должностью и отделом (см. access.py).
+# Объект ленивый: запросы, которым сотрудник не нужен, не обращаются ни к кешу, ни к БД
+# Работает и в синхронной, и в асинхронной цепочке, чтобы async-представления под ASGI не переключали поток
+class CurrentEmployeeMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.employee = SimpleLazyObject(lambda: get_current_employee(request.user))
+        if self.is_async:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
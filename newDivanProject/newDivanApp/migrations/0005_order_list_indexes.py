@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('newDivanApp', '0004_delete_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='payment_type',
+            field=models.CharField(choices=[('cash', 'Наличные'), ('card', 'По карте'), ('transaction', 'Переводом')], default='cash', max_length=100, verbose_name='Способ оплаты'),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='user',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AlterField(
+            model_name='contract',
+            name='completion_date',
+            field=models.DateField(db_index=True, verbose_name='Ориентировочная дата выполнения'),
+        ),
+        migrations.AlterField(
+            model_name='contract',
+            name='create_date',
+            field=models.DateField(db_index=True, verbose_name='Дата создания'),
+        ),
+        migrations.AlterField(
+            model_name='contract',
+            name='total_value',
+            field=models.DecimalField(db_index=True, decimal_places=2, max_digits=12, verbose_name='Общая стоимость заказа по договору'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='number',
+            field=models.CharField(db_index=True, max_length=100, verbose_name='Номер заказа'),
+        ),
+    ]
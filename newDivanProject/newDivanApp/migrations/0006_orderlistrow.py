@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0005_order_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderListRow',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='list_row', serialize=False, to='newDivanApp.order', verbose_name='Заказ')),
+                ('number', models.CharField(max_length=100, verbose_name='Номер заказа')),
+                ('status', models.CharField(choices=[('registered', 'Заказ зарегистрирован'), ('to_pickup', 'Необходимо забрать'), ('is_picked', 'Заказ привезли'), ('to_do', 'В очереди'), ('in_progress', 'Взято в работу'), ('in_review', 'Ждет проверки управляющего'), ('closed', 'Выполнено успешно'), ('suspended', 'Приостановлено'), ('to_deliver', 'Необходима доставка'), ('delivered', 'Доставлено клиенту')], db_index=True, max_length=100, verbose_name='Статус заказа')),
+                ('create_date', models.DateField(verbose_name='Дата создания')),
+                ('completion_date', models.DateField(verbose_name='Ориентировочная дата выполнения')),
+                ('total_value', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Общая стоимость заказа по договору')),
+                ('total_work_cost', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Общая стоимость работ')),
+                ('furniture_type', models.CharField(blank=True, choices=[('soft', 'Мягкая мебель'), ('cabinet', 'Корпусная мебель')], db_index=True, max_length=50, verbose_name='Тип мебели')),
+                ('work_type', models.CharField(blank=True, choices=[('create', 'Изготовление'), ('reupholster', 'Перетяжка'), ('restoration', 'Реставрация'), ('new_build', 'Новодел')], max_length=50, verbose_name='Тип работ')),
+                ('description', models.CharField(blank=True, max_length=100, verbose_name='Краткое описание ТЗ')),
+                ('payment_status', models.CharField(choices=[('awaiting_prepayment', 'Ожидает предоплаты'), ('prepayment_made', 'Внесена предоплата'), ('awaiting_payment', 'Ожидает оплаты'), ('payment_done', 'Оплата произведена')], db_index=True, max_length=50, verbose_name='Статус оплаты')),
+                ('manager', models.JSONField(default=dict, verbose_name='Менеджер')),
+                ('executors', models.JSONField(default=list, verbose_name='Исполнители')),
+            ],
+            options={
+                'verbose_name': 'Строка списка заказов',
+                'verbose_name_plural': 'Строки списка заказов',
+                'indexes': [models.Index(fields=['number', 'order'], name='orderlistrow_number_idx'), models.Index(fields=['create_date', 'order'], name='orderlistrow_create_idx'), models.Index(fields=['completion_date', 'order'], name='orderlistrow_completion_idx'), models.Index(fields=['total_value', 'order'], name='orderlistrow_value_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0006_orderlistrow'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderlistrow',
+            name='payment_status',
+            field=models.CharField(choices=[('awaiting_prepayment', 'Ожидает предоплаты'), ('prepayment_made', 'Внесена предоплата'), ('awaiting_payment', 'Ожидает оплаты'), ('payment_done', 'Оплата произведена')], max_length=50, verbose_name='Статус оплаты'),
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['is_prepayment_paid', 'is_postpayment_paid'], name='contract_payment_flags_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderlistrow',
+            index=models.Index(fields=['payment_status', 'order'], name='orderlistrow_payment_idx'),
+        ),
+    ]
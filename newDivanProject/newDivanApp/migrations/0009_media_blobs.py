@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:03
+
+import django.core.validators
+from django.db import migrations, models
+import newDivanApp.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0008_order_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Путь в хранилище')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Размер, байт')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')),
+            ],
+            options={
+                'verbose_name': 'Файл изображения',
+                'verbose_name_plural': 'Файлы изображений',
+            },
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='photo1',
+            field=models.ImageField(blank=True, null=True, storage=newDivanApp.storage.ContentAddressedStorage(), upload_to='activity/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'])], verbose_name='Фото 1'),
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='photo2',
+            field=models.ImageField(blank=True, null=True, storage=newDivanApp.storage.ContentAddressedStorage(), upload_to='activity/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'])], verbose_name='Фото 2'),
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='photo3',
+            field=models.ImageField(blank=True, null=True, storage=newDivanApp.storage.ContentAddressedStorage(), upload_to='activity/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'])], verbose_name='Фото 3'),
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='photo4',
+            field=models.ImageField(blank=True, null=True, storage=newDivanApp.storage.ContentAddressedStorage(), upload_to='activity/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'])], verbose_name='Фото 4'),
+        ),
+        migrations.AlterField(
+            model_name='employee',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=newDivanApp.storage.ContentAddressedStorage(), upload_to='avatars/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'])], verbose_name='Аватар'),
+        ),
+        migrations.AlterField(
+            model_name='technicalspecification',
+            name='photo1',
+            field=models.ImageField(blank=True, null=True, storage=newDivanApp.storage.ContentAddressedStorage(), upload_to='technical_specifications/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'])], verbose_name='Фото 1'),
+        ),
+        migrations.AlterField(
+            model_name='technicalspecification',
+            name='photo2',
+            field=models.ImageField(blank=True, null=True, storage=newDivanApp.storage.ContentAddressedStorage(), upload_to='technical_specifications/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'])], verbose_name='Фото 2'),
+        ),
+        migrations.AlterField(
+            model_name='technicalspecification',
+            name='photo3',
+            field=models.ImageField(blank=True, null=True, storage=newDivanApp.storage.ContentAddressedStorage(), upload_to='technical_specifications/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'])], verbose_name='Фото 3'),
+        ),
+        migrations.AlterField(
+            model_name='technicalspecification',
+            name='photo4',
+            field=models.ImageField(blank=True, null=True, storage=newDivanApp.storage.ContentAddressedStorage(), upload_to='technical_specifications/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'])], verbose_name='Фото 4'),
+        ),
+    ]
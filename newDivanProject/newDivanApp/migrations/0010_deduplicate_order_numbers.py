@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:06
+
+from django.db import migrations
+from django.db.models import Count
+
+
+# Перед уникальным индексом повторяющиеся номера переименовываются: самый ранний заказ
+# сохраняет номер, остальные получают суффикс -2, -3, ...
+def deduplicate_numbers(apps, schema_editor):
+    Order = apps.get_model('newDivanApp', 'Order')
+    OrderListRow = apps.get_model('newDivanApp', 'OrderListRow')
+    duplicated = (Order.objects.values('number').annotate(total=Count('id')).filter(total__gt=1)
+                  .values_list('number', flat=True))
+    taken = set(Order.objects.values_list('number', flat=True))
+
+    for number in list(duplicated):
+        for order in Order.objects.filter(number=number).order_by('id')[1:]:
+            suffix = 2
+            while f"{number}-{suffix}" in taken:
+                suffix += 1
+            order.number = f"{number}-{suffix}"
+            taken.add(order.number)
+            order.save(update_fields=['number'])
+            OrderListRow.objects.filter(order_id=order.id).update(number=order.number)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0009_media_blobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_numbers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+
+# Отдельная миграция: в PostgreSQL нельзя менять схему таблицы в одной транзакции
+# с изменением её строк (pending trigger events)
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0010_deduplicate_order_numbers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='number',
+            field=models.CharField(max_length=100, unique=True, verbose_name='Номер заказа'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+TABLE = '"newDivanApp_employee"'
+
+
+# Триграммный индекс нужен только PostgreSQL: с ним search_key LIKE '%...%' не сканирует всю таблицу
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(f"CREATE INDEX employee_search_key_trgm_idx ON {TABLE} USING gin (search_key gin_trgm_ops)")
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS employee_search_key_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0012_table_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='search_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=310, verbose_name='Ключ поиска'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:09
+
+from django.db import migrations
+
+
+# Историческая модель не знает про Employee.save(), поэтому ключ собирается здесь так же, как в build_search_key
+def fill_search_keys(apps, schema_editor):
+    Employee = apps.get_model('newDivanApp', 'Employee')
+    employees = list(Employee.objects.only('last_name', 'first_name', 'middle_name'))
+    for employee in employees:
+        full_name = f"{employee.last_name} {employee.first_name} {employee.middle_name or ''}"
+        employee.search_key = ' '.join(full_name.lower().replace('ё', 'е').split())
+    Employee.objects.bulk_update(employees, ['search_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0013_employee_search_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0014_fill_employee_search_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True, verbose_name='Месяц')),
+                ('source', models.CharField(choices=[('site', 'Сайт'), ('recommendation', 'Рекомендация'), ('returning_customer', 'Повторный клиент')], max_length=100, verbose_name='Источник')),
+                ('furniture_type', models.CharField(blank=True, choices=[('soft', 'Мягкая мебель'), ('cabinet', 'Корпусная мебель')], max_length=50, verbose_name='Тип мебели')),
+                ('work_type', models.CharField(blank=True, choices=[('create', 'Изготовление'), ('reupholster', 'Перетяжка'), ('restoration', 'Реставрация'), ('new_build', 'Новодел')], max_length=50, verbose_name='Тип работ')),
+                ('order_count', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Стоимость по договорам')),
+                ('work_cost', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Стоимость работ')),
+                ('manager', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='newDivanApp.employee', verbose_name='Менеджер')),
+            ],
+            options={
+                'verbose_name': 'Строка сводки выручки',
+                'verbose_name_plural': 'Сводка выручки',
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:40
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+
+# Первичное заполнение сводки по историческим моделям; та же агрегация, что в reports._aggregate
+def fill_revenue_rollup(apps, schema_editor):
+    Order = apps.get_model('newDivanApp', 'Order')
+    TechnicalSpecification = apps.get_model('newDivanApp', 'TechnicalSpecification')
+    RevenueRollup = apps.get_model('newDivanApp', 'RevenueRollup')
+
+    first_spec = TechnicalSpecification.objects.filter(order=OuterRef('pk')).order_by('pk')
+    rows = (Order.objects
+            .annotate(rollup_month=TruncMonth('contract__create_date'),
+                      rollup_furniture=Coalesce(Subquery(first_spec.values('furniture_type1')[:1]), Value('')),
+                      rollup_work=Coalesce(Subquery(first_spec.values('work_type1')[:1]), Value('')))
+            .values('rollup_month', 'manager_id', 'source', 'rollup_furniture', 'rollup_work')
+            .annotate(order_count=Count('id'), revenue=Sum('contract__total_value'),
+                      work_cost=Sum('contract__total_work_cost'))
+            .order_by())
+    RevenueRollup.objects.bulk_create([RevenueRollup(
+        month=row['rollup_month'], manager_id=row['manager_id'], source=row['source'],
+        furniture_type=row['rollup_furniture'], work_type=row['rollup_work'],
+        order_count=row['order_count'], revenue=row['revenue'] or 0, work_cost=row['work_cost'] or 0,
+    ) for row in rows], batch_size=1000)
+
+
+def clear_revenue_rollup(apps, schema_editor):
+    apps.get_model('newDivanApp', 'RevenueRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0015_revenue_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_revenue_rollup, clear_revenue_rollup),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0016_fill_revenue_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='Месяц')),
+                ('payment_date', models.DateField(verbose_name='Дата выплаты')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Закрыта')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='newDivanApp.employee', verbose_name='Кем закрыта')),
+            ],
+            options={
+                'verbose_name': 'Зарплатная ведомость',
+                'verbose_name_plural': 'Зарплатные ведомости',
+            },
+        ),
+        migrations.CreateModel(
+            name='PayrollEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full_name', models.CharField(max_length=310, verbose_name='ФИО')),
+                ('position', models.CharField(max_length=100, verbose_name='Должность')),
+                ('type_salary', models.CharField(choices=[('fixed', 'Фиксированный'), ('not_fixed', 'Сдельный')], max_length=50, verbose_name='Тип оплаты')),
+                ('fixed_salary', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Оклад')),
+                ('piecework', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сдельная оплата')),
+                ('activity_count', models.PositiveIntegerField(default=0, verbose_name='Оплаченных активностей')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Итого')),
+                ('employee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='newDivanApp.employee', verbose_name='Сотрудник')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='entries', to='newDivanApp.payrollperiod', verbose_name='Ведомость')),
+            ],
+            options={
+                'verbose_name': 'Строка ведомости',
+                'verbose_name_plural': 'Строки ведомостей',
+            },
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='payroll_period',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='activities', to='newDivanApp.payrollperiod', verbose_name='Зарплатная ведомость'),
+        ),
+    ]
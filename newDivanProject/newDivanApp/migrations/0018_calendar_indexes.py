@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0017_payroll'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Изменено'),
+        ),
+        migrations.AddField(
+            model_name='contract',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Изменено'),
+        ),
+        migrations.AddField(
+            model_name='pickupdelivery',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Изменено'),
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='date_end',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='Дата окончания'),
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='date_review',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='Дата проверки управляющим'),
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='date_start',
+            field=models.DateField(db_index=True, verbose_name='Дата начала'),
+        ),
+        migrations.AlterField(
+            model_name='pickupdelivery',
+            name='delivery_date',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='Дата доставки'),
+        ),
+        migrations.AlterField(
+            model_name='pickupdelivery',
+            name='pickup_date',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='Дата забора'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+EXECUTOR_FIELDS = ['executor1_id', 'executor2_id', 'executor3_id']
+
+
+# executor1..3 переносятся в OrderExecutor в том же порядке; повторно указанный сотрудник остаётся на первом месте
+def copy_executors(apps, schema_editor):
+    Order = apps.get_model('newDivanApp', 'Order')
+    OrderExecutor = apps.get_model('newDivanApp', 'OrderExecutor')
+    assignments = []
+    for order_id, *executor_ids in Order.objects.values_list('pk', *EXECUTOR_FIELDS).iterator(chunk_size=2000):
+        employee_ids = list(dict.fromkeys(employee_id for employee_id in executor_ids if employee_id is not None))
+        assignments.extend(OrderExecutor(order_id=order_id, employee_id=employee_id, role='executor', position=position)
+                           for position, employee_id in enumerate(employee_ids))
+    OrderExecutor.objects.bulk_create(assignments, batch_size=1000)
+
+
+# Обратно возвращаются только первые три исполнителя
+def restore_executors(apps, schema_editor):
+    Order = apps.get_model('newDivanApp', 'Order')
+    OrderExecutor = apps.get_model('newDivanApp', 'OrderExecutor')
+    executors = {}
+    for order_id, employee_id in (OrderExecutor.objects.filter(role='executor')
+                                  .order_by('order_id', 'position').values_list('order_id', 'employee_id')):
+        executors.setdefault(order_id, []).append(employee_id)
+    orders = []
+    for order_id, employee_ids in executors.items():
+        order = Order(pk=order_id)
+        for field, employee_id in zip(EXECUTOR_FIELDS, employee_ids):
+            setattr(order, field, employee_id)
+        orders.append(order)
+    Order.objects.bulk_update(orders, ['executor1', 'executor2', 'executor3'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0019_change_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderExecutor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('executor', 'Исполнитель')], default='executor', max_length=50, verbose_name='Роль')),
+                ('position', models.PositiveSmallIntegerField(default=0, verbose_name='Порядок')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='executor_assignments', to='newDivanApp.employee', verbose_name='Сотрудник')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='executor_assignments', to='newDivanApp.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Исполнитель заказа',
+                'verbose_name_plural': 'Исполнители заказов',
+                'ordering': ['order', 'position'],
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='executors',
+            field=models.ManyToManyField(blank=True, related_name='executed_orders', through='newDivanApp.OrderExecutor', to='newDivanApp.employee', verbose_name='Исполнители'),
+        ),
+        migrations.AddIndex(
+            model_name='orderexecutor',
+            index=models.Index(fields=['employee', 'order'], name='orderexecutor_employee_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderexecutor',
+            constraint=models.UniqueConstraint(fields=('order', 'employee', 'role'), name='orderexecutor_unique_role'),
+        ),
+        migrations.RunPython(copy_executors, restore_executors),
+        migrations.RemoveField(
+            model_name='order',
+            name='executor1',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='executor2',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='executor3',
+        ),
+    ]
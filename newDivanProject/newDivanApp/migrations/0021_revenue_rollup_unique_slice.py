@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newDivanApp', '0020_order_executors'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='revenuerollup',
+            constraint=models.UniqueConstraint(fields=('month', 'manager', 'source', 'furniture_type', 'work_type'), name='revenuerollup_unique_slice'),
+        ),
+    ]
@@ -1,6 +1,23 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+from django.db.models import Case, When, Value, Exists, OuterRef
+from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
 from django.contrib.auth.models import User
+from .storage import media_storage
+
+
+# Django отправляет post_save уже после выхода из транзакции сохранения: в режиме autocommit строка
+# фиксируется раньше, чем обработчик сигнала запишет журнал изменений. Здесь сохранение и сигнал
+# выполняются в одной транзакции, поэтому запись ChangeLogEntry фиксируется или откатывается вместе со строкой
+class ChangeLoggedModel(models.Model):
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
 # ******** СУЩНОСТИ, СВЯЗАННЫЕ С ЗАВЕДЕНИЕМ РАБОТНИКА ********* #
 
 # таблица с описанием отделов на производства
@@ -30,7 +47,7 @@ class JobTitle(models.Model):
     def __str__(self):
         return self.name
 
-class Employee(models.Model):
+class Employee(ChangeLoggedModel):
     STATUS_CHOICES = (
         ('working', 'Работает'),
         ('not_working', 'Уволен'),
@@ -63,15 +80,30 @@ class Employee(models.Model):
     payment_details = models.TextField(verbose_name="Реквизиты оплаты", default='', null=True, blank=True)
     avatar = models.ImageField(
         upload_to='avatars/',
+        storage=media_storage,
         verbose_name="Аватар",
         null=True,
         blank=True,
         validators=[FileExtensionValidator(['jpg', 'jpeg', 'png'])]
     )
+    # "фамилия имя отчество" в нижнем регистре и с е вместо ё; по нему ищет и сортирует список сотрудников
+    search_key = models.CharField(max_length=310, default='', blank=True, editable=False, db_index=True,
+                                  verbose_name="Ключ поиска")
 
     def __str__(self):
         return f"{self.position} {self.last_name} {self.first_name}"
 
+    def build_search_key(self):
+        full_name = f"{self.last_name} {self.first_name} {self.middle_name or ''}"
+        return ' '.join(full_name.lower().replace('ё', 'е').split())
+
+    def save(self, *args, **kwargs):
+        self.search_key = self.build_search_key()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'search_key'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Сотрудник"
         verbose_name_plural = "Сотрудники"
@@ -79,8 +111,24 @@ class Employee(models.Model):
 
 # ******** СУЩНОСТИ, СВЯЗАННЫЕ С ЗАВЕДЕНИЕМ ЗАКАЗА ********* #
 
+class OrderQuerySet(models.QuerySet):
+    # Статус оплаты считается в SQL: одни и те же правила для фильтрации, сортировки и вывода.
+    # Доставка проверяется через EXISTS, поэтому строки заказов не дублируются
+    def with_payment_status(self):
+        has_delivery_date = Exists(
+            PickupDelivery.objects.filter(order=OuterRef('pk'), delivery_date__isnull=False)
+        )
+        return self.annotate(payment_status=Case(
+            When(contract__is_postpayment_paid=True, then=Value('payment_done')),
+            When(contract__is_prepayment_paid=False, then=Value('awaiting_prepayment')),
+            When(has_delivery_date, then=Value('awaiting_payment')),
+            default=Value('prepayment_made'),
+            output_field=models.CharField(),
+        ))
+
+
 # сводная таблица с описанием данных заказа
-class Order(models.Model):
+class Order(ChangeLoggedModel):
     ORDER_STATUS = (
         ('registered', 'Заказ зарегистрирован'),
         ('to_pickup', 'Необходимо забрать'),
@@ -100,19 +148,25 @@ class Order(models.Model):
         ('returning_customer', 'Повторный клиент'),
     )
 
-    number = models.CharField(max_length=100, verbose_name="Номер заказа")
+    PAYMENT_STATUSES = (
+        ('awaiting_prepayment', 'Ожидает предоплаты'),
+        ('prepayment_made', 'Внесена предоплата'),
+        ('awaiting_payment', 'Ожидает оплаты'),
+        ('payment_done', 'Оплата произведена'),
+    )
+
+    number = models.CharField(max_length=100, verbose_name="Номер заказа", unique=True)
     contract = models.ForeignKey('Contract', on_delete=models.CASCADE, verbose_name="Договор")
     manager = models.ForeignKey('Employee', on_delete=models.CASCADE, verbose_name="Менеджер", related_name="managed_orders")
     source = models.CharField(max_length=100, choices=SOURCE_TYPES, verbose_name="Источник") #  новое поле
     status = models.CharField(max_length=100, choices=ORDER_STATUS, verbose_name="Статус заказа")
-    executor1 = models.ForeignKey('Employee', on_delete=models.CASCADE, verbose_name="Исполнитель 1",
-                                    related_name="executor1_orders", blank=True, null=True)
-    executor2 = models.ForeignKey('Employee', on_delete=models.CASCADE, verbose_name="Исполнитель 2",
-                                    related_name="executor2_orders", blank=True, null=True)
-    executor3 = models.ForeignKey('Employee', on_delete=models.CASCADE, verbose_name="Исполнитель 3",
-                                    related_name="executor3_orders", blank=True, null=True)
+    # исполнители в порядке назначения, см. OrderExecutor
+    executors = models.ManyToManyField('Employee', through='OrderExecutor', related_name="executed_orders",
+                                       verbose_name="Исполнители", blank=True)
     comments = models.TextField(verbose_name="Комментарии", default='', null=True, blank=True)
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
@@ -127,8 +181,37 @@ class Order(models.Model):
     #     super().save(args, **kwargs)
 
 
+# исполнители заказа: сколько угодно сотрудников, у каждого роль и место в списке.
+# Заказы сотрудника ищутся по индексу (employee, order) без обращения к самой таблице
+class OrderExecutor(ChangeLoggedModel):
+    ROLES = (
+        ('executor', 'Исполнитель'),
+    )
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="executor_assignments",
+                              verbose_name="Заказ")
+    employee = models.ForeignKey('Employee', on_delete=models.CASCADE, related_name="executor_assignments",
+                                 verbose_name="Сотрудник")
+    role = models.CharField(max_length=50, choices=ROLES, default='executor', verbose_name="Роль")
+    position = models.PositiveSmallIntegerField(default=0, verbose_name="Порядок")
+
+    class Meta:
+        verbose_name = "Исполнитель заказа"
+        verbose_name_plural = "Исполнители заказов"
+        ordering = ['order', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'employee', 'role'], name='orderexecutor_unique_role'),
+        ]
+        indexes = [
+            models.Index(fields=['employee', 'order'], name='orderexecutor_employee_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.order} - {self.employee}"
+
+
 # таблица техзадания
-class TechnicalSpecification(models.Model):
+class TechnicalSpecification(ChangeLoggedModel):
     WORK_TYPES = (
         ('create', 'Изготовление'),
         ('reupholster', 'Перетяжка'),
@@ -152,28 +235,32 @@ class TechnicalSpecification(models.Model):
     item_type = models.CharField(max_length=30, verbose_name="Тип изделия")# новое поле
     comments = models.TextField(verbose_name="Комментарии к ТЗ", default='', null=True, blank=True)
     photo1 = models.ImageField(
-        upload_to='technical_specifications/', 
+        upload_to='technical_specifications/',
+        storage=media_storage,
         verbose_name="Фото 1", 
         null=True, 
         blank=True,
         validators=[FileExtensionValidator(['jpg', 'jpeg', 'png'])]
         )
     photo2 = models.ImageField(
-        upload_to='technical_specifications/', 
+        upload_to='technical_specifications/',
+        storage=media_storage,
         verbose_name="Фото 2", 
         null=True, 
         blank=True,
         validators=[FileExtensionValidator(['jpg', 'jpeg', 'png'])]
         )
     photo3 = models.ImageField(
-        upload_to='technical_specifications/', 
+        upload_to='technical_specifications/',
+        storage=media_storage,
         verbose_name="Фото 3", 
         null=True, 
         blank=True,
         validators=[FileExtensionValidator(['jpg', 'jpeg', 'png'])]
         )
     photo4 = models.ImageField(
-        upload_to='technical_specifications/', 
+        upload_to='technical_specifications/',
+        storage=media_storage,
         verbose_name="Фото 4", 
         null=True, 
         blank=True,
@@ -189,7 +276,7 @@ class TechnicalSpecification(models.Model):
 
 
 # таблица активностей
-class Activity(models.Model):
+class Activity(ChangeLoggedModel):
     ACTIVITY_STATUS = (
         ('backlog', 'Активность зарегистрирована'),
         ('in_review', 'Ждет проверки управляющего'),
@@ -211,36 +298,44 @@ class Activity(models.Model):
     employee = models.ForeignKey('Employee', on_delete=models.CASCADE, verbose_name="Ответственный", related_name="activities")
     activity_descr = models.TextField(verbose_name="Описание работы", default='', blank=True)
     status = models.CharField(max_length=100, choices=ACTIVITY_STATUS, default='backlog', verbose_name="Статус активности")
-    date_start = models.DateField(verbose_name="Дата начала")
-    date_review = models.DateField(verbose_name="Дата проверки управляющим", null=True, blank=True)
-    date_end = models.DateField(verbose_name="Дата окончания", blank=True, null=True)
+    date_start = models.DateField(verbose_name="Дата начала", db_index=True)
+    date_review = models.DateField(verbose_name="Дата проверки управляющим", null=True, blank=True, db_index=True)
+    date_end = models.DateField(verbose_name="Дата окончания", blank=True, null=True, db_index=True)
     total_work_cost = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Общая стоимость работы")
     is_paid = models.BooleanField(default=False, verbose_name="Оплата произведена")
     payment_date = models.DateField(verbose_name="Дата оплаты", blank=True, null=True)
     payment_type = models.CharField(max_length=100, choices=PAYMENT_TYPES, default='cash', verbose_name="Способ оплаты")  # новое поле
+    # ведомость, по которой активность оплачена (сдельная оплата, см. payroll.py)
+    payroll_period = models.ForeignKey('PayrollPeriod', on_delete=models.PROTECT, null=True, blank=True,
+                                       related_name="activities", verbose_name="Зарплатная ведомость")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Изменено")
     photo1 = models.ImageField(
-        upload_to='activity/', 
+        upload_to='activity/',
+        storage=media_storage,
         verbose_name="Фото 1", 
         null=True, 
         blank=True,
         validators=[FileExtensionValidator(['jpg', 'jpeg', 'png'])]
         )
     photo2 = models.ImageField(
-        upload_to='activity/', 
+        upload_to='activity/',
+        storage=media_storage,
         verbose_name="Фото 2", 
         null=True, 
         blank=True,
         validators=[FileExtensionValidator(['jpg', 'jpeg', 'png'])]
         )
     photo3 = models.ImageField(
-        upload_to='activity/', 
+        upload_to='activity/',
+        storage=media_storage,
         verbose_name="Фото 3", 
         null=True, 
         blank=True,
         validators=[FileExtensionValidator(['jpg', 'jpeg', 'png'])]
         )
     photo4 = models.ImageField(
-        upload_to='activity/', 
+        upload_to='activity/',
+        storage=media_storage,
         verbose_name="Фото 4", 
         null=True, 
         blank=True,
@@ -255,7 +350,7 @@ class Activity(models.Model):
         return f"Активность {self.id}"
 
 
-class Material(models.Model):
+class Material(ChangeLoggedModel):
     ORDER_STATUS = (
         ('not_ordered', 'Не заказан'), 
         ('ordered', 'Заказан')
@@ -288,7 +383,7 @@ class Material(models.Model):
         return f"{self.order.number} - {self.name}"
 
 
-class PickupDelivery(models.Model):
+class PickupDelivery(ChangeLoggedModel):
     PICKUP_TYPES = (
         ('self_delivery', 'Клиент привозит сам'), 
         ('pickup', 'Забирает курьер')
@@ -303,25 +398,66 @@ class PickupDelivery(models.Model):
     is_picked = models.BooleanField(default=False, verbose_name="Забран")
     pickup_type = models.CharField(max_length=50, verbose_name="Тип забора", choices=PICKUP_TYPES)
     # estimated_pickup_date = models.DateField(verbose_name="Планируемая дата забора", null=True, blank=True) # убрала поле
-    pickup_date = models.DateField(verbose_name="Дата забора", null=True, blank=True)
+    pickup_date = models.DateField(verbose_name="Дата забора", null=True, blank=True, db_index=True)
     pickup_time = models.TimeField(verbose_name="Время", null=True, blank=True) # новое поле
     pickup_guy = models.ForeignKey(Employee, on_delete=models.CASCADE, verbose_name="Ответственный за забор", null=True,
                                      blank=True, related_name="pickup_guy")
     is_delivered = models.BooleanField(default=False, verbose_name="Доставлен")
     delivery_type = models.CharField(max_length=50, verbose_name="Тип доставки", choices=DELIVERY_TYPES)
     # estimated_delivery_date = models.DateField(verbose_name="Планируемая дата доставки", null=True, blank=True) # убрала поле
-    delivery_date = models.DateField(verbose_name="Дата доставки", null=True, blank=True)
+    delivery_date = models.DateField(verbose_name="Дата доставки", null=True, blank=True, db_index=True)
     delivery_time = models.TimeField(verbose_name="Время", null=True, blank=True) # новое поле
     delivery_guy = models.ForeignKey(Employee, on_delete=models.CASCADE, verbose_name="Ответственный за доставку", null=True,
                                      blank=True, related_name="delivery_guy")
     pickup_comments = models.TextField(verbose_name="Комментарии", default='', null=True, blank=True)
     delivery_comments = models.TextField(verbose_name="Комментарии", default='', null=True, blank=True)
+    # время последнего изменения строки; по нему календарь отдаёт только изменившиеся события (см. calendar_feed.py)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Изменено")
 
     class Meta:
         verbose_name = "Забор/Доставка"
         verbose_name_plural = "Заборы/Доставки"
 
 
+# плоская таблица для списка заказов и карточек дашборда (read model),
+# поддерживается сигналами из signals.py, полностью пересобирается командой rebuild_order_list
+class OrderListRow(models.Model):
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name="list_row",
+                                 verbose_name="Заказ")
+    number = models.CharField(max_length=100, verbose_name="Номер заказа")
+    status = models.CharField(max_length=100, choices=Order.ORDER_STATUS, verbose_name="Статус заказа", db_index=True)
+    create_date = models.DateField(verbose_name="Дата создания")
+    completion_date = models.DateField(verbose_name="Ориентировочная дата выполнения")
+    total_value = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Общая стоимость заказа по договору")
+    total_work_cost = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Общая стоимость работ")
+    furniture_type = models.CharField(max_length=50, choices=TechnicalSpecification.FURNITURE_TYPES,
+                                      verbose_name="Тип мебели", blank=True, db_index=True)
+    work_type = models.CharField(max_length=50, choices=TechnicalSpecification.WORK_TYPES, verbose_name="Тип работ",
+                                 blank=True)
+    description = models.CharField(max_length=100, verbose_name="Краткое описание ТЗ", blank=True)
+    payment_status = models.CharField(max_length=50, choices=Order.PAYMENT_STATUSES, verbose_name="Статус оплаты")
+    manager = models.JSONField(default=dict, verbose_name="Менеджер")
+    executors = models.JSONField(default=list, verbose_name="Исполнители")
+    # номер, описание ТЗ, ФИО и телефон клиента в нормализованном виде; по нему строятся
+    # поисковые индексы (tsvector + pg_trgm в PostgreSQL, FTS5 в SQLite), см. search.py
+    search_text = models.TextField(verbose_name="Текст для поиска", default='', blank=True)
+
+    class Meta:
+        verbose_name = "Строка списка заказов"
+        verbose_name_plural = "Строки списка заказов"
+        # индексы под keyset-пагинацию: (поле сортировки, order_id)
+        indexes = [
+            models.Index(fields=['number', 'order'], name='orderlistrow_number_idx'),
+            models.Index(fields=['create_date', 'order'], name='orderlistrow_create_idx'),
+            models.Index(fields=['completion_date', 'order'], name='orderlistrow_completion_idx'),
+            models.Index(fields=['total_value', 'order'], name='orderlistrow_value_idx'),
+            models.Index(fields=['payment_status', 'order'], name='orderlistrow_payment_idx'),
+        ]
+
+    def __str__(self):
+        return self.number
+
+
 # ******** СУЩНОСТИ, СВЯЗАННЫЕ С ЗАВЕДЕНИЕМ ДОГОВОРА ********* #
 
 #  таблица с информацией о клиентах (физ лица)
@@ -364,7 +500,7 @@ class Firm(models.Model):
 
 
 # таблица с информацией о заключенном договоре с клиентом
-class Contract(models.Model):
+class Contract(ChangeLoggedModel):
     PAYMENT_TYPES = (
         ('cash', 'Наличные'),
         ('card', 'По карте'),
@@ -375,11 +511,11 @@ class Contract(models.Model):
     num = models.CharField(max_length=100, verbose_name="Номер договора")
     client = models.ForeignKey(Client, on_delete=models.CASCADE, verbose_name="Клиент")
     firm = models.ForeignKey(Firm, on_delete=models.CASCADE, verbose_name="Фирма", null=True, blank=True)
-    create_date = models.DateField(verbose_name="Дата создания")
-    completion_date = models.DateField(verbose_name="Ориентировочная дата выполнения")
+    create_date = models.DateField(verbose_name="Дата создания", db_index=True)
+    completion_date = models.DateField(verbose_name="Ориентировочная дата выполнения", db_index=True)
     duration = models.IntegerField(verbose_name="Сроки выполнения по договору")
     total_value = models.DecimalField(max_digits=12, decimal_places=2,
-                                      verbose_name="Общая стоимость заказа по договору")
+                                      verbose_name="Общая стоимость заказа по договору", db_index=True)
     total_work_cost = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Общая стоимость работ")
     payment_type = models.CharField(max_length=100, choices=PAYMENT_TYPES, default='cash',
                               verbose_name="Способ оплаты") # новое поле
@@ -391,15 +527,165 @@ class Contract(models.Model):
     postpayment_date = models.DateField(verbose_name="Дата оплаты", blank=True, null=True)
     is_postpayment_paid = models.BooleanField(default=False, verbose_name="Оплата произведена")
     comments = models.TextField(verbose_name="Комментарии к договору", default='', null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Изменено")
 
 
 
     class Meta:
         verbose_name = "Договор"
         verbose_name_plural = "Договоры"
+        indexes = [
+            models.Index(fields=['is_prepayment_paid', 'is_postpayment_paid'], name='contract_payment_flags_idx'),
+        ]
 
     def __str__(self):
         return f"{self.num} от {self.create_date}"
     
 
-    
\ No newline at end of file
+    
+# ******** ХРАНИЛИЩЕ ИЗОБРАЖЕНИЙ ********* #
+
+# уникальный файл в blobs/ и число строк моделей, которые на него ссылаются (см. storage.py, blobs.py)
+class MediaBlob(models.Model):
+    name = models.CharField(max_length=255, unique=True, verbose_name="Путь в хранилище")
+    size = models.BigIntegerField(default=0, verbose_name="Размер, байт")
+    ref_count = models.PositiveIntegerField(default=0, verbose_name="Число ссылок")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата загрузки")
+
+    class Meta:
+        verbose_name = "Файл изображения"
+        verbose_name_plural = "Файлы изображений"
+
+    def __str__(self):
+        return self.name
+
+
+# ******** ВЕРСИИ ТАБЛИЦ ДЛЯ УСЛОВНЫХ GET-ЗАПРОСОВ ********* #
+
+# счётчик изменений таблицы; увеличивается сигналами и явными вызовами после массовых операций (см. versions.py)
+class TableVersion(models.Model):
+    table = models.CharField(max_length=100, primary_key=True, verbose_name="Таблица")
+    version = models.BigIntegerField(default=0, verbose_name="Версия")
+
+    class Meta:
+        verbose_name = "Версия таблицы"
+        verbose_name_plural = "Версии таблиц"
+
+    def __str__(self):
+        return f"{self.table}: {self.version}"
+
+
+# ******** СВОДНАЯ ТАБЛИЦА ДЛЯ ОТЧЁТОВ ПО ВЫРУЧКЕ ********* #
+
+# суммы по заказам в разрезе месяца договора, менеджера, источника, типа мебели и типа работ (первое ТЗ заказа).
+# Месяц пересчитывается целиком после изменения его договоров, заказов или ТЗ (см. reports.py),
+# вся таблица - командой rebuild_revenue_rollup
+class RevenueRollup(models.Model):
+    month = models.DateField(verbose_name="Месяц", db_index=True)
+    manager = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, blank=True, related_name="+",
+                                verbose_name="Менеджер")
+    source = models.CharField(max_length=100, choices=Order.SOURCE_TYPES, verbose_name="Источник")
+    furniture_type = models.CharField(max_length=50, choices=TechnicalSpecification.FURNITURE_TYPES, blank=True,
+                                      verbose_name="Тип мебели")
+    work_type = models.CharField(max_length=50, choices=TechnicalSpecification.WORK_TYPES, blank=True,
+                                 verbose_name="Тип работ")
+    order_count = models.PositiveIntegerField(default=0, verbose_name="Заказов")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Стоимость по договорам")
+    work_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Стоимость работ")
+
+    class Meta:
+        verbose_name = "Строка сводки выручки"
+        verbose_name_plural = "Сводка выручки"
+        # Одна строка на срез. Строки с менеджером NULL (менеджер удалён) ограничение не сравнивает между собой,
+        # но сводка их и не создаёт: у заказа менеджер обязателен
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'manager', 'source', 'furniture_type', 'work_type'],
+                                    name='revenuerollup_unique_slice'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%m.%Y} {self.get_source_display()}"
+
+
+# ******** ЗАРПЛАТНЫЕ ВЕДОМОСТИ ********* #
+
+# Закрытая ведомость не меняется: отчёты за прошлые месяцы читают её строки, а не пересчитывают
+# активности и оклады заново (см. payroll.py)
+class PayrollPeriod(models.Model):
+    month = models.DateField(unique=True, verbose_name="Месяц")
+    payment_date = models.DateField(verbose_name="Дата выплаты")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Закрыта")
+    created_by = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, blank=True, related_name="+",
+                                   verbose_name="Кем закрыта")
+
+    class Meta:
+        verbose_name = "Зарплатная ведомость"
+        verbose_name_plural = "Зарплатные ведомости"
+
+    def __str__(self):
+        return f"Ведомость за {self.month:%m.%Y}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Закрытая ведомость не изменяется")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Закрытая ведомость не удаляется")
+
+
+# снимок начислений сотрудника: ФИО, должность, оклад и сдельная часть на момент закрытия ведомости
+class PayrollEntry(models.Model):
+    period = models.ForeignKey(PayrollPeriod, on_delete=models.PROTECT, related_name="entries",
+                               verbose_name="Ведомость")
+    employee = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, blank=True, related_name="+",
+                                 verbose_name="Сотрудник")
+    full_name = models.CharField(max_length=310, verbose_name="ФИО")
+    position = models.CharField(max_length=100, verbose_name="Должность")
+    type_salary = models.CharField(max_length=50, choices=Employee.SALARY_CHOICES, verbose_name="Тип оплаты")
+    fixed_salary = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Оклад")
+    piecework = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Сдельная оплата")
+    activity_count = models.PositiveIntegerField(default=0, verbose_name="Оплаченных активностей")
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Итого")
+
+    class Meta:
+        verbose_name = "Строка ведомости"
+        verbose_name_plural = "Строки ведомостей"
+
+    def __str__(self):
+        return f"{self.full_name}: {self.total}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Строки закрытой ведомости не изменяются")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Строки закрытой ведомости не удаляются")
+
+
+# ******** ЖУРНАЛ ИЗМЕНЕНИЙ (OUTBOX) ********* #
+
+# Пишется в той же транзакции, что и изменение строки (см. changelog.py); строки только добавляются.
+# id растёт монотонно - по нему потребители читают изменения с курсора
+class ChangeLogEntry(models.Model):
+    ACTIONS = (
+        ('create', 'Создание'),
+        ('update', 'Изменение'),
+        ('delete', 'Удаление'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=50, verbose_name="Модель")
+    object_id = models.BigIntegerField(verbose_name="id строки")
+    action = models.CharField(max_length=10, choices=ACTIONS, verbose_name="Действие")
+    # заказ, к которому относится строка (у заказа - он сам); помогает обновлять карточки заказов без запросов
+    order_id = models.BigIntegerField(null=True, blank=True, verbose_name="id заказа")
+    created_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="Время")
+
+    class Meta:
+        verbose_name = "Запись журнала изменений"
+        verbose_name_plural = "Журнал изменений"
+
+    def __str__(self):
+        return f"#{self.id} {self.model}:{self.object_id} {self.action}"
@@ -0,0 +1,78 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class CursorError(ValueError):
+    pass
+
+
+def get_page_size(raw_value, default=DEFAULT_PAGE_SIZE, max_size=MAX_PAGE_SIZE):
+    try:
+        page_size = int(raw_value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(page_size, max_size))
+
+
+def _to_json(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+# Курсор помнит, по какой сортировке он выдан: после смены сортировки старый курсор недействителен
+def encode_cursor(key, sort_value, pk):
+    raw = json.dumps([key, _to_json(sort_value), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor, key):
+    try:
+        cursor_key, sort_value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise CursorError('Некорректный курсор')
+    if cursor_key != key:
+        raise CursorError('Курсор выдан для другой сортировки')
+    if not isinstance(pk, int) or isinstance(sort_value, (list, dict)):
+        raise CursorError('Некорректный курсор')
+    return sort_value, pk
+
+
+# Keyset-пагинация: сортировка по (sort_key, pk), курсор хранит значения последней строки страницы.
+# Стоимость страницы не зависит от её номера - база идёт по индексу от курсора, без OFFSET.
+# Для сортировки по выражению cursor_key задаёт её имя в курсоре.
+def keyset_page(queryset, sort_key, descending=False, cursor=None, page_size=DEFAULT_PAGE_SIZE, cursor_key=None):
+    sort_expression = F(sort_key) if isinstance(sort_key, str) else sort_key
+    queryset = queryset.annotate(keyset_value=sort_expression)
+
+    prefix = '-' if descending else ''
+    queryset = queryset.order_by(f'{prefix}keyset_value', f'{prefix}pk')
+    key = prefix + (sort_key if isinstance(sort_key, str) else cursor_key or 'expression')
+
+    if cursor:
+        sort_value, pk = decode_cursor(cursor, key)
+        # значение из курсора приводится к типу поля уже в filter(): подделанное значение - ошибка клиента, а не 500
+        try:
+            if descending:
+                queryset = queryset.filter(Q(keyset_value__lt=sort_value) | Q(keyset_value=sort_value, pk__lt=pk))
+            else:
+                queryset = queryset.filter(Q(keyset_value__gt=sort_value) | Q(keyset_value=sort_value, pk__gt=pk))
+        except (ValidationError, TypeError, ValueError):
+            raise CursorError('Некорректный курсор')
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(key, rows[-1].keyset_value, rows[-1].pk)
+    return rows, next_cursor
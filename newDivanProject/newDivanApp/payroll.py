@@ -0,0 +1,110 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+from django.utils import timezone
+
+from .models import Activity, Employee, PayrollEntry, PayrollPeriod
+from .reports import month_start, next_month
+from .versions import bump_table_versions
+from .changelog import log_changes
+
+# Сдельно оплачиваются только успешно выполненные активности
+PAYABLE_ACTIVITY_STATUS = 'closed_positive'
+
+
+def full_name(last_name, first_name, middle_name):
+    return ' '.join(part for part in (last_name, first_name, middle_name) if part)
+
+
+# Неоплаченные сдельные активности, завершённые до конца месяца: в ведомость попадают и хвосты прошлых месяцев
+def payable_activities(month):
+    return Activity.objects.filter(
+        employee__type_salary='not_fixed', status=PAYABLE_ACTIVITY_STATUS, is_paid=False,
+        payroll_period__isnull=True, date_end__lt=next_month(month),
+    )
+
+
+# Сотрудники на окладе, работавшие хотя бы день месяца; оклад начисляется за месяц целиком
+def salaried_employees_q(month):
+    return (Q(type_salary='fixed', salary__isnull=False, employment_date__lt=next_month(month))
+            & (Q(termination_date__isnull=True) | Q(termination_date__gte=month)))
+
+
+# Начисления по ведомости одним GROUP BY по сотрудникам: оклад плюс сумма уже отмеченных ведомостью активностей
+def _aggregate(period):
+    in_period = Q(activities__payroll_period=period)
+    return (Employee.objects
+            .filter(salaried_employees_q(period.month)
+                    | Q(Exists(Activity.objects.filter(employee=OuterRef('pk'), payroll_period=period))))
+            .values('pk', 'last_name', 'first_name', 'middle_name', 'position__name', 'type_salary', 'salary')
+            .annotate(piecework=Sum('activities__total_work_cost', filter=in_period),
+                      activity_count=Count('activities', filter=in_period))
+            .order_by('search_key', 'pk'))
+
+
+def _entries(period):
+    entries = []
+    for row in _aggregate(period):
+        fixed_salary = Decimal(row['salary'] or 0) if row['type_salary'] == 'fixed' else Decimal(0)
+        piecework = row['piecework'] or Decimal(0)
+        entries.append(PayrollEntry(
+            period=period, employee_id=row['pk'],
+            full_name=full_name(row['last_name'], row['first_name'], row['middle_name']),
+            position=row['position__name'], type_salary=row['type_salary'], fixed_salary=fixed_salary,
+            piecework=piecework, activity_count=row['activity_count'], total=fixed_salary + piecework,
+        ))
+    return entries
+
+
+# Закрывает ведомость за месяц. Активности помечаются оплаченными одним UPDATE, который заодно привязывает их
+# к ведомости; сумма по сотрудникам считается уже по привязанным строкам, поэтому начисления совпадают
+# с оплаченными активностями, даже если параллельно закрываются новые
+def close_payroll(month, payment_date=None, created_by=None):
+    month = month_start(month)
+    payment_date = payment_date or timezone.localdate()
+    try:
+        with transaction.atomic():
+            period = PayrollPeriod.objects.create(month=month, payment_date=payment_date, created_by=created_by)
+            payable_activities(month).update(is_paid=True, payment_date=payment_date, payroll_period=period,
+                                           updated_at=timezone.now())
+            PayrollEntry.objects.bulk_create(_entries(period))
+            # UPDATE не шлёт сигналов, поэтому версия таблицы для ETag и журнал изменений пишутся явно
+            bump_table_versions(Activity)
+            log_changes(period.activities.only('pk', 'order_id'), 'update')
+    except IntegrityError:
+        raise ValidationError(f"Ведомость за {month:%m.%Y} уже закрыта")
+    return period
+
+
+# ******** ОТЧЁТЫ ПО ЗАКРЫТЫМ ВЕДОМОСТЯМ ********* #
+
+# Читают только PayrollPeriod и PayrollEntry: оклады и активности после закрытия могли измениться
+
+def payroll_periods():
+    periods = (PayrollPeriod.objects
+               .values('month', 'payment_date')
+               .annotate(employee_count=Count('entries'), activity_count=Sum('entries__activity_count'),
+                         fixed_salary=Sum('entries__fixed_salary'), piecework=Sum('entries__piecework'),
+                         total=Sum('entries__total'))
+               .order_by('-month'))
+    return {'periods': [{**period, 'month': period['month'].strftime('%Y-%m')} for period in periods]}
+
+
+def payroll_report(month):
+    period = PayrollPeriod.objects.filter(month=month_start(month)).values('pk', 'month', 'payment_date').first()
+    if period is None:
+        return None
+    salary_types = dict(Employee.SALARY_CHOICES)
+    rows = []
+    for row in (PayrollEntry.objects.filter(period_id=period['pk'])
+                .values('employee_id', 'full_name', 'position', 'type_salary', 'fixed_salary', 'piecework',
+                        'activity_count', 'total')
+                .order_by('full_name', 'pk')):
+        row['type_salary_display'] = salary_types.get(row['type_salary'], row['type_salary'])
+        rows.append(row)
+    totals = {key: sum((row[key] for row in rows), 0)
+              for key in ('fixed_salary', 'piecework', 'activity_count', 'total')}
+    return {'month': period['month'].strftime('%Y-%m'), 'payment_date': period['payment_date'],
+            'rows': rows, 'totals': totals}
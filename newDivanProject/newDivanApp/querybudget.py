@@ -0,0 +1,115 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+
+# Значения по умолчанию; переопределяются словарём QUERY_BUDGET в settings.py
+DEFAULTS = {
+    'ENABLED': False,
+    'MAX_QUERIES': 30,
+    'MAX_DB_TIME_MS': 500,
+    'MAX_REPEATS': 5,       # сколько раз один и тот же запрос может повториться за запрос (признак N+1)
+    'VIEW_BUDGETS': {},     # {url_name: {'MAX_QUERIES': ..., 'MAX_DB_TIME_MS': ..., 'MAX_REPEATS': ...}}
+    'RAISE': False,         # True - превышение бюджета роняет запрос, False - только предупреждение в лог
+    'REPORT_FILE': None,
+    'REPORT_MAX_BYTES': 10 * 1024 * 1024,
+    'REPORT_BACKUP_COUNT': 5,
+}
+
+logger = logging.getLogger('newDivanApp.query_budget')
+report_logger = logging.getLogger('newDivanApp.query_budget.report')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def get_budget_config():
+    config = DEFAULTS.copy()
+    config.update(getattr(settings, 'QUERY_BUDGET', {}))
+    return config
+
+
+def budget_for(url_name, config=None):
+    config = config or get_budget_config()
+    budget = {key: config[key] for key in ('MAX_QUERIES', 'MAX_DB_TIME_MS', 'MAX_REPEATS')}
+    budget.update(config['VIEW_BUDGETS'].get(url_name, {}))
+    return budget
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"IN \((?:\s*\?\s*,?)+\)")
+
+
+# "Форма" запроса: литералы и списки IN схлопываются, чтобы одинаковые запросы с разными id совпадали
+def normalize_sql(sql):
+    shape = sql.replace('%s', '?')
+    shape = _LITERALS.sub('?', shape)
+    shape = _IN_LISTS.sub('IN (...)', shape)
+    return ' '.join(shape.split())
+
+
+# Обёртка для connection.execute_wrapper: считает запросы и время без DEBUG=True
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.monotonic() - start
+            self.count += 1
+            self.shapes[normalize_sql(sql)] += 1
+
+    @property
+    def duration_ms(self):
+        return round(self.duration * 1000, 2)
+
+    def repeated(self, threshold):
+        return [{'sql': shape, 'count': count} for shape, count in self.shapes.most_common() if count > threshold]
+
+
+def check_budget(recorder, budget):
+    violations = []
+    if recorder.count > budget['MAX_QUERIES']:
+        violations.append(f"запросов {recorder.count} > {budget['MAX_QUERIES']}")
+    if recorder.duration_ms > budget['MAX_DB_TIME_MS']:
+        violations.append(f"время БД {recorder.duration_ms} мс > {budget['MAX_DB_TIME_MS']} мс")
+    for repeated in recorder.repeated(budget['MAX_REPEATS']):
+        violations.append(f"повтор {repeated['count']} раз: {repeated['sql'][:200]}")
+    return violations
+
+
+def configure_report(config):
+    if not config['REPORT_FILE'] or report_logger.handlers:
+        return
+    handler = RotatingFileHandler(config['REPORT_FILE'], maxBytes=config['REPORT_MAX_BYTES'],
+                                  backupCount=config['REPORT_BACKUP_COUNT'], encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    report_logger.addHandler(handler)
+    report_logger.setLevel(logging.INFO)
+    report_logger.propagate = False
+
+
+# Одна JSON-строка на запрос в ротируемый файл отчёта
+def write_report(url_name, path, recorder, budget, violations):
+    if not report_logger.handlers:
+        return
+    report_logger.info(json.dumps({
+        'time': datetime.now(timezone.utc).isoformat(),
+        'url_name': url_name,
+        'path': path,
+        'queries': recorder.count,
+        'db_time_ms': recorder.duration_ms,
+        'repeated': recorder.repeated(budget['MAX_REPEATS']),
+        'violations': violations,
+    }, ensure_ascii=False))
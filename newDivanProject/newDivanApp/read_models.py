@@ -0,0 +1,116 @@
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .batching import OnCommitBatch
+from .models import Order, OrderExecutor, OrderListRow
+from .search import normalize_search_text
+from .thumbnails import thumbnail_url
+from .versions import bump_table_versions
+
+ROW_FIELDS = [
+    'number', 'status', 'create_date', 'completion_date', 'total_value', 'total_work_cost',
+    'furniture_type', 'work_type', 'description', 'payment_status', 'manager', 'executors', 'search_text',
+]
+
+def _employee_data(employee):
+    return {
+        'full_name': f"{employee.first_name} {employee.last_name}",
+        'avatar_url': employee.avatar.url if employee.avatar else '',
+        'avatar_thumb_url': thumbnail_url(employee.avatar, 48),
+    }
+
+
+def _orders_queryset():
+    return Order.objects.with_payment_status().select_related(
+        'contract__client', 'manager'
+    ).prefetch_related(
+        'technical_specifications',
+        Prefetch('executor_assignments', queryset=OrderExecutor.objects.select_related('employee')),
+    )
+
+
+def build_order_row(order):
+    tech_spec = next(iter(order.technical_specifications.all()), None)
+    contract = order.contract
+    client = contract.client
+
+    return OrderListRow(
+        order=order,
+        number=order.number,
+        status=order.status,
+        create_date=contract.create_date,
+        completion_date=contract.completion_date,
+        total_value=contract.total_value,
+        total_work_cost=contract.total_work_cost,
+        furniture_type=tech_spec.furniture_type1 if tech_spec else '',
+        work_type=tech_spec.work_type1 or '' if tech_spec else '',
+        description=tech_spec.short_descr if tech_spec else '',
+        payment_status=order.payment_status,
+        manager=_employee_data(order.manager) if order.manager else {'full_name': "Нет данных", 'avatar_url': '', 'avatar_thumb_url': ''},
+        executors=[_employee_data(assignment.employee) for assignment in order.executor_assignments.all()],
+        search_text=normalize_search_text(
+            order.number,
+            tech_spec.short_descr if tech_spec else '',
+            tech_spec.full_descr if tech_spec else '',
+            client.last_name, client.first_name, client.middle_name, client.contact_number,
+        ),
+    )
+
+
+# Несохранённые строки для указанных заказов, собранные по исходным таблицам
+def build_order_rows(order_ids):
+    return [build_order_row(order) for order in _orders_queryset().filter(id__in=order_ids)]
+
+
+# Строки списка заказов в том виде, в каком их рисует таблица orders.html
+def format_orders_data(rows):
+    return [{
+        'id': row.order_id,
+        'number': row.number,
+        'create_date': row.create_date.strftime('%d.%m.%Y'),
+        'completion_date': row.completion_date.strftime('%d.%m.%Y'),
+        'total_value': "{:,.2f}".format(row.total_value).replace(",", " ").replace(".", ","),
+        'type': row.get_furniture_type_display(),
+        'description': row.description,
+        'payment_status': row.get_payment_status_display(),
+        'status': row.get_status_display(),
+        'executors': row.executors,
+        'manager': row.manager,
+    } for row in rows]
+
+
+def _save_rows(rows):
+    OrderListRow.objects.bulk_create(rows, update_conflicts=True, unique_fields=['order'], update_fields=ROW_FIELDS)
+    bump_table_versions(OrderListRow)
+
+
+# Пересчёт строк для указанных заказов: фиксированное число запросов на пачку
+def refresh_order_rows(order_ids):
+    order_ids = set(order_ids)
+    if not order_ids:
+        return
+    with transaction.atomic():
+        rows = build_order_rows(order_ids)
+        _save_rows(rows)
+        missing = order_ids - {row.order_id for row in rows}
+        if missing:
+            OrderListRow.objects.filter(order_id__in=missing).delete()
+
+
+def rebuild_order_rows(batch_size=1000):
+    with transaction.atomic():
+        OrderListRow.objects.all().delete()
+        order_ids = list(Order.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(order_ids), batch_size):
+            batch = order_ids[start:start + batch_size]
+            _save_rows([build_order_row(order) for order in _orders_queryset().filter(id__in=batch)])
+    return len(order_ids)
+
+
+# Сигналы только копят id заказов; пересчёт выполняется один раз после коммита транзакции,
+# поэтому сохранение заказа со всеми связанными объектами пересчитывает строку один раз
+_order_refresh = OnCommitBatch(refresh_order_rows, 'order_ids')
+
+
+def schedule_order_refresh(order_ids):
+    _order_refresh.add(order_ids=order_ids)
@@ -0,0 +1,66 @@
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from .models import Department, Employee, JobTitle
+
+REFERENCE_VERSION_KEY = 'reference_data:version'
+MANAGER_POSITION = 'Менеджер'
+WORKER_POSITION = 'Рабочий'
+# Сколько секунд процесс держит загруженные справочники, даже если версия не менялась
+REFERENCE_TIMEOUT = 60
+
+# Справочники держатся в памяти процесса, номер версии - в кеше Django. Сброс виден всем процессам сразу
+# только при общем бэкенде кеша (Redis, Memcached в CACHES). В settings.py CACHES не задан, и у каждого
+# процесса свой LocMemCache: сброс видит только процесс, где он сделан, а остальные перечитают
+# справочники по истечении REFERENCE_TIMEOUT
+_state = {'version': None, 'data': None, 'loaded_at': 0}
+_lock = threading.Lock()
+
+
+# версия - случайный токен, а не счётчик: если ключ вытеснят из кеша, новое значение
+# всё равно не совпадёт со старым и данные перечитаются
+def _current_version():
+    return cache.get_or_set(REFERENCE_VERSION_KEY, lambda: uuid.uuid4().hex, timeout=None)
+
+
+def _load():
+    departments = list(Department.objects.all())
+    positions = list(JobTitle.objects.order_by('pk'))
+    # как и JobTitle.objects.filter(name=...).first(): берётся первая должность с таким названием
+    manager_position = next((p for p in positions if p.name == MANAGER_POSITION), None)
+    worker_position = next((p for p in positions if p.name == WORKER_POSITION), None)
+    roster_ids = [p.id for p in (manager_position, worker_position) if p]
+    roster = list(Employee.objects.filter(position_id__in=roster_ids).order_by('pk')) if roster_ids else []
+    return {
+        'departments': departments,
+        'positions': positions,
+        'managers': [e for e in roster if manager_position and e.position_id == manager_position.id],
+        'workers': [e for e in roster if worker_position and e.position_id == worker_position.id],
+    }
+
+
+# Отделы, должности, менеджеры и рабочие; списки общие для всех запросов и не должны изменяться
+def get_reference_data():
+    version = _current_version()
+    data = _state['data']
+    if data is None or _state['version'] != version or _expired():
+        with _lock:
+            if _state['data'] is None or _state['version'] != version or _expired():
+                # версия прочитана до загрузки: если её сменят во время загрузки, следующий запрос перечитает
+                _state['loaded_at'] = time.monotonic()
+                _state['data'] = _load()
+                _state['version'] = version
+            data = _state['data']
+    return data
+
+
+def _expired():
+    return time.monotonic() - _state['loaded_at'] > REFERENCE_TIMEOUT
+
+
+def invalidate_reference_data():
+    cache.set(REFERENCE_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    _state['data'] = None
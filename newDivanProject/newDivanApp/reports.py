@@ -0,0 +1,154 @@
+from datetime import date
+
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .batching import OnCommitBatch
+from .models import Contract, Employee, Order, RevenueRollup, TechnicalSpecification
+
+# Разрезы отчёта: имя GET-параметра -> поле RevenueRollup
+REPORT_DIMENSIONS = {
+    'month': 'month',
+    'manager': 'manager_id',
+    'source': 'source',
+    'furniture_type': 'furniture_type',
+    'work_type': 'work_type',
+}
+
+# Ключ pg_advisory_xact_lock, под которым пишется сводка
+ROLLUP_LOCK_KEY = 7301
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+# ******** ПОСТРОЕНИЕ СВОДКИ ********* #
+
+# Один GROUP BY по заказам. Тип мебели и работ берутся из первого ТЗ подзапросом,
+# чтобы заказ с несколькими ТЗ не учитывался несколько раз
+def _aggregate(orders):
+    first_spec = TechnicalSpecification.objects.filter(order=OuterRef('pk')).order_by('pk')
+    return (orders
+            .annotate(rollup_month=TruncMonth('contract__create_date'),
+                      rollup_furniture=Coalesce(Subquery(first_spec.values('furniture_type1')[:1]), Value('')),
+                      rollup_work=Coalesce(Subquery(first_spec.values('work_type1')[:1]), Value('')))
+            .values('rollup_month', 'manager_id', 'source', 'rollup_furniture', 'rollup_work')
+            .annotate(order_count=Count('id'), revenue=Sum('contract__total_value'),
+                      work_cost=Sum('contract__total_work_cost'))
+            .order_by())
+
+
+def _rollup_rows(orders):
+    return [RevenueRollup(
+        month=row['rollup_month'], manager_id=row['manager_id'], source=row['source'],
+        furniture_type=row['rollup_furniture'], work_type=row['rollup_work'],
+        order_count=row['order_count'], revenue=row['revenue'] or 0, work_cost=row['work_cost'] or 0,
+    ) for row in _aggregate(orders)]
+
+
+# Пересчёты сводки из разных процессов идут по очереди. Без этого два пересчёта одного месяца в PostgreSQL
+# (READ COMMITTED) удаляют одни и те же старые строки и оба вставляют новые - месяц считается дважды.
+# Блокировка снимается вместе с транзакцией. SQLite и так пускает писателей по одному
+def _lock_rollup():
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [ROLLUP_LOCK_KEY])
+
+
+# Пересчёт указанных месяцев: одна агрегация по их договорам и замена строк этих месяцев
+def refresh_revenue_months(months):
+    months = sorted({month_start(month) for month in months})
+    if not months:
+        return
+    period = Q()
+    for month in months:
+        period |= Q(contract__create_date__gte=month, contract__create_date__lt=next_month(month))
+    with transaction.atomic():
+        _lock_rollup()
+        RevenueRollup.objects.filter(month__in=months).delete()
+        RevenueRollup.objects.bulk_create(_rollup_rows(Order.objects.filter(period)))
+
+
+def rebuild_revenue_rollup():
+    with transaction.atomic():
+        _lock_rollup()
+        RevenueRollup.objects.all().delete()
+        rows = RevenueRollup.objects.bulk_create(_rollup_rows(Order.objects.all()), batch_size=1000)
+    return len(rows)
+
+
+def _refresh_pending(months, contract_ids, order_ids):
+    months = set(months)
+    # удалённые договоры и заказы здесь уже не найдутся: их месяц передаётся сигналом удаления договора
+    if contract_ids:
+        months.update(Contract.objects.filter(pk__in=contract_ids).values_list('create_date', flat=True))
+    if order_ids:
+        months.update(Order.objects.filter(pk__in=order_ids)
+                      .values_list('contract__create_date', flat=True))
+    refresh_revenue_months(month for month in months if month)
+
+
+# Как и schedule_order_refresh, сигналы только копят затронутые месяцы, договоры и заказы;
+# месяцы пересчитываются один раз после коммита
+_revenue_refresh = OnCommitBatch(_refresh_pending, 'months', 'contract_ids', 'order_ids')
+
+
+def schedule_revenue_refresh(months=(), contract_ids=(), order_ids=()):
+    _revenue_refresh.add(months=(month_start(month) for month in months if month),
+                         contract_ids=contract_ids, order_ids=order_ids)
+
+
+# ******** ОТЧЁТ ********* #
+
+def _label(choices, value):
+    return dict(choices).get(value, value or "Не указано")
+
+
+# Сводка в выбранных разрезах за период [start, end] (первые числа месяцев, границы включительно).
+# Читает только строки RevenueRollup и одним запросом - имена менеджеров
+def revenue_report(group_by, start=None, end=None):
+    fields = [REPORT_DIMENSIONS[name] for name in group_by]
+    rollup = RevenueRollup.objects.all()
+    if start:
+        rollup = rollup.filter(month__gte=start)
+    if end:
+        rollup = rollup.filter(month__lte=end)
+    rows = list(rollup.values(*fields)
+                .annotate(order_count=Sum('order_count'), revenue=Sum('revenue'), work_cost=Sum('work_cost'))
+                .order_by(*fields))
+
+    managers = {}
+    if 'manager' in group_by:
+        managers = {pk: f"{last_name} {first_name}" for pk, last_name, first_name in Employee.objects.filter(
+            pk__in={row['manager_id'] for row in rows}).values_list('pk', 'last_name', 'first_name')}
+
+    result = []
+    for row in rows:
+        item = {'order_count': row['order_count'], 'revenue': row['revenue'], 'work_cost': row['work_cost']}
+        if 'month' in group_by:
+            item['month'] = row['month'].strftime('%Y-%m')
+        if 'manager' in group_by:
+            item['manager_id'] = row['manager_id']
+            item['manager'] = managers.get(row['manager_id'], "Не указан")
+        if 'source' in group_by:
+            item['source'] = row['source']
+            item['source_display'] = _label(Order.SOURCE_TYPES, row['source'])
+        if 'furniture_type' in group_by:
+            item['furniture_type'] = row['furniture_type']
+            item['furniture_type_display'] = _label(TechnicalSpecification.FURNITURE_TYPES, row['furniture_type'])
+        if 'work_type' in group_by:
+            item['work_type'] = row['work_type']
+            item['work_type_display'] = _label(TechnicalSpecification.WORK_TYPES, row['work_type'])
+        result.append(item)
+
+    totals = {
+        'order_count': sum(item['order_count'] for item in result),
+        'revenue': sum((item['revenue'] for item in result), 0),
+        'work_cost': sum((item['work_cost'] for item in result), 0),
+    }
+    return {'group_by': list(group_by), 'rows': result, 'totals': totals}
@@ -0,0 +1,114 @@
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import OrderListRow
+
+# Сколько лучших совпадений ранжируется по релевантности; остальные совпадения идут за ними по id
+SEARCH_LIMIT = 500
+
+FTS_TABLE = 'orderlistrow_fts'
+
+
+def normalize_search_text(*parts):
+    text = ' '.join(str(part) for part in parts if part)
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+# Поиск заказов по номеру, описанию ТЗ, имени и телефону клиента.
+# Возвращает id не более limit лучших совпадений, отсортированные по релевантности
+def search_order_ids(query, limit=SEARCH_LIMIT):
+    query = normalize_search_text(query)
+    if not query:
+        return []
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(query, limit)
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(query, limit)
+    return list(OrderListRow.objects.filter(search_text__icontains=query)
+                .order_by('order_id').values_list('order_id', flat=True)[:limit])
+
+
+# Условие на OrderListRow для всех совпадений, без ограничения числа: по нему считаются
+# filtered_count и страницы, а search_order_ids задаёт только порядок лучших
+def order_search_filter(query):
+    query = normalize_search_text(query)
+    if not query:
+        return Q()
+    if connection.vendor == 'postgresql':
+        sql, params = _postgresql_condition(query)
+        table = connection.ops.quote_name(OrderListRow._meta.db_table)
+        return Q(order_id__in=RawSQL(f"SELECT order_id FROM {table} WHERE {sql}", params))
+    if connection.vendor == 'sqlite':
+        match = _sqlite_match(query)
+        if not match:
+            return Q(pk__in=[])
+        return Q(order_id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]))
+    return Q(search_text__icontains=query)
+
+
+# PostgreSQL: полнотекстовый индекс по search_vector и триграммный индекс по search_text.
+# ILIKE и <% (word_similarity) обслуживаются GIN-индексом gin_trgm_ops, поэтому
+# частичный ввод номера ("нд-1") и опечатки находятся без последовательного сканирования
+def _postgresql_condition(query):
+    like = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    sql = """search_vector @@ websearch_to_tsquery('russian', %s)
+           OR search_text ILIKE %s
+           OR %s <%% search_text"""
+    return sql, [query, like, query]
+
+
+def _search_postgresql(query, limit):
+    table = connection.ops.quote_name(OrderListRow._meta.db_table)
+    condition, params = _postgresql_condition(query)
+    sql = f"""
+        SELECT order_id FROM {table}
+        WHERE {condition}
+        ORDER BY ts_rank(search_vector, websearch_to_tsquery('russian', %s))
+               + word_similarity(%s, search_text) DESC, order_id DESC
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [query, query, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+# SQLite: внешний FTS5-индекс поверх таблицы строк, синхронизируется триггерами.
+# Каждое слово запроса ищется как префикс, порядок - по встроенному bm25-рангу
+def _sqlite_match(query):
+    return ' '.join('"{}"*'.format(term) for term in re.findall(r'\w+', query))
+
+
+def _search_sqlite(query, limit):
+    match = _sqlite_match(query)
+    if not match:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s",
+            [match, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+# Поиск сотрудников по Employee.search_key. Подходит строка, где встречается хотя бы одно слово запроса;
+# начало ФИО весит 3, начало фамилии, имени или отчества - 2, совпадение внутри слова - 1.
+# LIKE по search_key на PostgreSQL обслуживается триграммным индексом (миграция 0013)
+def search_employees(queryset, query):
+    terms = normalize_search_text(query).split()
+    if not terms:
+        return queryset, None
+    condition = Q()
+    rank = Value(0)
+    for term in terms:
+        condition |= Q(search_key__contains=term)
+        rank = rank + Case(
+            When(search_key__startswith=term, then=Value(3)),
+            When(search_key__contains=' ' + term, then=Value(2)),
+            When(search_key__contains=term, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    return queryset.filter(condition), rank
@@ -0,0 +1,385 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .models import Client, Contract, Employee, Material, Order, OrderExecutor, PickupDelivery, TechnicalSpecification
+from .read_models import schedule_order_refresh
+from .thumbnails import generate_instance_thumbnails
+from .blobs import add_references
+from .versions import bump_table_versions
+from .reports import schedule_revenue_refresh
+from .changelog import log_changes
+
+
+# ******** СОЗДАНИЕ ЗАКАЗОВ ********* #
+# Заказ передаётся словарём с разделами client, contract, order, specification, material, pickup.
+# Сначала проверяются все заказы, затем весь граф пишется одной транзакцией по одному INSERT на модель.
+
+def _parse_date(value, field, errors, required=False):
+    if not value:
+        if required:
+            errors.append(f"{field}: обязательное поле")
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        errors.append(f"{field}: неверная дата {value!r}")
+
+
+def _parse_decimal(value, field, errors, required=True):
+    if value in (None, ''):
+        if required:
+            errors.append(f"{field}: обязательное поле")
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        errors.append(f"{field}: неверное число {value!r}")
+
+
+# Суммы в целых рублях (IntegerField): дробная часть - ошибка, а не молчаливое отбрасывание копеек.
+# Форма присылает "7500.00", такое значение принимается
+def parse_whole_amount(value, field, errors, required=True):
+    amount = _parse_decimal(value, field, errors, required)
+    if amount is None:
+        return None
+    if not amount.is_finite() or amount != amount.to_integral_value():
+        errors.append(f"{field}: сумма должна быть целой {value!r}")
+        return None
+    return int(amount)
+
+
+def _parse_int(value, field, errors):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        errors.append(f"{field}: неверное число {value!r}")
+
+
+def _parse_id(value, field, errors):
+    if not value:
+        return None
+    return _parse_int(value, field, errors)
+
+
+def _check_choice(value, choices, field, errors, required=True):
+    if not value and not required:
+        return None
+    if value not in dict(choices):
+        errors.append(f"{field}: недопустимое значение {value!r}")
+    return value
+
+
+def order_data_from_post(post, files):
+    executors = post.get('executors', '')
+    work_types = post.get('work_types', '')
+    return {
+        'client': {
+            'full_name': post.get('full_name', ''),
+            'contact_number': post.get('contact_number'),
+            'address': post.get('address'),
+            'comments': post.get('comments'),
+        },
+        'contract': {
+            'num': post.get('contract_num'),
+            'create_date': post.get('create_date'),
+            'completion_date': post.get('completion_date'),
+            'total_value': post.get('total_value'),
+            'payment_type': post.get('payment_type'),
+            'prepayment_share': post.get('prepayment_share'),
+            'prepayment_value': post.get('prepayment_value'),
+            'is_prepayment_paid': post.get('is_prepayment_paid') == 'true',
+            'prepayment_date': post.get('prepayment_date'),
+            'postpayment_value': post.get('postpayment_value'),
+            'is_postpayment_paid': post.get('is_postpayment_paid') == 'true',
+            'postpayment_date': post.get('postpayment_date'),
+            'comments': post.get('comments'),
+        },
+        'order': {
+            'number': post.get('number'),
+            'manager': post.get('manager'),
+            'executors': executors.split(',') if executors else [],
+            'source': post.get('source'),
+        },
+        'specification': {
+            'items_qty': post.get('items_qty'),
+            'short_descr': post.get('short_descr'),
+            'item_type': post.get('item_type'),
+            'furniture_type1': post.get('furniture_type1'),
+            'work_types': work_types.split(',') if work_types else [],
+            'full_descr': post.get('full_descr'),
+            'comments': post.get('technicalspecification_comments'),
+            'photos': [files.get(f'photo{i}') for i in range(1, 5)],
+        },
+        'material': {
+            'name': post.get('material_name'),
+            'in_stock': post.get('stock') == 'true',
+            'cost': post.get('material_cost'),
+            'order_status': post.get('material_order_status'),
+            'order_date': post.get('material_order_date'),
+            'payment_status': post.get('material_payment_status'),
+            'payment_date': post.get('material_payment_date'),
+            'fitting_name': post.get('fitting_name'),
+            'fitting_in_stock': post.get('fitting_in_stock') == 'true',
+            'comments': post.get('material_comments'),
+        },
+        'pickup': {
+            'is_picked': post.get('pickupdelivery_is_picked') == 'true',
+            'pickup_date': post.get('pickupdelivery_pickup_date'),
+            'pickup_time': post.get('pickupdelivery_pickup_time'),
+            'pickup_type': post.get('pickupdelivery_pickup_type'),
+            'pickup_guy': post.get('pickup_guy'),
+            'pickup_comments': post.get('pickupdelivery_pickup_comments'),
+            'is_delivered': post.get('pickupdelivery_is_delivered') == 'true',
+            'delivery_date': post.get('pickupdelivery_delivery_date'),
+            'delivery_time': post.get('pickupdelivery_delivery_time'),
+            'delivery_type': post.get('pickupdelivery_delivery_type'),
+            'delivery_guy': post.get('delivery_guy'),
+            'delivery_comments': post.get('pickupdelivery_delivery_comments'),
+        },
+    }
+
+
+# Проверяет и приводит типы одного заказа. Ссылки на сотрудников остаются id и разрешаются позже разом
+def clean_order_data(data):
+    errors = []
+    client, contract, order = data['client'], data['contract'], data['order']
+    specification, material, pickup = data['specification'], data['material'], data['pickup']
+
+    full_name = (client.get('full_name') or '').split()
+    if len(full_name) < 2:
+        errors.append("full_name: укажите фамилию и имя")
+    if not client.get('contact_number'):
+        errors.append("contact_number: обязательное поле")
+
+    create_date = _parse_date(contract.get('create_date'), 'create_date', errors, required=True)
+    completion_date = _parse_date(contract.get('completion_date'), 'completion_date', errors, required=True)
+    if create_date and completion_date and completion_date < create_date:
+        errors.append("completion_date: дата выполнения раньше даты создания")
+    total_value = _parse_decimal(contract.get('total_value'), 'total_value', errors)
+
+    # повторно выбранный исполнитель остаётся на первом месте; пустые элементы списка ("1,,2") пропускаются
+    executors = list(dict.fromkeys(_parse_int(value, 'executors', errors)
+                                   for value in order.get('executors', []) if str(value).strip()))
+    work_types = specification.get('work_types', [])
+    for work_type in work_types:
+        _check_choice(work_type, TechnicalSpecification.WORK_TYPES, 'work_types', errors)
+    items_qty = _parse_int(specification.get('items_qty'), 'items_qty', errors)
+    if not order.get('number'):
+        errors.append("number: обязательное поле")
+    if not order.get('manager'):
+        errors.append("manager: обязательное поле")
+
+    cleaned = {
+        'client': {
+            'last_name': full_name[0] if full_name else '',
+            'first_name': full_name[1] if len(full_name) > 1 else '',
+            'middle_name': full_name[2] if len(full_name) > 2 else '',
+            'contact_number': client.get('contact_number'),
+            'address': client.get('address'),
+            'comments': client.get('comments'),
+        },
+        'contract': {
+            'num': contract.get('num'),
+            'create_date': create_date,
+            'completion_date': completion_date,
+            'duration': (completion_date - create_date).days if create_date and completion_date else None,
+            'total_value': total_value,
+            'total_work_cost': total_value,
+            'payment_type': _check_choice(contract.get('payment_type'), Contract.PAYMENT_TYPES, 'payment_type', errors),
+            'prepayment_share': _parse_decimal(contract.get('prepayment_share'), 'prepayment_share', errors),
+            'prepayment_value': parse_whole_amount(contract.get('prepayment_value'), 'prepayment_value', errors),
+            'is_prepayment_paid': contract.get('is_prepayment_paid', False),
+            'prepayment_date': _parse_date(contract.get('prepayment_date'), 'prepayment_date', errors),
+            'postpayment_value': parse_whole_amount(contract.get('postpayment_value'), 'postpayment_value', errors),
+            'is_postpayment_paid': contract.get('is_postpayment_paid', False),
+            'postpayment_date': _parse_date(contract.get('postpayment_date'), 'postpayment_date', errors),
+            'comments': contract.get('comments'),
+        },
+        'order': {
+            'number': order.get('number'),
+            'manager': _parse_id(order.get('manager'), 'manager', errors),
+            'executors': executors,
+            'source': _check_choice(order.get('source'), Order.SOURCE_TYPES, 'source', errors),
+        },
+        'specification': {
+            'items_qty': items_qty,
+            'short_descr': specification.get('short_descr'),
+            'item_type': specification.get('item_type'),
+            'furniture_type1': _check_choice(specification.get('furniture_type1'),
+                                             TechnicalSpecification.FURNITURE_TYPES, 'furniture_type1', errors),
+            'work_type1': work_types[0] if len(work_types) > 0 else None,
+            'work_type2': work_types[1] if len(work_types) > 1 else None,
+            'full_descr': specification.get('full_descr') or '',
+            'comments': specification.get('comments'),
+            'photos': (list(specification.get('photos') or []) + [None] * 4)[:4],
+        },
+        'material': {
+            'name': material.get('name'),
+            'in_stock': material.get('in_stock', False),
+            'cost': _parse_decimal(material.get('cost'), 'material_cost', errors, required=False),
+            'order_status': _check_choice(material.get('order_status') or 'not_ordered', Material.ORDER_STATUS,
+                                          'material_order_status', errors),
+            'order_date': _parse_date(material.get('order_date'), 'material_order_date', errors),
+            'payment_status': _check_choice(material.get('payment_status') or 'unpaid', Material.PAYMENT_STATUS,
+                                            'material_payment_status', errors),
+            'payment_date': _parse_date(material.get('payment_date'), 'material_payment_date', errors),
+            'fitting_name': material.get('fitting_name'),
+            'fitting_in_stock': material.get('fitting_in_stock', False),
+            'comments': material.get('comments'),
+        },
+        'pickup': {
+            'is_picked': pickup.get('is_picked', False),
+            'pickup_date': _parse_date(pickup.get('pickup_date'), 'pickup_date', errors),
+            'pickup_time': pickup.get('pickup_time') or None,
+            'pickup_type': _check_choice(pickup.get('pickup_type'), PickupDelivery.PICKUP_TYPES, 'pickup_type', errors),
+            'pickup_guy': _parse_id(pickup.get('pickup_guy'), 'pickup_guy', errors),
+            'pickup_comments': pickup.get('pickup_comments'),
+            'is_delivered': pickup.get('is_delivered', False),
+            'delivery_date': _parse_date(pickup.get('delivery_date'), 'delivery_date', errors),
+            'delivery_time': pickup.get('delivery_time') or None,
+            'delivery_type': _check_choice(pickup.get('delivery_type'), PickupDelivery.DELIVERY_TYPES,
+                                           'delivery_type', errors),
+            'delivery_guy': _parse_id(pickup.get('delivery_guy'), 'delivery_guy', errors),
+            'delivery_comments': pickup.get('delivery_comments'),
+        },
+    }
+    if errors:
+        raise ValidationError(errors)
+    return cleaned
+
+
+# Номер заказа уникален: повторы внутри пачки и уже занятые номера - ошибки проверки, а не IntegrityError при записи.
+# exclude_order_id - редактируемый заказ, его собственный номер занятым не считается
+def order_number_errors(numbers, exclude_order_id=None):
+    errors, seen = [], set()
+    for number in numbers:
+        if number in seen:
+            errors.append(f"number: номер {number} повторяется")
+        seen.add(number)
+    taken = Order.objects.filter(number__in=seen)
+    if exclude_order_id is not None:
+        taken = taken.exclude(pk=exclude_order_id)
+    errors.extend(f"number: заказ с номером {number} уже существует"
+                  for number in sorted(taken.values_list('number', flat=True)))
+    return errors
+
+
+def _employee_ids(cleaned):
+    ids = {cleaned['order']['manager'], cleaned['pickup']['pickup_guy'], cleaned['pickup']['delivery_guy']}
+    ids.update(cleaned['order']['executors'])
+    ids.discard(None)
+    return ids
+
+
+# Создаёт заказы целиком: один запрос за сотрудниками и по одному bulk_create на каждую модель
+def create_orders(orders_data):
+    errors = []
+    cleaned_orders = []
+    for index, data in enumerate(orders_data):
+        try:
+            cleaned_orders.append(clean_order_data(data))
+        except ValidationError as error:
+            errors.extend(f"заказ {index + 1}: {message}" for message in error.messages)
+    if errors:
+        raise ValidationError(errors)
+    errors = order_number_errors([cleaned['order']['number'] for cleaned in cleaned_orders])
+    if errors:
+        raise ValidationError(errors)
+
+    employee_ids = set().union(*[_employee_ids(cleaned) for cleaned in cleaned_orders]) if cleaned_orders else set()
+    employees = Employee.objects.in_bulk(employee_ids)
+    missing = employee_ids - set(employees)
+    if missing:
+        raise ValidationError([f"сотрудник с id {employee_id} не найден" for employee_id in sorted(missing)])
+
+    with transaction.atomic():
+        clients = Client.objects.bulk_create([Client(**cleaned['client']) for cleaned in cleaned_orders])
+        contracts = Contract.objects.bulk_create([
+            Contract(client=client, **cleaned['contract']) for client, cleaned in zip(clients, cleaned_orders)
+        ])
+
+        orders = [
+            Order(number=cleaned['order']['number'], contract=contract, manager=employees[cleaned['order']['manager']],
+                  source=cleaned['order']['source'], status='registered')
+            for contract, cleaned in zip(contracts, cleaned_orders)
+        ]
+        try:
+            Order.objects.bulk_create(orders)
+        except IntegrityError:
+            # номер успели занять параллельно, между проверкой и записью; транзакция откатывается целиком
+            raise ValidationError(["number: номер заказа уже существует"])
+        executors = OrderExecutor.objects.bulk_create([
+            OrderExecutor(order=order, employee=employees[employee_id], position=position)
+            for order, cleaned in zip(orders, cleaned_orders)
+            for position, employee_id in enumerate(cleaned['order']['executors'])
+        ])
+
+        specifications, materials, pickups = [], [], []
+        for order, cleaned in zip(orders, cleaned_orders):
+            specification = dict(cleaned['specification'])
+            photos = specification.pop('photos')
+            specifications.append(TechnicalSpecification(
+                order=order, photo1=photos[0], photo2=photos[1], photo3=photos[2], photo4=photos[3], **specification,
+            ))
+            materials.append(Material(order=order, **cleaned['material']))
+            pickup = dict(cleaned['pickup'])
+            pickup['pickup_guy'] = employees.get(pickup['pickup_guy'])
+            pickup['delivery_guy'] = employees.get(pickup['delivery_guy'])
+            pickups.append(PickupDelivery(order=order, **pickup))
+        TechnicalSpecification.objects.bulk_create(specifications)
+        Material.objects.bulk_create(materials)
+        PickupDelivery.objects.bulk_create(pickups)
+
+        # bulk_create не отправляет post_save, поэтому производные данные обновляются явно
+        bump_table_versions(Client, Contract, Order, OrderExecutor, TechnicalSpecification, Material, PickupDelivery)
+        for created in (contracts, orders, executors, specifications, materials, pickups):
+            log_changes(created, 'create')
+        schedule_order_refresh([order.id for order in orders])
+        schedule_revenue_refresh(contract_ids=[contract.id for contract in contracts])
+        add_references([getattr(specification, f'photo{i}').name
+                        for specification in specifications for i in range(1, 5)])
+        for specification in specifications:
+            if any(getattr(specification, f'photo{i}') for i in range(1, 5)):
+                transaction.on_commit(lambda specification=specification: generate_instance_thumbnails(specification))
+    return orders
+
+
+def create_order(data):
+    return create_orders([data])[0]
+
+
+# ******** ИСПОЛНИТЕЛИ ЗАКАЗА ********* #
+
+# Ошибки для id несуществующих сотрудников - одним запросом
+def employee_id_errors(employee_ids):
+    found = set(Employee.objects.filter(pk__in=employee_ids).values_list('pk', flat=True))
+    return [f"сотрудник с id {employee_id} не найден" for employee_id in employee_ids if employee_id not in found]
+
+
+# Заменяет исполнителей заказа списком id в указанном порядке: один запрос проверяет сотрудников,
+# назначения, оставшиеся на своём месте, не трогаются, новые пишутся одним INSERT
+def set_order_executors(order, employee_ids, role='executor'):
+    employee_ids = list(dict.fromkeys(employee_ids))
+    errors = employee_id_errors(employee_ids)
+    if errors:
+        raise ValidationError(errors)
+
+    wanted = {(employee_id, position) for position, employee_id in enumerate(employee_ids)}
+    with transaction.atomic():
+        current = {(assignment.employee_id, assignment.position): assignment.pk
+                   for assignment in order.executor_assignments.filter(role=role)}
+        stale = [pk for key, pk in current.items() if key not in wanted]
+        if stale:
+            # удаление отправляет post_delete по каждой строке: журнал и строка списка обновятся сигналами
+            OrderExecutor.objects.filter(pk__in=stale).delete()
+        created = OrderExecutor.objects.bulk_create([
+            OrderExecutor(order=order, employee_id=employee_id, role=role, position=position)
+            for employee_id, position in sorted(wanted - set(current), key=lambda key: key[1])
+        ])
+        if created:
+            bump_table_versions(OrderExecutor)
+            log_changes(created, 'create')
+            schedule_order_refresh([order.pk])
@@ -0,0 +1,212 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, post_init
+from django.dispatch import receiver
+
+from .models import (Order, Contract, TechnicalSpecification, PickupDelivery, Employee, Client, Activity, JobTitle,
+                     Department, Firm, Material, OrderExecutor)
+from .read_models import schedule_order_refresh
+from .thumbnails import IMAGE_FIELDS, generate_instance_thumbnails
+from .blobs import add_references, release_references
+from .access import invalidate_employee_cache
+from .reference_data import invalidate_reference_data
+from .versions import bump_table_versions
+from .reports import schedule_revenue_refresh
+from .changelog import LOGGED_MODELS, log_change
+
+
+# ******** ПОДДЕРЖКА OrderListRow В АКТУАЛЬНОМ СОСТОЯНИИ ********* #
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, **kwargs):
+    schedule_order_refresh([instance.id])
+
+
+@receiver([post_save, post_delete], sender=Contract)
+def contract_changed(sender, instance, **kwargs):
+    schedule_order_refresh(Order.objects.filter(contract_id=instance.id).values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=TechnicalSpecification)
+@receiver([post_save, post_delete], sender=PickupDelivery)
+@receiver([post_save, post_delete], sender=OrderExecutor)
+def order_part_changed(sender, instance, **kwargs):
+    schedule_order_refresh([instance.order_id])
+
+
+# имя и аватар сотрудника хранятся в строках заказов, где он менеджер или исполнитель
+@receiver(post_save, sender=Employee)
+def employee_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    refresh_employee_orders(instance.id)
+
+
+def refresh_employee_orders(employee_id):
+    # два индексных поиска вместо OR по JOIN-у
+    schedule_order_refresh(
+        list(Order.objects.filter(manager_id=employee_id).values_list('id', flat=True))
+        + list(OrderExecutor.objects.filter(employee_id=employee_id).values_list('order_id', flat=True))
+    )
+
+
+# ФИО и телефон клиента входят в поисковый текст строки заказа
+@receiver(post_save, sender=Client)
+def client_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    schedule_order_refresh(Order.objects.filter(contract__client_id=instance.id).values_list('id', flat=True))
+
+
+# ******** СВОДКА ВЫРУЧКИ (RevenueRollup) ********* #
+
+# прежние значения нужны, чтобы пересчитать и месяц, из которого договор или заказ ушёл
+@receiver(post_init, sender=Contract)
+def remember_contract_month(sender, instance, **kwargs):
+    instance._rollup_create_date = instance.__dict__.get('create_date')
+
+
+@receiver(post_init, sender=Order)
+def remember_order_contract(sender, instance, **kwargs):
+    instance._rollup_contract_id = instance.__dict__.get('contract_id')
+
+
+@receiver([post_save, post_delete], sender=Contract)
+def revenue_contract_changed(sender, instance, **kwargs):
+    schedule_revenue_refresh(months=[instance.create_date, getattr(instance, '_rollup_create_date', None)])
+
+
+@receiver([post_save, post_delete], sender=Order)
+def revenue_order_changed(sender, instance, **kwargs):
+    schedule_revenue_refresh(contract_ids=[instance.contract_id, getattr(instance, '_rollup_contract_id', None)])
+
+
+@receiver([post_save, post_delete], sender=TechnicalSpecification)
+def revenue_specification_changed(sender, instance, **kwargs):
+    schedule_revenue_refresh(order_ids=[instance.order_id])
+
+
+# ******** СБРОС КЕША ТЕКУЩЕГО СОТРУДНИКА (request.employee) ********* #
+
+@receiver([post_save, post_delete], sender=Employee)
+@receiver([post_save, post_delete], sender=JobTitle)
+@receiver([post_save, post_delete], sender=Department)
+def employee_cache_source_changed(sender, **kwargs):
+    # сразу - чтобы этот же запрос не прочитал старую запись, после коммита - чтобы параллельный
+    # запрос не успел закешировать данные, прочитанные до коммита
+    invalidate_employee_cache()
+    transaction.on_commit(invalidate_employee_cache)
+
+
+# ******** СБРОС СПРАВОЧНИКОВ: ОТДЕЛЫ, ДОЛЖНОСТИ, СПИСКИ МЕНЕДЖЕРОВ И РАБОЧИХ ********* #
+
+@receiver([post_save, post_delete], sender=Employee)
+@receiver([post_save, post_delete], sender=JobTitle)
+@receiver([post_save, post_delete], sender=Department)
+def reference_data_changed(sender, **kwargs):
+    invalidate_reference_data()
+    transaction.on_commit(invalidate_reference_data)
+
+
+# ******** МИНИАТЮРЫ ЗАГРУЖЕННЫХ ИЗОБРАЖЕНИЙ ********* #
+
+# до сохранения новый файл ещё не записан в хранилище (_committed=False) - так отличаем загрузку от пересохранения
+@receiver(pre_save, sender=Employee)
+@receiver(pre_save, sender=TechnicalSpecification)
+@receiver(pre_save, sender=Activity)
+def remember_uploaded_images(sender, instance, **kwargs):
+    instance._uploaded_images = [
+        field_name for field_name in IMAGE_FIELDS[sender.__name__]
+        if getattr(instance, field_name) and not getattr(instance, field_name)._committed
+    ]
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_save, sender=TechnicalSpecification)
+@receiver(post_save, sender=Activity)
+def build_uploaded_thumbnails(sender, instance, **kwargs):
+    field_names = getattr(instance, '_uploaded_images', None)
+    if field_names:
+        instance._uploaded_images = []
+        transaction.on_commit(lambda: _build_thumbnails(instance, field_names))
+
+
+def _build_thumbnails(instance, field_names):
+    created = generate_instance_thumbnails(instance, field_names)
+    # строки заказов пересчитаны раньше и хранят адрес оригинала аватара, теперь есть миниатюра
+    if created and isinstance(instance, Employee):
+        refresh_employee_orders(instance.id)
+
+
+# ******** СЧЁТЧИКИ ССЫЛОК НА ФАЙЛЫ ИЗОБРАЖЕНИЙ ********* #
+
+def _stored_name(value):
+    return getattr(value, 'name', value) or ''
+
+
+# запоминаем имена файлов при загрузке строки; отложенные (.only/.defer) поля не трогаем,
+# чтобы не вызвать лишний запрос
+@receiver(post_init, sender=Employee)
+@receiver(post_init, sender=TechnicalSpecification)
+@receiver(post_init, sender=Activity)
+def remember_image_names(sender, instance, **kwargs):
+    instance._image_names = {
+        field_name: _stored_name(instance.__dict__[field_name])
+        for field_name in IMAGE_FIELDS[sender.__name__] if field_name in instance.__dict__
+    }
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_save, sender=TechnicalSpecification)
+@receiver(post_save, sender=Activity)
+def count_image_references(sender, instance, created, **kwargs):
+    added, released = [], []
+    for field_name in IMAGE_FIELDS[sender.__name__]:
+        if field_name not in instance.__dict__:
+            continue
+        old_name = '' if created else instance._image_names.get(field_name, '')
+        new_name = _stored_name(instance.__dict__[field_name])
+        if old_name != new_name:
+            added.append(new_name)
+            released.append(old_name)
+        instance._image_names[field_name] = new_name
+    add_references(added)
+    release_references(released)
+
+
+@receiver(post_delete, sender=Employee)
+@receiver(post_delete, sender=TechnicalSpecification)
+@receiver(post_delete, sender=Activity)
+def release_image_references(sender, instance, **kwargs):
+    release_references(instance._image_names.values())
+
+
+# ******** ВЕРСИИ ТАБЛИЦ (ETag списков заказов и сотрудников) ********* #
+
+VERSIONED_MODELS = [Order, OrderExecutor, Contract, Client, Firm, TechnicalSpecification, Material, PickupDelivery,
+                    Activity, Employee, JobTitle, Department]
+
+
+def table_changed(sender, **kwargs):
+    bump_table_versions(sender)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(table_changed, sender=model, dispatch_uid=f'table_version_save_{model.__name__}')
+    post_delete.connect(table_changed, sender=model, dispatch_uid=f'table_version_delete_{model.__name__}')
+
+
+# ******** ЖУРНАЛ ИЗМЕНЕНИЙ (ChangeLogEntry) ********* #
+
+# post_save выполняется внутри транзакции ChangeLoggedModel.save(), post_delete - внутри транзакции удаления,
+# поэтому запись журнала фиксируется только вместе с изменением
+def log_saved(sender, instance, created, **kwargs):
+    log_change(instance, 'create' if created else 'update')
+
+
+def log_deleted(sender, instance, **kwargs):
+    log_change(instance, 'delete')
+
+
+for model in LOGGED_MODELS:
+    post_save.connect(log_saved, sender=model, dispatch_uid=f'change_log_save_{model.__name__}')
+    post_delete.connect(log_deleted, sender=model, dispatch_uid=f'change_log_delete_{model.__name__}')
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_ROOT = 'blobs'
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(BLOB_ROOT + '/')
+
+
+# Хранилище с адресацией по содержимому: имя файла - sha256 его содержимого,
+# поэтому повторная загрузка той же картинки не создаёт новый файл на диске.
+# blobs/a9/a1/a9a1079c...e3.jpg
+@deconstructible(path='newDivanApp.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+
+    def blob_name(self, digest, extension):
+        return posixpath.join(BLOB_ROOT, digest[:2], digest[2:4], digest + extension)
+
+    # имя определяется содержимым, суффиксы для занятых имён не нужны
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        tmp_dir = self.path(posixpath.join(BLOB_ROOT, 'tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        # хеш считается в том же проходе, в котором загрузка пишется во временный файл
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+
+            name = self.blob_name(digest.hexdigest(), extension)
+            full_path = self.path(name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if os.path.exists(full_path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, full_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+
+media_storage = ContentAddressedStorage()
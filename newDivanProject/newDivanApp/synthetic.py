@@ -0,0 +1,225 @@
+import random
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import (Activity, Client, Contract, Department, Employee, Firm, JobTitle, Material, Order, OrderExecutor,
+                     PickupDelivery, TechnicalSpecification)
+from .read_models import rebuild_order_rows
+from .reports import rebuild_revenue_rollup
+from .versions import bump_table_versions
+from .changelog import log_changes
+
+FIRST_NAMES = ["Иван", "Анна", "Сергей", "Мария", "Алексей", "Ольга", "Дмитрий", "Елена", "Павел", "Наталья"]
+LAST_NAMES = ["Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев", "Козлов", "Новиков", "Морозов"]
+MIDDLE_NAMES = ["Иванович", "Петрович", "Сергеевич", "Алексеевич", "Дмитриевич", "Павлович"]
+STREETS = ["Ленина", "Мира", "Садовая", "Невский пр.", "Гагарина", "Советская", "Лесная", "Школьная"]
+ITEMS = ["диван", "кресло", "стул", "шкаф", "кровать", "пуф", "комод", "банкетка"]
+MATERIALS = ["Велюр", "Рогожка", "Экокожа", "Шенилл", "Микровелюр", "ЛДСП", "МДФ", "Массив дуба"]
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+class SyntheticDataGenerator:
+    # Доли и распределения подобраны по реальным данным производства
+    ORDER_SOURCES = [('site', 50), ('recommendation', 30), ('returning_customer', 20)]
+    FURNITURE_TYPES = [('soft', 70), ('cabinet', 30)]
+    WORK_TYPES = [('reupholster', 45), ('restoration', 25), ('create', 20), ('new_build', 10)]
+    EMPLOYEE_STATUSES = [('working', 85), ('not_working', 10), ('probation', 5)]
+    FIRM_SHARE = 0.1
+
+    def __init__(self, orders, seed=0, batch_size=2000, today=None, username=None, password=None, stdout=None):
+        self.orders = orders
+        self.username = username
+        self.password = password
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.today = today or date.today()
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def generate(self):
+        with transaction.atomic():
+            # Номера продолжают уже существующие, чтобы повторный запуск не давал дублей
+            first_number = Order.objects.count()
+            self.create_staff()
+            for start in range(0, self.orders, self.batch_size):
+                self.create_orders(first_number + start, min(self.batch_size, self.orders - start))
+                self.log(f"Заказов создано: {min(start + self.batch_size, self.orders)} из {self.orders}")
+            bump_table_versions(Client, Firm, Contract, Order, OrderExecutor, TechnicalSpecification, Material,
+                                PickupDelivery, Activity, Employee, JobTitle, Department)
+        # bulk_create не отправляет сигналы, поэтому производные данные пересобираются целиком
+        rebuild_order_rows()
+        rebuild_revenue_rollup()
+
+    def person(self):
+        return {
+            'first_name': self.rng.choice(FIRST_NAMES),
+            'last_name': self.rng.choice(LAST_NAMES),
+            'middle_name': self.rng.choice(MIDDLE_NAMES),
+        }
+
+    def create_staff(self):
+        rng = self.rng
+        departments = {
+            name: Department.objects.create(name=name)
+            for name in ["Производство", "Продажи", "Логистика"]
+        }
+        positions = {
+            'Менеджер': JobTitle.objects.create(name='Менеджер', access_lvl=4, min_salary=60000, max_salary=120000),
+            'Рабочий': JobTitle.objects.create(name='Рабочий', access_lvl=1),
+            'Курьер': JobTitle.objects.create(name='Курьер', access_lvl=1, min_salary=40000, max_salary=60000),
+        }
+
+        total = max(20, self.orders // 200)
+        staff = []
+        for i in range(total):
+            role = _weighted(rng, [('Менеджер', 10), ('Рабочий', 80), ('Курьер', 10)])
+            department = {'Менеджер': "Продажи", 'Рабочий': "Производство", 'Курьер': "Логистика"}[role]
+            status = _weighted(rng, self.EMPLOYEE_STATUSES)
+            employment_date = self.today - timedelta(days=rng.randint(30, 3000))
+            piecework = role == 'Рабочий' and rng.random() < 0.8
+            staff.append(Employee(
+                position=positions[role], department=departments[department], status=status,
+                employment_date=employment_date,
+                termination_date=employment_date + timedelta(days=rng.randint(30, 600)) if status == 'not_working' else None,
+                citizenship="РФ", residence_address=f"ул. {rng.choice(STREETS)}, д. {rng.randint(1, 120)}",
+                passport_series=f"{rng.randint(1000, 9999)}", passport_number=f"{rng.randint(100000, 999999)}",
+                passport_issued_by="ОВД", passport_issue_date=employment_date - timedelta(days=rng.randint(365, 5000)),
+                type_salary='not_fixed' if piecework else 'fixed',
+                salary=None if piecework else rng.randrange(40000, 120000, 5000),
+                **self.person(),
+            ))
+        if self.username:
+            # Учётная запись менеджера для входа в систему при бенчмарках
+            manager = next((e for e in staff if e.position_id == positions['Менеджер'].id), staff[0])
+            manager.user = User.objects.create_user(self.username, password=self.password, is_staff=True)
+        for employee in staff:
+            # bulk_create не вызывает save(), где заполняется ключ поиска
+            employee.search_key = employee.build_search_key()
+        Employee.objects.bulk_create(staff)
+        log_changes(staff, 'create')
+
+        self.managers = [e for e in staff if e.position_id == positions['Менеджер'].id] or staff[:1]
+        self.workers = [e for e in staff if e.position_id == positions['Рабочий'].id] or staff[:1]
+        self.couriers = [e for e in staff if e.position_id == positions['Курьер'].id] or self.workers
+
+    def order_status(self, create_date, completion_date):
+        if completion_date < self.today - timedelta(days=14):
+            return _weighted(self.rng, [('delivered', 70), ('closed', 25), ('suspended', 5)])
+        if create_date > self.today - timedelta(days=7):
+            return _weighted(self.rng, [('registered', 50), ('to_pickup', 30), ('is_picked', 20)])
+        return _weighted(self.rng, [('to_do', 30), ('in_progress', 40), ('in_review', 15), ('to_deliver', 15)])
+
+    def create_orders(self, offset, count):
+        rng = self.rng
+        clients = Client.objects.bulk_create([
+            Client(contact_number=f"+79{rng.randint(100000000, 999999999)}",
+                   address=f"г. Санкт-Петербург, ул. {rng.choice(STREETS)}, д. {rng.randint(1, 120)}",
+                   **self.person())
+            for _ in range(count)
+        ])
+        firm_indexes = [i for i in range(count) if rng.random() < self.FIRM_SHARE]
+        firms = dict(zip(firm_indexes, Firm.objects.bulk_create([
+            Firm(contact=clients[i], short_name=f"ООО Фирма {offset + i}", full_name=f"ООО \"Фирма {offset + i}\"",
+                 INN=f"{rng.randint(10 ** 9, 10 ** 10 - 1)}", contact_number=clients[i].contact_number)
+            for i in firm_indexes
+        ])))
+
+        contracts = []
+        for i, client in enumerate(clients):
+            create_date = self.today - timedelta(days=rng.randint(0, 3 * 365))
+            duration = rng.randint(14, 60)
+            total_value = Decimal(rng.randrange(5000, 300000, 500))
+            prepayment_share = Decimal(rng.choice([30, 50, 70]))
+            prepayment_value = int(total_value * prepayment_share / 100)
+            completion_date = create_date + timedelta(days=duration)
+            finished = completion_date < self.today
+            contracts.append(Contract(
+                num=f"Д-{offset + i + 1}", client=client, firm=firms.get(i), create_date=create_date,
+                completion_date=completion_date, duration=duration, total_value=total_value,
+                total_work_cost=(total_value * Decimal('0.6')).quantize(Decimal('1')),
+                payment_type=rng.choice(['cash', 'card', 'transaction']),
+                prepayment_share=prepayment_share, prepayment_value=prepayment_value,
+                is_prepayment_paid=finished or rng.random() < 0.8,
+                prepayment_date=create_date + timedelta(days=rng.randint(0, 3)),
+                postpayment_value=int(total_value) - prepayment_value,
+                is_postpayment_paid=finished and rng.random() < 0.95,
+                postpayment_date=completion_date if finished else None,
+            ))
+        Contract.objects.bulk_create(contracts)
+
+        orders, order_executors = [], []
+        for i, contract in enumerate(contracts):
+            order_executors.append(rng.sample(self.workers, min(len(self.workers), rng.choice([1, 1, 2, 2, 3]))))
+            orders.append(Order(
+                number=f"НД-{offset + i + 1}", contract=contract, manager=rng.choice(self.managers),
+                source=_weighted(rng, self.ORDER_SOURCES),
+                status=self.order_status(contract.create_date, contract.completion_date),
+            ))
+        Order.objects.bulk_create(orders)
+        assignments = OrderExecutor.objects.bulk_create([
+            OrderExecutor(order=order, employee=executor, position=position)
+            for order, executors in zip(orders, order_executors) for position, executor in enumerate(executors)
+        ])
+
+        tech_specs, materials, pickups, activities = [], [], [], []
+        for order, executors in zip(orders, order_executors):
+            contract = order.contract
+            item = rng.choice(ITEMS)
+            work_type = _weighted(rng, self.WORK_TYPES)
+            tech_specs.append(TechnicalSpecification(
+                order=order, items_qty=_weighted(rng, [(1, 70), (2, 20), (3, 7), (6, 3)]),
+                short_descr=f"{item.capitalize()}: {dict(TechnicalSpecification.WORK_TYPES)[work_type].lower()}",
+                full_descr=f"{dict(TechnicalSpecification.WORK_TYPES)[work_type]} ({item}), материал "
+                           f"{rng.choice(MATERIALS).lower()}",
+                work_type1=work_type, furniture_type1=_weighted(rng, self.FURNITURE_TYPES), item_type=item,
+            ))
+            for _ in range(rng.randint(1, 3)):
+                materials.append(Material(
+                    order=order, name=rng.choice(MATERIALS), in_stock=rng.random() < 0.6,
+                    cost=Decimal(rng.randrange(500, 20000, 100)),
+                    order_status=rng.choice(['not_ordered', 'ordered']),
+                    payment_status=rng.choice(['paid', 'unpaid', 'partial']),
+                ))
+            is_pickup = rng.random() < 0.6
+            is_delivery = rng.random() < 0.7
+            delivered = order.status == 'delivered'
+            pickups.append(PickupDelivery(
+                order=order, pickup_type='pickup' if is_pickup else 'self_delivery',
+                is_picked=order.status not in ('registered', 'to_pickup'),
+                pickup_date=contract.create_date + timedelta(days=rng.randint(0, 5)),
+                pickup_time=time(rng.randint(9, 19), rng.choice([0, 30])) if is_pickup else None,
+                pickup_guy=rng.choice(self.couriers) if is_pickup else None,
+                delivery_type='delivery' if is_delivery else 'self_delivery', is_delivered=delivered,
+                delivery_date=contract.completion_date if delivered or order.status == 'to_deliver' else None,
+                delivery_time=time(rng.randint(9, 19), rng.choice([0, 30])) if is_delivery else None,
+                delivery_guy=rng.choice(self.couriers) if is_delivery else None,
+            ))
+            for executor in executors:
+                closed = order.status in ('closed', 'delivered', 'to_deliver')
+                date_start = contract.create_date + timedelta(days=rng.randint(1, 7))
+                activities.append(Activity(
+                    order=order, employee=executor, activity_descr=tech_specs[-1].short_descr,
+                    status='closed_positive' if closed else _weighted(
+                        rng, [('backlog', 20), ('to_do', 25), ('in_progress', 35), ('in_review', 15),
+                              ('needs_rework', 5)]),
+                    date_start=date_start, date_end=contract.completion_date if closed else None,
+                    total_work_cost=Decimal(rng.randrange(1000, 30000, 500)),
+                    is_paid=closed and rng.random() < 0.9,
+                    payment_date=contract.completion_date if closed else None,
+                ))
+        TechnicalSpecification.objects.bulk_create(tech_specs)
+        Material.objects.bulk_create(materials)
+        PickupDelivery.objects.bulk_create(pickups)
+        Activity.objects.bulk_create(activities)
+        for created in (contracts, orders, assignments, tech_specs, materials, pickups, activities):
+            log_changes(created, 'create')
@@ -0,0 +1,12 @@
+from django import template
+
+from ..thumbnails import thumbnail_url
+
+register = template.Library()
+
+
+# {{ employee.avatar|thumbnail:48 }} или {{ spec.photo1|thumbnail:"320,jpeg" }}
+@register.filter
+def thumbnail(fieldfile, arg=48):
+    size, _, fmt = str(arg).partition(',')
+    return thumbnail_url(fieldfile, int(size), fmt or 'webp')
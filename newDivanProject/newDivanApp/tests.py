@@ -1,3 +1,1350 @@
-from django.test import TestCase
+import base64
+import json
+import shutil
+import tempfile
+import zipfile
+from datetime import date, time, timedelta
+from decimal import Decimal
+from io import BytesIO
+from time import monotonic
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from asgiref.sync import async_to_sync, sync_to_async
+from PIL import Image
+
+from . import urls
+from .concurrency import gather_queries
+from .models import (Activity, ChangeLogEntry, Client, Contract, Department, Employee, JobTitle, Material,
+                     MediaBlob, Order, OrderExecutor, OrderListRow, PayrollEntry, PickupDelivery, RevenueRollup,
+                     TechnicalSpecification)
+from .payroll import close_payroll
+from .board import COLUMN_LIMITS, load_board, load_column
+from .changelog import changes_since, log_changes
+from .dispatch import address_zone, plan_day
+from .live_updates import RESET, Broadcaster, build_batch
+from .querybudget import QueryRecorder, budget_for
+from .read_models import ROW_FIELDS, rebuild_order_rows
+from .reference_data import REFERENCE_TIMEOUT, get_reference_data, invalidate_reference_data
+from .reports import rebuild_revenue_rollup, refresh_revenue_months
+from .search import search_order_ids
+from .services import create_orders, order_data_from_post, set_order_executors
+from .versions import bump_table_versions
+from .thumbnails import THUMBNAIL_FORMATS, THUMBNAIL_SIZES, thumbnail_name, thumbnail_url
+
+# Маршруты, которые нельзя прогонять обычным GET
+SKIP_ROUTES = {
+    'logout',    # разлогинивает тестового пользователя
+    'live_events',  # бесконечный поток событий; проверяется в LiveUpdatesTests
+}
+
+# GET-параметры для маршрутов, которым без них нечего отдавать
+ROUTE_PARAMS = {
+    'get_order_data': {'order_number': "НД-0"},
+}
+
+SEED_ORDERS = 20
+
+
+def seed_database(orders=SEED_ORDERS):
+    department = Department.objects.create(name="Производство")
+    manager_position = JobTitle.objects.create(name='Менеджер', access_lvl=4)
+    worker_position = JobTitle.objects.create(name='Рабочий', access_lvl=1)
+    employee_data = dict(
+        department=department, status='working', employment_date=date(2024, 1, 1), citizenship="РФ",
+        residence_address="Москва", passport_series="4500", passport_number="123456", passport_issued_by="ОВД",
+        passport_issue_date=date(2020, 1, 1), type_salary='fixed', salary=50000,
+    )
+    user = User.objects.create_user('manager', password='password', is_staff=True)
+    manager = Employee.objects.create(user=user, first_name="Иван", last_name="Петров", position=manager_position,
+                                      **employee_data)
+    workers = [
+        Employee.objects.create(first_name=f"Рабочий{i}", last_name="Сидоров", position=worker_position,
+                                **employee_data)
+        for i in range(3)
+    ]
+
+    for i in range(orders):
+        client = Client.objects.create(first_name="Анна", last_name=f"Клиент{i}", contact_number=f"+7900{i:07d}")
+        contract = Contract.objects.create(
+            num=f"Д-{i}", client=client, create_date=date(2024, 1 + i % 12, 1), completion_date=date(2024, 6, 1 + i),
+            duration=30, total_value=Decimal(10000 + i), total_work_cost=Decimal(5000), prepayment_share=Decimal(50),
+            prepayment_value=5000, postpayment_value=5000, is_prepayment_paid=i % 2 == 0,
+        )
+        order = Order.objects.create(
+            number=f"НД-{i}", contract=contract, manager=manager, source='site',
+            status=['registered', 'to_do', 'in_progress', 'closed'][i % 4],
+        )
+        OrderExecutor.objects.create(order=order, employee=workers[i % 3], position=0)
+        OrderExecutor.objects.create(order=order, employee=workers[(i + 1) % 3], position=1)
+        TechnicalSpecification.objects.create(order=order, items_qty=1, short_descr=f"Диван {i}",
+                                              work_type1='reupholster', furniture_type1='soft', item_type="диван")
+        Material.objects.create(order=order, name="Ткань")
+        PickupDelivery.objects.create(order=order, pickup_type='pickup', delivery_type='delivery',
+                                      pickup_date=date(2024, 6, 1), pickup_time=time(10), pickup_guy=workers[0])
+        Activity.objects.create(order=order, employee=workers[i % 3], date_start=date(2024, 6, 1),
+                                status=['backlog', 'to_do', 'in_progress', 'in_review', 'closed_positive'][i % 5],
+                                total_work_cost=Decimal(1000))
+    return user
+
+
+def get_recorded(client, url, params=None, **headers):
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        response = client.get(url, params, **headers)
+    return response, recorder
+
+
+# Прогоняет все именованные маршруты newDivanApp/urls.py и проверяет потолок запросов к БД
+class RouteQueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # строки OrderListRow пишутся в on_commit, который внутри TestCase сам не срабатывает
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database()
+        cls.route_kwargs = {
+            'order_id': Order.objects.first().id,
+            'employee_id': Employee.objects.first().id,
+            'column': 'to_do',
+        }
+
+    def test_routes_within_query_budget(self):
+        for pattern in urls.urlpatterns:
+            name = getattr(pattern, 'name', None)
+            if not name or name in SKIP_ROUTES:
+                continue
+            kwargs = {key: self.route_kwargs[key] for key in pattern.pattern.converters}
+            url = reverse(name, kwargs=kwargs)
+
+            for ajax in (False, True):
+                headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if ajax else {}
+                with self.subTest(route=name, ajax=ajax):
+                    self.client.force_login(self.user)
+                    response, recorder = get_recorded(self.client, url, ROUTE_PARAMS.get(name), **headers)
+                    budget = budget_for(name)
+
+                    self.assertLess(response.status_code, 500)
+                    self.assertLessEqual(recorder.count, budget['MAX_QUERIES'])
+                    self.assertEqual(recorder.repeated(budget['MAX_REPEATS']), [])
+
+
+def order_post_data(number, manager, executors):
+    return {
+        'number': number, 'manager': manager.id, 'executors': ','.join(str(e.id) for e in executors),
+        'source': 'site', 'contract_num': f"Д-{number}", 'create_date': '2024-05-01', 'completion_date': '2024-06-01',
+        'total_value': '15000', 'payment_type': 'cash', 'prepayment_share': '50', 'prepayment_value': '7500',
+        'is_prepayment_paid': 'true', 'postpayment_value': '7500', 'full_name': "Кузнецова Мария Петровна",
+        'contact_number': "+79001112233", 'items_qty': '1', 'short_descr': "Диван", 'item_type': "диван",
+        'furniture_type1': 'soft', 'work_types': 'reupholster,restoration', 'material_name': "Велюр",
+        'material_cost': '3000', 'pickupdelivery_pickup_type': 'pickup', 'pickupdelivery_delivery_type': 'delivery',
+        'pickup_guy': executors[0].id, 'delivery_guy': executors[-1].id,
+    }
+
+
+class OrderCreationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=1)
+        cls.manager = Employee.objects.get(user=cls.user)
+        cls.workers = list(Employee.objects.filter(position__name='Рабочий'))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_add_order_creates_whole_graph(self):
+        data = order_post_data("НД-100", self.manager, self.workers)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('add_order'), data)
+
+        self.assertEqual(response.status_code, 302)
+        order = Order.objects.get(number="НД-100")
+        self.assertEqual([assignment.employee for assignment in order.executor_assignments.all()], self.workers)
+        self.assertEqual(len(order.list_row.executors), 3)
+        self.assertEqual(order.contract.client.last_name, "Кузнецова")
+        self.assertEqual(order.technical_specifications.get().work_type2, 'restoration')
+        self.assertEqual(order.pickupdelivery_set.get().delivery_guy, self.workers[-1])
+        self.assertEqual(order.list_row.description, "Диван")
+
+    def test_invalid_order_writes_nothing(self):
+        data = order_post_data("НД-101", self.manager, self.workers)
+        data['delivery_guy'] = 999999
+        counts = Client.objects.count(), Contract.objects.count(), Order.objects.count()
+
+        response = self.client.post(reverse('add_order'), data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((Client.objects.count(), Contract.objects.count(), Order.objects.count()), counts)
+
+    def test_blank_and_invalid_executor_ids(self):
+        data = order_post_data("НД-103", self.manager, self.workers)
+        data['executors'] = f"{self.workers[0].id},,{self.workers[1].id},"
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('add_order'), data)
+        self.assertEqual(response.status_code, 302)
+        order = Order.objects.get(number="НД-103")
+        self.assertEqual([assignment.employee for assignment in order.executor_assignments.all()], self.workers[:2])
+
+        data = order_post_data("НД-104", self.manager, self.workers)
+        data['executors'] = f"{self.workers[0].id},x"
+        response = self.client.post(reverse('add_order'), data)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.filter(number="НД-104").exists())
+
+    def test_fractional_payment_amount_is_rejected(self):
+        data = order_post_data("НД-105", self.manager, self.workers)
+        data['prepayment_value'] = '7500.00'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('add_order'), data).status_code, 302)
+        order = Order.objects.get(number="НД-105")
+        self.assertEqual(order.contract.prepayment_value, 7500)
+
+        data = order_post_data("НД-106", self.manager, self.workers)
+        data['postpayment_value'] = '1500.75'
+        response = self.client.post(reverse('add_order'), data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("postpayment_value", response.content.decode())
+
+        data = dict(order_post_data("НД-105", self.manager, self.workers), prepayment_value='1500.75')
+        response = self.client.post(reverse('refactor_order', args=[order.pk]), data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Contract.objects.get(pk=order.contract_id).prepayment_value, 7500)
+
+    def test_taken_order_number_is_rejected(self):
+        counts = Contract.objects.count(), Order.objects.count()
+        response = self.client.post(reverse('add_order'), order_post_data("НД-0", self.manager, self.workers))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("НД-0", response.content.decode())
+
+        batch = [order_data_from_post(QueryDict(urlencode(order_post_data("НД-102", self.manager, self.workers))), {})
+                 for _ in range(2)]
+        with self.assertRaises(ValidationError):
+            create_orders(batch)
+        self.assertEqual((Contract.objects.count(), Order.objects.count()), counts)
+
+        order = create_orders(batch[:1])[0]
+        response = self.client.post(reverse('refactor_order', args=[order.pk]), {'number': "НД-0"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.get(pk=order.pk).number, "НД-102")
+
+    def test_refactor_order_writes_nothing_on_error(self):
+        order = Order.objects.get(number="НД-0")
+        url = reverse('refactor_order', args=[order.pk])
+        response = self.client.post(url, {'number': "НД-0", 'contract_num': "CHANGEDNUM", 'executors': '999999'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Contract.objects.get(pk=order.contract_id).num, "Д-0")
+
+        # ошибка разбора после первых записей откатывает и их
+        with self.assertRaises(ValueError):
+            self.client.post(url, {'number': "НД-0", 'address': "Новый адрес", 'contact_number': "+79000000000",
+                                   'prepayment_value': '5000', 'postpayment_value': '5000', 'create_date': "вчера"})
+        self.assertNotEqual(Client.objects.get(pk=order.contract.client_id).address, "Новый адрес")
+
+    def test_bulk_creation_query_count_does_not_grow(self):
+        def recorded(count, start):
+            recorder = QueryRecorder()
+            orders = [
+                order_data_from_post(QueryDict(urlencode(order_post_data(f"НД-{start + i}", self.manager,
+                                                                         self.workers))), {})
+                for i in range(count)
+            ]
+            with connection.execute_wrapper(recorder):
+                create_orders(orders)
+            return recorder.count
+
+        self.assertEqual(recorded(2, 200), recorded(20, 300))
+
+
+def image_file(name, size=(1200, 800)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+# файлы тестов пишутся во временный MEDIA_ROOT
+class TempMediaTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = self.settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        # в кеше помнится, для каких файлов построены копии, а MEDIA_ROOT у каждого теста свой
+        cache.clear()
+
+
+class ThumbnailTests(TempMediaTestCase):
+    def test_upload_builds_all_derivatives(self):
+        seed_database(orders=0)
+        employee = Employee.objects.first()
+        employee.avatar = image_file('ivan.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            employee.save()
+
+        for size in THUMBNAIL_SIZES:
+            for fmt in THUMBNAIL_FORMATS:
+                name = thumbnail_name(employee.avatar.name, size, fmt)
+                with default_storage.open(name) as file:
+                    self.assertEqual(max(Image.open(file).size), size)
+        with mock.patch.object(default_storage, 'exists') as exists:
+            self.assertTrue(thumbnail_url(employee.avatar, 48).endswith('_48.webp'))
+        exists.assert_not_called()
+
+    def test_resave_does_not_rebuild(self):
+        seed_database(orders=0)
+        employee = Employee.objects.first()
+        employee.avatar = image_file('ivan.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            employee.save()
+        name = thumbnail_name(employee.avatar.name, 48)
+        default_storage.delete(name)
+
+        employee.first_name = "Пётр"
+        with self.captureOnCommitCallbacks(execute=True):
+            employee.save()
+
+        self.assertFalse(default_storage.exists(name))
+
+    def test_missing_derivative_falls_back_to_original(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            seed_database(orders=1)
+        manager = Employee.objects.get(first_name="Иван")
+        manager.avatar = SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+        with self.assertLogs('newDivanApp.thumbnails', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            manager.save()
+
+        with mock.patch.object(default_storage, 'exists') as exists:
+            self.assertEqual(thumbnail_url(manager.avatar, 48), manager.avatar.url)
+        exists.assert_not_called()
+        row_manager = OrderListRow.objects.get().manager
+        self.assertEqual(row_manager['avatar_thumb_url'], row_manager['avatar_url'])
+
+        manager.avatar = image_file('ivan.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            manager.save()
+        self.assertTrue(OrderListRow.objects.get().manager['avatar_thumb_url'].endswith('_48.webp'))
+
+
+class MediaStorageTests(TempMediaTestCase):
+    def upload_avatar(self, employee, name):
+        employee.avatar = image_file(name)
+        with self.captureOnCommitCallbacks(execute=True):
+            employee.save()
+
+    def test_same_content_is_stored_once(self):
+        seed_database(orders=0)
+        first, second = Employee.objects.all()[:2]
+        self.upload_avatar(first, 'a.jpg')
+        self.upload_avatar(second, 'b.jpg')
+
+        self.assertEqual(first.avatar.name, second.avatar.name)
+        self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(second.avatar.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(second.avatar.name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_replacing_image_releases_old_blob(self):
+        seed_database(orders=0)
+        employee = Employee.objects.first()
+        self.upload_avatar(employee, 'a.jpg')
+        old_name = employee.avatar.name
+
+        employee.avatar = image_file('b.jpg', size=(10, 10))
+        with self.captureOnCommitCallbacks(execute=True):
+            employee.save()
+
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertEqual(list(MediaBlob.objects.values_list('name', 'ref_count')), [(employee.avatar.name, 1)])
+
+
+class CurrentEmployeeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_database(orders=0)
+        cls.worker = Employee.objects.filter(position__name='Рабочий').first()
+        cls.worker.user = User.objects.create_user('worker', password='password')
+        cls.worker.save()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_access_check_is_cached(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('staff'))
+
+        response, recorder = get_recorded(self.client, reverse('delete_employee', args=[0]))
+
+        self.assertEqual(response.status_code, 200)
+        # сессия и пользователь; сотрудник с должностью берётся из кеша
+        self.assertFalse(any('newDivanApp_employee' in shape for shape in recorder.shapes))
+
+    def test_low_access_level_redirects(self):
+        self.client.force_login(self.worker.user)
+
+        self.assertRedirects(self.client.get(reverse('orders')), reverse('active'), fetch_redirect_response=False)
+
+    def test_position_change_invalidates_cache(self):
+        self.client.force_login(self.worker.user)
+        self.client.get(reverse('orders'))
+
+        self.worker.position.access_lvl = 4
+        self.worker.position.save()
+
+        self.assertEqual(self.client.get(reverse('orders')).status_code, 200)
+
+
+class ReferenceDataTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_database(orders=0)
+
+    def setUp(self):
+        cache.clear()
+        invalidate_reference_data()
+        self.client.force_login(self.user)
+
+    def test_form_render_reads_rosters_from_cache(self):
+        self.client.get(reverse('add_order'))
+        response, recorder = get_recorded(self.client, reverse('add_order'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e.first_name for e in response.context['executors']], ["Рабочий0", "Рабочий1", "Рабочий2"])
+        self.assertFalse(any('newDivanApp_jobtitle' in shape or 'newDivanApp_employee' in shape
+                             for shape in recorder.shapes))
+
+    def test_new_worker_invalidates_roster(self):
+        get_reference_data()
+        worker = Employee.objects.filter(position__name='Рабочий').first()
+        worker.pk = None
+        worker.first_name = "Новичок"
+        worker.save()
+
+        self.assertIn("Новичок", [e.first_name for e in get_reference_data()['workers']])
+
+    def test_roster_expires_without_invalidation(self):
+        get_reference_data()
+        # как в другом процессе: update() не шлёт сигналов, и сброс сюда не доходит
+        Employee.objects.filter(first_name="Рабочий0").update(first_name="Новичок")
+        self.assertNotIn("Новичок", [e.first_name for e in get_reference_data()['workers']])
+
+        with mock.patch('newDivanApp.reference_data.time.monotonic', return_value=monotonic() + REFERENCE_TIMEOUT + 1):
+            self.assertIn("Новичок", [e.first_name for e in get_reference_data()['workers']])
+
+
+class OrderDataTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_database(orders=5)
+
+    def test_batch_costs_constant_queries(self):
+        url = reverse('get_order_data')
+        _, one = get_recorded(self.client, url, {'order_numbers': "НД-0"})
+        response, many = get_recorded(self.client, url, {'order_numbers': "НД-0,НД-1,НД-2,НД-3,НД-404"})
+
+        self.assertEqual(one.count, many.count)
+        data = response.json()
+        self.assertEqual(sorted(data['orders']), ["НД-0", "НД-1", "НД-2", "НД-3"])
+        self.assertEqual(data['missing'], ["НД-404"])
+        self.assertEqual(data['orders']["НД-1"]['materials'][0]['name'], "Ткань")
+
+    def test_unchanged_data_answers_not_modified(self):
+        url = reverse('get_order_data')
+        response = self.client.get(url, {'order_number': "НД-0"})
+        self.assertEqual(response.json()['short_descr'], "Диван 0")
+
+        cached = self.client.get(url, {'order_number': "НД-0"}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        TechnicalSpecification.objects.filter(order__number="НД-0").update(short_descr="Кресло")
+        changed = self.client.get(url, {'order_number': "НД-0"}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+    def test_unknown_number_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('get_order_data'), {'order_number': "НД-404"}).status_code, 404)
+
+
+class OrderListRowTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=4)
+
+    def snapshot(self):
+        return list(OrderListRow.objects.order_by('order_id').values_list('order_id', *ROW_FIELDS))
+
+    def save(self, instance, **fields):
+        for name, value in fields.items():
+            setattr(instance, name, value)
+        instance.save()
+
+    def test_writes_keep_rows_equal_to_rebuild(self):
+        order = Order.objects.get(number="НД-1")
+        worker = Employee.objects.get(first_name="Рабочий2")
+        changes = [
+            lambda: self.save(order.contract, total_value=Decimal(77777), completion_date=date(2024, 9, 1)),
+            lambda: self.save(order.contract.client, last_name="Новикова"),
+            lambda: self.save(order.technical_specifications.get(), short_descr="Кресло", furniture_type1='cabinet'),
+            lambda: self.save(worker, first_name="Степан"),
+            lambda: self.save(order, status='in_review', number="НД-100"),
+            lambda: OrderExecutor.objects.filter(order=order, position=0).delete(),
+            lambda: Order.objects.get(number="НД-3").delete(),
+        ]
+        for change in changes:
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+        incremental = self.snapshot()
+        rebuild_order_rows()
+        self.assertEqual(incremental, self.snapshot())
+
+        row = OrderListRow.objects.get(order=order)
+        self.assertEqual((row.number, row.status, row.total_value, row.description), ("НД-100", 'in_review',
+                                                                                    Decimal(77777), "Кресло"))
+        self.assertIn("новикова", row.search_text)
+        self.assertEqual([executor['full_name'] for executor in row.executors], ["Степан Сидоров"])
+        self.assertFalse(OrderListRow.objects.filter(number="НД-3").exists())
+
+    def test_refresh_survives_rolled_back_savepoint(self):
+        order = Order.objects.get(number="НД-1")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.save(order, status='in_review')
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            order.refresh_from_db()
+            self.save(order, number="НД-101")
+            self.save(order.contract, total_value=Decimal(55555))
+
+        row = OrderListRow.objects.get(order=order)
+        self.assertEqual((row.number, row.status, row.total_value), ("НД-101", order.status, Decimal(55555)))
+        # набор разобрал первый сработавший колбэк, остальные ничего не пересчитывают
+        self.assertGreater(len(callbacks), 1)
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+
+
+class PaymentStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=4)
+            # у чётных заказов внесена предоплата; НД-2 уже доставлен, НД-0 оплачен полностью
+            PickupDelivery.objects.filter(order__number="НД-2").update(delivery_date=date(2024, 7, 1))
+            Contract.objects.filter(num="Д-0").update(is_postpayment_paid=True)
+            # вторая доставка без даты не должна ни дублировать заказ, ни менять его статус
+            PickupDelivery.objects.create(order=Order.objects.get(number="НД-2"), pickup_type='pickup',
+                                          delivery_type='delivery', pickup_date=date(2024, 6, 1), pickup_time=time(10))
+
+    def test_status_follows_payment_rules(self):
+        statuses = dict(Order.objects.with_payment_status().values_list('number', 'payment_status'))
+        self.assertEqual(statuses, {"НД-0": 'payment_done', "НД-1": 'awaiting_prepayment',
+                                    "НД-2": 'awaiting_payment', "НД-3": 'awaiting_prepayment'})
+
+    def get_orders(self, params):
+        return self.client.get(reverse('orders'), params, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+
+    def test_orders_list_filters_and_sorts_by_status(self):
+        self.client.force_login(self.user)
+        # update() обходит сигналы, поэтому строки списка пересобираются вручную
+        rebuild_order_rows()
+
+        data = self.get_orders({'payment_status': 'awaiting_prepayment'})
+        self.assertEqual(sorted(row['number'] for row in data['data']), ["НД-1", "НД-3"])
+        self.assertEqual(data['filtered_count'], 2)
+        data = self.get_orders({'sort': 'payment_status', 'direction': 'asc'})
+        self.assertEqual([row['payment_status'] for row in data['data']],
+                         ["Ожидает оплаты", "Ожидает предоплаты", "Ожидает предоплаты", "Оплата произведена"])
+
+
+class OrderSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=6)
+            spec = TechnicalSpecification.objects.get(order__number="НД-4")
+            spec.short_descr, spec.full_descr = "Угловой диван", "Перетяжка углового дивана, ткань велюр"
+            spec.save()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_orders(self, params):
+        return self.client.get(reverse('orders'), params, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+
+    def numbers(self, order_ids):
+        numbers = dict(Order.objects.values_list('pk', 'number'))
+        return [numbers[order_id] for order_id in order_ids]
+
+    def test_finds_by_number_client_phone_and_description(self):
+        self.assertEqual(self.numbers(search_order_ids("НД-3")), ["НД-3"])
+        self.assertEqual(self.numbers(search_order_ids("клиент5")), ["НД-5"])
+        self.assertEqual(self.numbers(search_order_ids("+79000000002")), ["НД-2"])
+        # слова ищутся как префиксы, регистр и ё не важны
+        self.assertEqual(self.numbers(search_order_ids("УГЛОВ вЕлЮр")), ["НД-4"])
+        self.assertEqual(search_order_ids("нет такого"), [])
+
+    def test_ranks_stronger_match_first(self):
+        # "угловой" есть и в описании, и в полном ТЗ НД-4; у остальных только слово "диван"
+        self.assertEqual(self.numbers(search_order_ids("угловой диван")), ["НД-4"])
+        self.assertEqual(self.numbers(search_order_ids("диван"))[0], "НД-4")
+
+    def test_index_follows_edits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            client = Client.objects.get(last_name="Клиент1")
+            client.last_name = "Ёлкина"
+            client.save()
+        self.assertEqual(self.numbers(search_order_ids("елкина")), ["НД-1"])
+        self.assertEqual(search_order_ids("клиент1"), [])
+
+    def test_orders_list_keeps_relevance_and_filters(self):
+        data = self.get_orders({'search_query': "диван"})
+        self.assertEqual([row['id'] for row in data['data']], search_order_ids("диван"))
+        self.assertEqual((data['total_count'], data['filtered_count']), (6, 6))
+
+        data = self.get_orders({'search_query': "диван", 'status': 'closed'})
+        self.assertEqual([row['number'] for row in data['data']], ["НД-3"])
+
+    def test_matches_beyond_ranked_limit_are_counted_and_paged(self):
+        top = search_order_ids("диван", limit=2)
+        with mock.patch('newDivanApp.views.search_order_ids', lambda query: search_order_ids(query, limit=2)):
+            first = self.get_orders({'search_query': "диван", 'page_size': 4})
+            second = self.get_orders({'search_query': "диван", 'page_size': 4, 'cursor': first['next_cursor']})
+        ids = [row['id'] for row in first['data'] + second['data']]
+
+        self.assertEqual(first['filtered_count'], 6)
+        self.assertEqual(ids[:2], top)
+        self.assertEqual(sorted(ids), sorted(Order.objects.values_list('pk', flat=True)))
+
+
+class DashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=8)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_kpis_count_orders_by_status_group(self):
+        response, recorder = get_recorded(self.client, reverse('main'))
+        context = response.context
+        self.assertEqual((context['total_orders'], context['total_contract_value'], context['total_employees']),
+                         (8, Decimal(80028), 4))
+        self.assertEqual((context['completed_count'], context['queue_count'], context['in_progress_count']),
+                         (2, 4, 2))
+        self.assertEqual(len([sql for sql in recorder.shapes if 'newDivanApp_order' in sql and 'COUNT(' in sql]), 1)
+
+    def test_cards_are_open_orders_by_due_date(self):
+        orders = self.client.get(reverse('main')).context['orders']
+        self.assertEqual([row.number for row in orders], ["НД-0", "НД-1", "НД-2", "НД-4", "НД-5", "НД-6"])
+
+    def test_snapshot_is_cached_until_orders_change(self):
+        self.client.get(reverse('main'))
+        _, recorder = get_recorded(self.client, reverse('dashboard_kpis'))
+        self.assertFalse([sql for sql in recorder.shapes if 'COUNT(' in sql])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.get(number="НД-0")
+            order.status = 'closed'
+            order.save()
+        kpis = self.client.get(reverse('dashboard_kpis')).json()
+        self.assertEqual((kpis['completed_count'], kpis['queue_count']), (3, 3))
+
+    def test_version_bump_from_other_process_refreshes_snapshot(self):
+        self.client.get(reverse('dashboard_kpis'))
+        # другой процесс меняет данные: до этого кеша он не дотянется, но версия таблицы в БД общая
+        Order.objects.filter(number="НД-0").update(status='closed')
+        bump_table_versions(Order)
+        self.assertEqual(self.client.get(reverse('dashboard_kpis')).json()['completed_count'], 3)
+
+
+@mock.patch.dict(COLUMN_LIMITS, {column: 2 for column in COLUMN_LIMITS})
+class BoardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=15)
+            # в "В очереди" у всех трёх карточек один срок - порядок решает id
+            Contract.objects.filter(num__in=["Д-6", "Д-11"]).update(completion_date=date(2024, 6, 2))
+            # активность заказа без техзадания на доску не попадает
+            TechnicalSpecification.objects.filter(order__number="НД-10").delete()
+
+    def order_numbers(self, cards):
+        return [card['order_number'] for card in cards]
+
+    def test_board_shows_first_cards_of_each_column(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            board = load_board()
+        self.assertEqual(recorder.count, 1)
+        self.assertEqual({column: self.order_numbers(board[column]['items']) for column in board}, {
+            'backlog': ["НД-0", "НД-5"], 'to_do': ["НД-1", "НД-6"],
+            'in_progress': ["НД-2", "НД-7"], 'in_review': ["НД-3", "НД-8"],
+        })
+        self.assertIsNone(board['backlog']['next_cursor'])
+        self.assertIsNotNone(board['to_do']['next_cursor'])
+
+    def test_column_continues_from_board_cursor(self):
+        cursor = load_board()['to_do']['next_cursor']
+        page = load_column('to_do', cursor)
+        self.assertEqual((self.order_numbers(page['items']), page['next_cursor']), (["НД-11"], None))
+
+    def test_closed_column_pages_on_request(self):
+        self.client.force_login(self.user)
+        first = self.client.get(reverse('board_column', kwargs={'column': 'closed'})).json()
+        second = self.client.get(reverse('board_column', kwargs={'column': 'closed'}),
+                                 {'cursor': first['next_cursor']}).json()
+        self.assertEqual((first['html'].count('data-activity-id'), second['html'].count('data-activity-id')), (2, 1))
+        self.assertIsNone(second['next_cursor'])
+
+
+class ListConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=5)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_list(self, name, params=None, etag=None):
+        headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        if etag:
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        return get_recorded(self.client, reverse(name), params, **headers)
+
+    def test_unchanged_orders_list_skips_list_query(self):
+        response, _ = self.get_list('orders')
+        self.assertEqual(response.status_code, 200)
+
+        cached, recorder = self.get_list('orders', etag=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertFalse([sql for sql in recorder.shapes if 'orderlistrow' in sql.lower()])
+
+    def test_filters_change_etag(self):
+        response, _ = self.get_list('orders')
+        filtered, _ = self.get_list('orders', {'status': 'closed'}, etag=response['ETag'])
+        self.assertEqual(filtered.status_code, 200)
+        self.assertNotEqual(filtered['ETag'], response['ETag'])
+
+    def test_saves_invalidate_etag(self):
+        for name, change in (
+            ('orders', lambda: Order.objects.first().save()),
+            ('staff', lambda: Employee.objects.first().save()),
+        ):
+            with self.subTest(route=name):
+                response, _ = self.get_list(name)
+                self.assertEqual(self.get_list(name, etag=response['ETag'])[0].status_code, 304)
+                change()
+                self.assertEqual(self.get_list(name, etag=response['ETag'])[0].status_code, 200)
+
+
+class StaffSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_database(orders=0)
+        worker = Employee.objects.filter(first_name="Рабочий0").get()
+        worker.last_name, worker.first_name, worker.middle_name = "Семёнов", "Пётр", "Иванович"
+        worker.save()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get_staff(self, params):
+        return self.client.get(reverse('staff'), params, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+
+    def test_search_key_is_normalized(self):
+        self.assertEqual(Employee.objects.get(first_name="Пётр").search_key, "семенов петр иванович")
+
+    def test_search_ignores_yo_and_ranks_name_start_first(self):
+        data = self.get_staff({'search_name': "ПЁТР петров"})
+        # у "Петров Иван" с начала ФИО совпадают оба слова, у "Семёнов Пётр" - одно с начала имени
+        self.assertEqual([row['full_name'].split()[1] for row in data['data']], ["Иван", "Пётр"])
+        self.assertEqual(self.get_staff({'search_name': "семенов"})['filtered_count'], 1)
+
+    def test_pages_follow_cursor(self):
+        first = self.get_staff({'page_size': 3})
+        second = self.get_staff({'page_size': 3, 'cursor': first['next_cursor']})
+        names = [row['full_name'] for row in first['data'] + second['data']]
+        self.assertEqual(len(set(names)), 4)
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual((first['total_count'], first['filtered_count']), (4, 4))
+
+    def test_count_is_cached_per_filter(self):
+        self.get_staff({'status': 'working'})
+        _, recorder = get_recorded(self.client, reverse('staff'), {'status': 'working', 'page_size': 2},
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertFalse([sql for sql in recorder.shapes if 'COUNT(' in sql.upper()])
+
+
+def forged_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=10)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get(self, name, params, **kwargs):
+        return self.client.get(reverse(name, kwargs=kwargs), params, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_orders_pages_cover_list_once(self):
+        for sort, direction in (('', 'desc'), ('number', 'asc'), ('payment_status', 'desc')):
+            with self.subTest(sort=sort, direction=direction):
+                params = {'sort': sort, 'direction': direction, 'page_size': 3}
+                ids, cursor = [], None
+                while True:
+                    data = self.get('orders', dict(params, cursor=cursor) if cursor else params).json()
+                    ids += [row['id'] for row in data['data']]
+                    cursor = data['next_cursor']
+                    if not cursor:
+                        break
+                self.assertEqual(sorted(ids), sorted(Order.objects.values_list('pk', flat=True)))
+
+    def test_cursor_of_other_sort_is_rejected(self):
+        cursor = self.get('orders', {'sort': 'number', 'page_size': 3}).json()['next_cursor']
+        response = self.get('orders', {'sort': 'create_date', 'cursor': cursor})
+        self.assertEqual(response.status_code, 400)
+        response = self.get('orders', {'sort': 'number', 'direction': 'asc', 'cursor': cursor})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tampered_cursor_is_rejected(self):
+        cursors = ["не base64", forged_cursor([1, 2]), forged_cursor(['-create_date', [1, 2], 3]),
+                   forged_cursor(['-create_date', "не дата", 3]), forged_cursor(['-create_date', None, 3])]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get('orders', {'cursor': cursor}).status_code, 400)
+        staff_cursor = forged_cursor(['search_key', {'a': 1}, 1])
+        self.assertEqual(self.get('staff', {'cursor': staff_cursor}).status_code, 400)
+        board_cursor = forged_cursor(['order__contract__completion_date', "2024-13-45", 1])
+        self.assertEqual(self.get('board_column', {'cursor': board_cursor}, column='to_do').status_code, 400)
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=5)
+
+    def setUp(self):
+        cache.clear()
+        self.async_client.force_login(self.user)
+
+    async def test_list_endpoints_answer_under_asgi(self):
+        ajax = {'X-Requested-With': 'XMLHttpRequest'}
+        orders = await self.async_client.get(reverse('orders'), {'status': 'closed'}, headers=ajax)
+        staff = await self.async_client.get(reverse('staff'), headers=ajax)
+        kpis = await self.async_client.get(reverse('dashboard_kpis'))
+        order_data = await self.async_client.get(reverse('get_order_data'), {'order_numbers': "НД-1,НД-404"})
+
+        self.assertEqual((orders.json()['total_count'], orders.json()['filtered_count']), (5, 1))
+        self.assertEqual(staff.json()['total_count'], 4)
+        self.assertEqual((kpis.json()['total_orders'], kpis.json()['total_employees']), (5, 4))
+        self.assertEqual(order_data.json()['missing'], ["НД-404"])
+
+
+# Параллельные запросы идут из других потоков, поэтому данные должны быть закоммичены
+@override_settings(ASYNC_QUERY_CONCURRENCY=True)
+class ConcurrentQueriesTests(TransactionTestCase):
+    def test_calls_run_in_own_connections(self):
+        Department.objects.create(name="Продажи")
+        JobTitle.objects.bulk_create([JobTitle(name='Менеджер'), JobTitle(name='Рабочий')])
+
+        result = async_to_sync(gather_queries)(Department.objects.count, JobTitle.objects.count)
+        self.assertEqual(result, [1, 2])
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=8)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_orders_csv_follows_table_filters(self):
+        response = self.client.get(reverse('export_orders'), {'status': 'closed'})
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertTrue(lines[0].startswith("Номер заказа;Договор"))
+        self.assertEqual(sorted(line.split(';')[0] for line in lines[1:]), ["НД-3", "НД-7"])
+        self.assertIn("Клиент3", lines[1] + lines[2])
+
+    def test_staff_xlsx_is_a_workbook_without_passport_data(self):
+        response = self.client.get(reverse('export_staff'), {'format': 'xlsx', 'search_name': "рабочий"})
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+
+        self.assertEqual(archive.testzip(), None)
+        self.assertEqual(sheet.count('<row>'), 4)
+        self.assertNotIn("4500", sheet)
+
+    def test_unknown_format_is_rejected(self):
+        self.assertEqual(self.client.get(reverse('export_staff'), {'format': 'pdf'}).status_code, 400)
+
+
+class RevenueRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=6)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def snapshot(self):
+        return sorted(RevenueRollup.objects.values_list(
+            'month', 'manager_id', 'source', 'furniture_type', 'work_type', 'order_count', 'revenue', 'work_cost'))
+
+    def report(self, **params):
+        return self.client.get(reverse('revenue_report'), params).json()
+
+    def test_signals_keep_rollup_equal_to_rebuild(self):
+        order = Order.objects.get(number="НД-2")
+        with self.captureOnCommitCallbacks(execute=True):
+            contract = order.contract
+            contract.create_date, contract.total_value = date(2025, 2, 10), Decimal(99999)
+            contract.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.get(number="НД-4").delete()
+
+        incremental = self.snapshot()
+        rebuild_revenue_rollup()
+        self.assertEqual(incremental, self.snapshot())
+        [row] = self.report(group_by='month', start='2025-02')['rows']
+        self.assertEqual((row['month'], row['order_count'], Decimal(row['revenue'])), ('2025-02', 1, Decimal(99999)))
+
+    def test_slice_is_stored_once(self):
+        before = self.snapshot()
+        refresh_revenue_months(RevenueRollup.objects.values_list('month', flat=True))
+        self.assertEqual(before, self.snapshot())
+
+        row = RevenueRollup.objects.first()
+        row.pk = None
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            row.save()
+
+    def test_report_reads_rollup_only(self):
+        _, recorder = get_recorded(self.client, reverse('revenue_report'), {'group_by': 'manager,source'})
+        data = self.report(group_by='manager,source')
+
+        self.assertEqual(data['totals']['order_count'], 6)
+        self.assertEqual(data['rows'][0]['manager'], "Петров Иван")
+        self.assertFalse([sql for sql in recorder.shapes if 'newDivanApp_contract' in sql])
+
+    def test_unknown_dimension_is_rejected(self):
+        response = self.client.get(reverse('revenue_report'), {'group_by': 'client'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PayrollTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=10)
+        cls.piece_worker = Employee.objects.get(first_name="Рабочий0")
+        cls.piece_worker.type_salary = 'not_fixed'
+        cls.piece_worker.save()
+        Activity.objects.filter(status='closed_positive').update(date_end=date(2024, 6, 20))
+        # у Рабочий0 успешно закрыта одна активность из пяти; вторая закрыта в следующем месяце
+        Activity.objects.filter(employee=cls.piece_worker, status='backlog').update(
+            status='closed_positive', date_end=date(2024, 7, 2), total_work_cost=Decimal(700))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_close_combines_salary_and_piecework(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            period = close_payroll(date(2024, 6, 15), payment_date=date(2024, 7, 5))
+
+        entries = {entry.full_name: entry for entry in period.entries.all()}
+        piece = entries["Сидоров Рабочий0"]
+        self.assertEqual((piece.fixed_salary, piece.piecework, piece.activity_count), (0, Decimal(1000), 1))
+        self.assertEqual(entries["Петров Иван"].total, Decimal(50000))
+        self.assertEqual(len(entries), 4)
+        self.assertEqual(list(Activity.objects.filter(payroll_period=period).values_list('is_paid', 'payment_date')),
+                         [(True, date(2024, 7, 5))])
+        # одна вставка ведомости, один UPDATE активностей, одна агрегация и одна пачка строк
+        self.assertLessEqual(recorder.count, 10)
+
+        july = close_payroll(date(2024, 7, 1))
+        self.assertEqual(july.entries.get(employee=self.piece_worker).piecework, Decimal(700))
+
+    def test_period_is_closed_once_and_immutable(self):
+        close_payroll(date(2024, 6, 1))
+        with self.assertRaises(ValidationError):
+            close_payroll(date(2024, 6, 1))
+        entry = PayrollEntry.objects.first()
+        entry.total = 0
+        with self.assertRaises(ValidationError):
+            entry.save()
+
+    def test_report_reads_snapshot(self):
+        close_payroll(date(2024, 6, 1))
+        Employee.objects.filter(type_salary='fixed').update(salary=90000)
+        Activity.objects.filter(employee=self.piece_worker).update(total_work_cost=Decimal(1))
+
+        url = reverse('payroll_report')
+        _, recorder = get_recorded(self.client, url, {'month': '2024-06'})
+        data = self.client.get(url, {'month': '2024-06'}).json()
+        self.assertEqual(Decimal(data['totals']['total']), Decimal(151000))
+        self.assertFalse([sql for sql in recorder.shapes if 'newDivanApp_activity' in sql])
+        self.assertEqual(self.client.get(url).json()['periods'][0]['month'], '2024-06')
+        self.assertEqual(self.client.get(url, {'month': '2024-05'}).status_code, 404)
+
+
+class CalendarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=8)
+        # строки изменены давно: синхронизация не должна отдавать их повторно
+        long_ago = timezone.now() - timedelta(days=1)
+        for model in (PickupDelivery, Contract, Activity):
+            model.objects.update(updated_at=long_ago)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def events(self, **params):
+        return self.client.get(reverse('calendar_events'), {'start': '2024-06-01', 'end': '2024-06-30', **params})
+
+    def test_range_reads_each_source_once(self):
+        response, recorder = get_recorded(self.client, reverse('calendar_events'),
+                                          {'start': '2024-06-01', 'end': '2024-06-30'})
+        data = response.json()
+
+        types = [event['type'] for event in data['events']]
+        self.assertEqual((types.count('pickup'), types.count('deadline'), types.count('activity_start')), (8, 8, 8))
+        pickup = next(event for event in data['events'] if event['type'] == 'pickup')
+        self.assertEqual((pickup['date'], pickup['time'], pickup['employee']), ('2024-06-01', '10:00', "Сидоров Рабочий0"))
+        for table in ('pickupdelivery', 'contract', 'activity'):
+            self.assertEqual(len([sql for sql in recorder.shapes if f'FROM "newDivanApp_{table}"' in sql]), 1)
+
+    def test_sync_token_returns_changes_and_current_ids(self):
+        token = self.events().json()['sync_token']
+        self.assertEqual(self.events(sync_token=token).json()['events'], [])
+
+        transfer = PickupDelivery.objects.get(order__number="НД-3")
+        transfer.delivery_date, transfer.delivery_time = date(2024, 6, 20), time(15, 30)
+        transfer.save()
+        Activity.objects.get(order__number="НД-5").delete()
+
+        data = self.events(sync_token=token).json()
+        self.assertEqual([event['id'] for event in data['events']],
+                         [f'pickup-{transfer.pk}', f'delivery-{transfer.pk}'])
+        self.assertIn(f'delivery-{transfer.pk}', data['ids'])
+        self.assertEqual(len([event_id for event_id in data['ids'] if event_id.startswith('activity_start')]), 7)
+
+    def test_ics_export(self):
+        response = self.client.get(reverse('calendar_ics'), {'start': '2024-06-01', 'end': '2024-06-30'})
+        content = response.content.decode()
+
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertTrue(content.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(content.count('BEGIN:VEVENT'), 24)
+        self.assertIn('DTSTART:20240601T100000Z', content)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in content.split('\r\n')))
+
+    def test_invalid_range_is_rejected(self):
+        self.assertEqual(self.events(end='2023-01-01').status_code, 400)
+        self.assertEqual(self.events(sync_token='abc').status_code, 400)
+
+
+class DispatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=6)
+        courier = JobTitle.objects.create(name='Курьер', access_lvl=1)
+        worker = Employee.objects.get(first_name="Рабочий0")
+        cls.couriers = []
+        for name in ("Курьер1", "Курьер2"):
+            worker.pk, worker.user, worker.first_name, worker.position = None, None, name, courier
+            worker.save()
+            cls.couriers.append(worker.pk)
+        # все заборы 1 июня в 10:00 на одной улице: окно 10:00-12:00, каждый курьер успевает три точки
+        Client.objects.update(address="г. Санкт-Петербург, ул. Ленина, д. 5")
+
+    def test_day_is_planned_with_one_update(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            plan = plan_day(date(2024, 6, 1))
+
+        self.assertEqual(plan['unassigned'], [])
+        self.assertEqual([len(route.stops) for route in plan['routes']], [3, 3])
+        self.assertEqual([arrival.strftime('%H:%M') for _, arrival in plan['routes'][0].stops],
+                         ['10:00', '10:45', '11:30'])
+        self.assertEqual(sorted(PickupDelivery.objects.values_list('pickup_guy_id', flat=True)),
+                         sorted(self.couriers * 3))
+        self.assertFalse(PickupDelivery.objects.filter(delivery_guy__isnull=False).exists())
+        self.assertEqual(len([sql for sql in recorder.shapes if sql.startswith('UPDATE "newDivanApp_pickupdelivery"')]), 1)
+
+    def test_stops_beyond_capacity_keep_previous_assignee(self):
+        previous = Employee.objects.get(first_name="Рабочий0").pk
+        plan = plan_day(date(2024, 6, 1), crew=Employee.objects.filter(pk=self.couriers[0]))
+
+        self.assertEqual(len(plan['unassigned']), 3)
+        self.assertEqual(PickupDelivery.objects.filter(pickup_guy_id=previous).count(), 3)
+
+    def test_address_zone_drops_city_and_house(self):
+        self.assertEqual(address_zone("г. Москва, ул. Зелёная, д. 5, кв. 7"), "ул. зеленая")
+        self.assertEqual(address_zone(""), "")
+
+
+class ChangeLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=2)
+        cls.manager = Employee.objects.get(user=cls.user)
+        cls.workers = list(Employee.objects.filter(first_name__startswith="Рабочий").order_by('pk'))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def changes(self, since, **params):
+        return self.client.get(reverse('changes'), {'since': since, **params}).json()
+
+    def test_saves_and_cascades_are_logged_in_order(self):
+        cursor = ChangeLogEntry.objects.latest('id').id
+        order = Order.objects.get(number="НД-1")
+        order.status = 'closed'
+        order.save()
+        order_id = order.pk
+        order.delete()
+
+        data = self.changes(cursor, limit=1000)
+        logged = [(change['model'], change['action']) for change in data['changes']]
+        self.assertEqual(logged[0], ('Order', 'update'))
+        self.assertIn(('Activity', 'delete'), logged)
+        self.assertIn(('Order', 'delete'), logged)
+        self.assertTrue(all(change['order_id'] == order_id for change in data['changes']))
+        ids = [change['id'] for change in data['changes']]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual((data['next_cursor'], data['has_more']), (ids[-1], False))
+
+    def test_log_failure_rolls_back_the_save(self):
+        material = Material.objects.first()
+        with mock.patch('newDivanApp.signals.log_change', side_effect=RuntimeError):
+            material.name = "Кожа"
+            with self.assertRaises(RuntimeError):
+                material.save()
+        self.assertEqual(Material.objects.get(pk=material.pk).name, "Ткань")
+
+    def test_bulk_creation_is_logged_and_paged(self):
+        cursor = ChangeLogEntry.objects.latest('id').id
+        post = QueryDict(urlencode(order_post_data("НД-100", self.manager, self.workers[:2])))
+        create_orders([order_data_from_post(post, {})])
+
+        first = self.changes(cursor, limit=3)
+        self.assertEqual(([change['model'] for change in first['changes']], first['has_more']),
+                         (['Contract', 'Order', 'OrderExecutor'], True))
+        rest = self.changes(first['next_cursor'])
+        self.assertEqual([change['model'] for change in rest['changes']],
+                         ['OrderExecutor', 'TechnicalSpecification', 'Material', 'PickupDelivery'])
+        self.assertFalse(rest['has_more'])
+        self.assertEqual(self.client.get(reverse('changes'), {'since': 'x'}).status_code, 400)
+
+    # Пропуск в id на PostgreSQL: удалённая запись изображает ещё не закоммиченную
+    def test_gap_waits_for_running_writers(self):
+        cursor = ChangeLogEntry.objects.latest('id').id
+        log_changes([*Order.objects.order_by('pk'), Material.objects.first()], 'update')
+        first, gap, last = ChangeLogEntry.objects.filter(id__gt=cursor).order_by('id')
+        gap.delete()
+
+        def page(now, oldest_write_start):
+            with mock.patch('newDivanApp.changelog.connection', mock.Mock(vendor='postgresql')), \
+                    mock.patch('newDivanApp.changelog._write_activity', return_value=(now, oldest_write_start)):
+                return [change['id'] for change in changes_since(cursor)['changes']]
+
+        now = last.created_at
+        # транзакция, начатая за 30 минут до записи за пропуском, ещё идёт
+        self.assertEqual(page(now + timedelta(minutes=5), now - timedelta(minutes=30)), [first.id])
+        # пишущих транзакций нет или все начаты позже - пропуск считается откатом
+        self.assertEqual(page(now, None), [first.id, last.id])
+        self.assertEqual(page(now, now + timedelta(minutes=5)), [first.id, last.id])
+        # транзакция, начатая после вставки записи за пропуском, не могла взять id из пропуска
+        self.assertEqual(page(now + timedelta(minutes=1), now + timedelta(seconds=30)), [first.id, last.id])
+        # дольше MAX_GAP_WAIT пропуск не держит
+        self.assertEqual(page(now + timedelta(hours=2), now - timedelta(hours=3)), [first.id, last.id])
+
+        # сессии других ролей не видны в pg_stat_activity - пропуск не держится
+        fake = mock.MagicMock(vendor='postgresql')
+        fake.cursor.return_value.__enter__.return_value.fetchone.return_value = (now, now - timedelta(minutes=30),
+                                                                                 False)
+        with mock.patch('newDivanApp.changelog.connection', fake), self.assertLogs('newDivanApp.changelog', 'WARNING'):
+            self.assertEqual([change['id'] for change in changes_since(cursor)['changes']], [first.id, last.id])
+
+
+class LiveUpdatesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=3)
+
+    def setUp(self):
+        cache.clear()
+        self.async_client.force_login(self.user)
+
+    def change_order_and_board(self):
+        cursor = ChangeLogEntry.objects.latest('id').id
+        order = Order.objects.get(number="НД-1")
+        order.status = 'closed'
+        order.save()
+        activity = Activity.objects.get(order__number="НД-2")
+        activity.status = 'backlog'
+        activity.save()
+        Order.objects.get(number="НД-0").delete()
+        return cursor, order, activity
+
+    def test_batch_carries_rows_and_cards(self):
+        cursor, order, activity = self.change_order_and_board()
+        page = changes_since(cursor)
+
+        # заказы, их техзадания и исполнители, карточки доски - по запросу на вид, сколько бы ни было изменений
+        with self.assertNumQueries(4):
+            batch = build_batch(page)
+        self.assertEqual(batch['cursor'], page['next_cursor'])
+        orders = json.loads(batch['orders'].split('data: ', 1)[1])['changes']
+        deleted_id = next(change['order_id'] for change in page['changes'] if change['action'] == 'delete')
+        self.assertEqual({change['id']: change['action'] for change in orders},
+                         {order.pk: 'update', deleted_id: 'delete'})
+        self.assertEqual(next(change['row']['status'] for change in orders if change['id'] == order.pk), "Выполнено успешно")
+
+        activities = json.loads(batch['activities'].split('data: ', 1)[1])['changes']
+        moved = next(change for change in activities if change['id'] == activity.pk)
+        self.assertEqual(moved['column'], 'backlog')
+        self.assertIn(f'data-activity-id="{activity.pk}"', moved['html'])
+        public = json.loads(batch['activities_public'].split('data: ', 1)[1])['changes']
+        self.assertEqual(next(change for change in public if change['id'] == activity.pk),
+                         {'id': activity.pk, 'action': 'delete'})
+
+    async def test_one_poll_serves_all_clients(self):
+        broadcaster = Broadcaster(interval=3600)
+        managers = [await broadcaster.subscribe(4) for _ in range(3)]
+        worker = await broadcaster.subscribe(1)
+        try:
+            await sync_to_async(self.change_order_and_board)()
+            with mock.patch('newDivanApp.live_updates.changes_since', wraps=changes_since) as read:
+                await broadcaster.poll()
+            self.assertEqual(read.call_count, 1)
+
+            received = [[client.queue.get_nowait() for _ in range(client.queue.qsize())] for client in managers]
+            self.assertTrue(all(messages == received[0] for messages in received))
+            self.assertEqual([message.split('\n')[1] for message in received[0]],
+                             ['event: orders', 'event: activities'])
+            # сотруднику без доступа к заказам уходят только карточки доски, без бэклога
+            messages = [worker.queue.get_nowait() for _ in range(worker.queue.qsize())]
+            self.assertEqual(len(messages), 1)
+            self.assertIn('event: activities', messages[0])
+            self.assertNotIn('"backlog"', messages[0])
+        finally:
+            broadcaster.task.cancel()
+
+    async def test_reconnect_replays_missed_batches(self):
+        broadcaster = Broadcaster(interval=3600, history_size=2)
+        await broadcaster.subscribe(4)
+        try:
+            start = broadcaster.cursor
+            for step in range(1, 4):
+                broadcaster.publish({'cursor': start + step, 'orders': f'orders {step}', 'activities': None,
+                                     'activities_public': None})
+
+            client = await broadcaster.subscribe(4, last_event_id=start + 2)
+            self.assertEqual(client.queue.get_nowait(), 'orders 3')
+            self.assertTrue(client.queue.empty())
+            # первая пачка из истории уже вытеснена - клиент перечитывает данные сам
+            client = await broadcaster.subscribe(4, last_event_id=start)
+            self.assertIs(client.queue.get_nowait(), RESET)
+        finally:
+            broadcaster.task.cancel()
+
+    async def test_stream_endpoint(self):
+        response = await self.async_client.get(reverse('live_events'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        await stream.aclose()
+
+        bad = await self.async_client.get(reverse('live_events'), headers={'Last-Event-ID': 'x'})
+        self.assertEqual(bad.status_code, 400)
+
+
+class OrderExecutorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.user = seed_database(orders=3)
+        cls.manager = Employee.objects.get(user=cls.user)
+        cls.workers = list(Employee.objects.filter(first_name__startswith="Рабочий").order_by('pk'))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def executors(self, order):
+        return [assignment.employee_id for assignment in order.executor_assignments.all()]
+
+    def test_more_than_three_executors_in_given_order(self):
+        order = Order.objects.get(number="НД-0")
+        kept = order.executor_assignments.get(position=0).pk
+        team = [self.workers[0].pk, self.workers[2].pk, self.manager.pk, self.workers[1].pk]
+        with self.captureOnCommitCallbacks(execute=True):
+            set_order_executors(order, team + [self.workers[0].pk])
+
+        self.assertEqual(self.executors(order), team)
+        self.assertEqual(order.executor_assignments.get(position=0).pk, kept)
+        self.assertEqual([executor['full_name'] for executor in OrderListRow.objects.get(order=order).executors],
+                         ["Рабочий0 Сидоров", "Рабочий2 Сидоров", "Иван Петров", "Рабочий1 Сидоров"])
+        with self.assertRaises(ValidationError):
+            set_order_executors(order, [self.workers[0].pk, 10 ** 6])
+        self.assertEqual(self.executors(order), team)
+
+    def test_orders_of_executor_use_one_indexed_lookup(self):
+        worker = self.workers[2]
+        expected = set(OrderExecutor.objects.filter(employee=worker).values_list('order_id', flat=True))
+        response, recorder = get_recorded(self.client, reverse('orders'), {'executor': worker.pk},
+                                          HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertEqual({row['id'] for row in response.json()['data']}, expected)
+        self.assertEqual(response.json()['filtered_count'], len(expected))
+        self.assertEqual(len([sql for sql in recorder.shapes if 'orderexecutor' in sql.lower()]), 2)
+        self.assertEqual(set(worker.executed_orders.values_list('pk', flat=True)), expected)
+
+    def test_deleting_employee_keeps_orders(self):
+        worker = self.workers[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            worker.delete()
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertFalse(OrderExecutor.objects.filter(employee_id=worker.pk).exists())
@@ -0,0 +1,121 @@
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .storage import is_blob_name
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZES = (48, 320)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+THUMBNAIL_ROOT = 'thumbs'
+# Сколько секунд помнится, что копий нет: их может построить другой процесс
+THUMBNAIL_MISS_TIMEOUT = 60
+
+# Поля с изображениями, для которых строятся уменьшенные копии
+IMAGE_FIELDS = {
+    'Employee': ['avatar'],
+    'TechnicalSpecification': ['photo1', 'photo2', 'photo3', 'photo4'],
+    'Activity': ['photo1', 'photo2', 'photo3', 'photo4'],
+}
+
+
+# Путь копии вычисляется из имени оригинала, поэтому его не нужно хранить в БД:
+# avatars/ivan.jpg -> thumbs/avatars/ivan_48.webp
+def thumbnail_name(name, size, fmt='webp'):
+    stem = posixpath.splitext(name)[0]
+    return posixpath.join(THUMBNAIL_ROOT, f"{stem}_{size}.{fmt}")
+
+
+# Копии строятся после коммита и могут не получиться (например, файл не читается как изображение).
+# Пока копии нет, отдаётся адрес оригинала
+def thumbnail_url(fieldfile, size, fmt='webp'):
+    if not fieldfile:
+        return ''
+    if not thumbnails_available(fieldfile.name):
+        return fieldfile.url
+    return default_storage.url(thumbnail_name(fieldfile.name, size, fmt))
+
+
+# Есть ли копии, запоминается в кеше при их построении, поэтому отрисовка не обращается к хранилищу.
+# В хранилище смотрят, только если кеш о файле не знает: копии построены до запуска процесса или,
+# при LocMemCache (CACHES в settings.py не задан), другим процессом
+def thumbnails_available(name):
+    available = cache.get(_available_key(name))
+    if available is None:
+        available = thumbnails_exist(name)
+        remember_thumbnails(name, available)
+    return available
+
+
+def remember_thumbnails(name, available):
+    cache.set(_available_key(name), available, timeout=None if available else THUMBNAIL_MISS_TIMEOUT)
+
+
+def forget_thumbnails(name):
+    cache.delete(_available_key(name))
+
+
+def _available_key(name):
+    return 'thumbnails:' + name
+
+
+def _render(image, size, fmt):
+    thumb = image.copy()
+    thumb.thumbnail((size, size), Image.LANCZOS)
+    pil_format, options = THUMBNAIL_FORMATS[fmt]
+    buffer = BytesIO()
+    thumb.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def thumbnails_exist(name):
+    return all(default_storage.exists(thumbnail_name(name, size, fmt))
+               for size in THUMBNAIL_SIZES for fmt in THUMBNAIL_FORMATS)
+
+
+def generate_thumbnails(fieldfile, force=False):
+    if not fieldfile:
+        return 0
+    return build_thumbnails(fieldfile.storage, fieldfile.name, force)
+
+
+def build_thumbnails(storage, source_name, force=False):
+    # содержимое файла в blobs/ не меняется, готовые копии повторной загрузки подходят как есть
+    if not force and is_blob_name(source_name) and thumbnails_exist(source_name):
+        remember_thumbnails(source_name, True)
+        return 0
+    try:
+        with storage.open(source_name, 'rb') as source:
+            image = ImageOps.exif_transpose(Image.open(source))
+            image = image.convert('RGB')
+    except (OSError, UnidentifiedImageError) as e:
+        logger.warning("Не удалось построить миниатюры для %s: %s", source_name, e)
+        remember_thumbnails(source_name, False)
+        return 0
+
+    created = 0
+    for size in THUMBNAIL_SIZES:
+        for fmt in THUMBNAIL_FORMATS:
+            name = thumbnail_name(source_name, size, fmt)
+            # копии пишутся в обычное хранилище: путь копии должен оставаться предсказуемым,
+            # а storage.save добавляет суффикс к занятому имени
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, ContentFile(_render(image, size, fmt)))
+            created += 1
+    remember_thumbnails(source_name, True)
+    return created
+
+
+def generate_instance_thumbnails(instance, field_names=None):
+    field_names = field_names or IMAGE_FIELDS[type(instance).__name__]
+    return sum(generate_thumbnails(getattr(instance, field_name)) for field_name in field_names)
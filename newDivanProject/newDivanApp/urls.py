@@ -8,22 +8,32 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('main/', views.main_view, name='main'),
     path('calendar/', views.calendar_view, name='calendar'),
+    path('calendar/feed.ics', views.calendar_ics_view, name='calendar_ics'),
+    path('api/calendar/', views.calendar_events_view, name='calendar_events'),
     path('active/', views.active_view, name='active'),
     path('add_activity/', views.add_activity, name='add_activity'),
+    path('api/board/<str:column>/', views.board_column_view, name='board_column'),
 
     path('orders/', views.orders_view, name='orders'),
+    path('orders/export/', views.export_orders, name='export_orders'),
     path('add_order/', views.add_order, name='add_order'),
     path('delete-order/<int:order_id>/', views.delete_order, name='delete_order'),
     path('refactor_order/<int:order_id>/', views.refactor_order, name='refactor_order'),
 
 
     path('staff/', views.staff_view, name='staff'),
+    path('staff/export/', views.export_staff, name='export_staff'),
     path('add_employee/', views.add_employee, name='add_employee'),
     path('delete-employee/<int:employee_id>/', views.delete_employee, name='delete_employee'),
     path('refactor_employee/<int:employee_id>/', views.refactor_employee, name='refactor_employee'),
 
 
     path('api/get_order_data/', views.get_order_data, name='get_order_data'),
+    path('api/dashboard/', views.dashboard_kpis_view, name='dashboard_kpis'),
+    path('api/reports/revenue/', views.revenue_report_view, name='revenue_report'),
+    path('api/reports/payroll/', views.payroll_report_view, name='payroll_report'),
+    path('api/changes/', views.changes_view, name='changes'),
+    path('api/events/', views.live_events_view, name='live_events'),
 ]
 
 # Добавление маршрутов для обслуживания медиа-файлов в режиме разработки
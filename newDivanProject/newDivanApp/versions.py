@@ -0,0 +1,53 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import TableVersion
+
+# Таблицы, от которых зависят JSON-списки orders_view и staff_view (фильтр по исполнителю читает orderexecutor)
+ORDER_LIST_TABLES = ['order', 'orderexecutor', 'orderlistrow']
+STAFF_LIST_TABLES = ['employee', 'jobtitle', 'department']
+
+# Счётчики сбрасываются сменой версии таблиц; таймаут только не даёт кешу копить старые ключи
+COUNT_CACHE_TIMEOUT = 60 * 60
+
+
+def _table_name(model_or_name):
+    return model_or_name if isinstance(model_or_name, str) else model_or_name._meta.model_name
+
+
+# Вызывается в той же транзакции, что и изменение данных, поэтому новая версия видна вместе с ними
+def bump_table_versions(*models):
+    for table in sorted({_table_name(model) for model in models}):
+        if TableVersion.objects.filter(table=table).update(version=F('version') + 1):
+            continue
+        try:
+            with transaction.atomic():
+                TableVersion.objects.create(table=table, version=1)
+        except IntegrityError:
+            TableVersion.objects.filter(table=table).update(version=F('version') + 1)
+
+
+def get_table_versions(tables):
+    versions = dict(TableVersion.objects.filter(table__in=tables).values_list('table', 'version'))
+    return [versions.get(table, 0) for table in tables]
+
+
+def _digest(tables, params):
+    key = repr((get_table_versions(tables), sorted(params)))
+    return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+# ETag списка: версии таблиц плюс все GET-параметры (фильтры, сортировка, курсор).
+# Стоит один запрос к TableVersion, сам список при совпадении не читается
+def list_etag(request, tables):
+    return '"%s"' % _digest(tables, request.GET.lists())
+
+
+# COUNT(*) по набору фильтров считается один раз на версию таблиц. В filters передаются только
+# фильтры: курсор и размер страницы на число строк не влияют
+def cached_count(queryset, tables, filters):
+    key = 'list_count:%s:%s' % (queryset.model._meta.model_name, _digest(tables, filters.items()))
+    return cache.get_or_set(key, queryset.count, COUNT_CACHE_TIMEOUT)
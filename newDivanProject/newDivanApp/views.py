@@ -5,14 +5,41 @@ from .models import Order, TechnicalSpecification, Contract
 from django.core.serializers import serialize
 from .forms import (NameForm, AvatarForm, PositionForm, StatusForm, CitizenshipForm, PassportForm, SalaryForm)
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
 from django.db.models import Q
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timedelta
+from django.utils import timezone
 from django.db.models import Sum
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseBadRequest
+from .access import access_required, async_access_required
+from .concurrency import gather_queries
+from asgiref.sync import sync_to_async
+from .reference_data import get_reference_data
+from .conditional import conditional_json_response, set_revalidation_headers
+from .versions import ORDER_LIST_TABLES, STAFF_LIST_TABLES, list_etag, cached_count
+from django.utils.cache import get_conditional_response
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from .pagination import keyset_page, get_page_size, CursorError
+from .search import search_order_ids
+from .filters import filter_orders, staff_filters, filter_employees
+from .reports import REPORT_DIMENSIONS, revenue_report
+from .payroll import payroll_periods, payroll_report
+from .live_updates import broadcaster
+from .changelog import CHANGES_PAGE_SIZE, MAX_CHANGES_PAGE_SIZE, changes_since
+from .calendar_feed import MAX_RANGE_DAYS, calendar_events, ical_calendar, parse_sync_token
+from .exports import (EXPORT_FORMATS, ORDER_EXPORT_HEADER, STAFF_EXPORT_HEADER, export_response, order_export_rows,
+                      staff_export_rows)
+from .dashboard import get_dashboard_kpis, aget_dashboard_kpis, get_dashboard_orders
+from .board import load_board, load_column, clock_color, BOARD_COLUMNS
+from .read_models import format_orders_data
+from django.template.loader import render_to_string
+from django.db.models import Case, When, Value, IntegerField, Prefetch
+from django.core.exceptions import ValidationError
+from .services import (create_order, employee_id_errors, order_data_from_post, order_number_errors,
+                       parse_whole_amount, set_order_executors)
 
 def logout_view(request):
     logout(request)
@@ -40,48 +67,121 @@ def login_view(request):
 
     return render(request, 'auth.html')
 
-@login_required
+@access_required()
 def main_view(request):
-
-    employee = Employee.objects.get(user=request.user)
-
-    if employee.position.access_lvl < 2:
-        return redirect('active')
-
-    orders = Order.objects.all().select_related('contract').prefetch_related('technical_specifications')
-    total_orders = orders.count()  # Подсчитываем количество заказов
-    total_employees = Employee.objects.count()
-
-    total_contract_value = Order.objects.aggregate(total_value_sum=Sum('contract__total_value'))['total_value_sum']
-    if total_contract_value is None:
-        total_contract_value = 0  # Handling cases where there are no orders/contracts
+    context = get_dashboard_kpis().copy()
+    context.update({
+        'orders': get_dashboard_orders(),
+        'employee' : request.employee
+    })
+    return render(request, 'main.html', context)
+
+# Показатели дашборда для обновления без перезагрузки страницы
+@async_access_required()
+async def dashboard_kpis_view(request):
+    return conditional_json_response(request, await aget_dashboard_kpis())
+
+# Отчёт по выручке из сводной таблицы RevenueRollup:
+# ?group_by=month,manager,source,furniture_type,work_type&start=2024-01&end=2024-12
+@access_required()
+def revenue_report_view(request):
+    group_by = [name for name in request.GET.get('group_by', 'month').split(',') if name]
+    if not group_by or any(name not in REPORT_DIMENSIONS for name in group_by):
+        return HttpResponseBadRequest('Допустимые разрезы: ' + ', '.join(REPORT_DIMENSIONS))
+    try:
+        start, end = [datetime.strptime(request.GET[key], '%Y-%m').date() if request.GET.get(key) else None
+                      for key in ('start', 'end')]
+    except ValueError:
+        return HttpResponseBadRequest('Месяц указывается в формате ГГГГ-ММ')
+    return conditional_json_response(request, revenue_report(group_by, start, end))
+
+# Закрытые зарплатные ведомости: без параметров - список месяцев с итогами, ?month=2024-06 - строки ведомости.
+# Данные берутся из снимка, сделанного при закрытии, и не пересчитываются
+@access_required()
+def payroll_report_view(request):
+    if not request.GET.get('month'):
+        return conditional_json_response(request, payroll_periods())
+    try:
+        month = datetime.strptime(request.GET['month'], '%Y-%m').date()
+    except ValueError:
+        return HttpResponseBadRequest('Месяц указывается в формате ГГГГ-ММ')
+    report = payroll_report(month)
+    if report is None:
+        return JsonResponse({'error': 'Ведомость за этот месяц не закрыта'}, status=404)
+    return conditional_json_response(request, report)
+
+# Журнал изменений после курсора: ?since=N (id последней полученной записи, 0 - с начала)&limit=M.
+# Клиент сохраняет next_cursor и запрашивает дальше, пока has_more
+@access_required()
+def changes_view(request):
+    try:
+        since = int(request.GET.get('since') or 0)
+        limit = min(int(request.GET.get('limit') or CHANGES_PAGE_SIZE), MAX_CHANGES_PAGE_SIZE)
+    except ValueError:
+        return HttpResponseBadRequest('since и limit - целые числа')
+    if since < 0 or limit < 1:
+        return HttpResponseBadRequest('since и limit - целые числа')
+    return conditional_json_response(request, changes_since(since, limit))
+
+# Поток Server-Sent Events с изменениями заказов и активностей для orders.html и active.html.
+# Все подключения процесса обслуживает одна рассылка (live_updates.broadcaster); после обрыва
+# EventSource присылает Last-Event-ID, и пропущенное досылается из истории
+@async_access_required(min_level=0)
+async def live_events_view(request):
+    last_event_id = request.headers.get('Last-Event-ID') or None
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return HttpResponseBadRequest('Last-Event-ID - целое число')
+    stream = broadcaster.stream(request.employee.position.access_lvl or 0, last_event_id)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx не должен копить поток в буфере
+    return response
+
+@access_required()
+def calendar_view(request):
+    return render(request, 'calendar.html')
 
 
-    completed_count = Order.objects.filter(status__in=['closed', 'delivered']).count()
+# Период календаря из ?start=&end= (ГГГГ-ММ-ДД, включительно); без параметров - от days_before дней назад
+# до days_after дней вперёд
+def _calendar_range(params, days_before, days_after):
+    today = timezone.localdate()
+    start = datetime.strptime(params['start'], '%Y-%m-%d').date() if params.get('start') else (
+        today - timedelta(days=days_before))
+    end = datetime.strptime(params['end'], '%Y-%m-%d').date() if params.get('end') else (
+        today + timedelta(days=days_after))
+    if end < start or (end - start).days > MAX_RANGE_DAYS:
+        raise ValueError
+    return start, end
 
-    # Заказы в очереди
-    queue_count = Order.objects.filter(status__in=[
-        'to_do', 'registered', 'to_pickup', 'is_picked', 'to_deliver'
-    ]).count()
 
-    # Заказы в работе
-    in_progress_count = Order.objects.filter(status__in=[
-        'in_progress', 'in_review', 'suspended'
-    ]).count()
+# События календаря: заборы, доставки, сроки по договорам и даты активностей.
+# ?sync_token= из прошлого ответа - только изменившиеся события и полный список id периода
+@access_required()
+def calendar_events_view(request):
+    try:
+        start, end = _calendar_range(request.GET, 0, 30)
+        since = parse_sync_token(request.GET['sync_token']) if request.GET.get('sync_token') else None
+    except (ValueError, OverflowError):
+        return HttpResponseBadRequest(f'Период задаётся датами ГГГГ-ММ-ДД, не длиннее {MAX_RANGE_DAYS} дней; '
+                                      f'sync_token берётся из прошлого ответа')
+    return conditional_json_response(request, calendar_events(start, end, since))
 
-    return render(request, 'main.html', {
-        'orders': orders,
-        'total_orders': total_orders,
-        'total_employees': total_employees,
-        'total_contract_value': total_contract_value,
-        'completed_count': completed_count,
-        'queue_count': queue_count,
-        'in_progress_count': in_progress_count,
-        'employee' : employee
-    })
 
-def calendar_view(request):
-    return render(request, 'calendar.html')
+# Те же события файлом .ics для Google Calendar, Outlook и телефонов: по умолчанию месяц назад и полгода вперёд
+@access_required()
+def calendar_ics_view(request):
+    try:
+        start, end = _calendar_range(request.GET, 30, 180)
+    except ValueError:
+        return HttpResponseBadRequest(f'Период задаётся датами ГГГГ-ММ-ДД, не длиннее {MAX_RANGE_DAYS} дней')
+    response = HttpResponse(ical_calendar(calendar_events(start, end)['events']),
+                            content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="newdivan.ics"'
+    return response
 
 
 def add_activity(request):
@@ -132,398 +232,173 @@ def add_activity(request):
 
         return redirect('active')  # replace 'success_page' with your actual success page URL name
 
-    worker_position = JobTitle.objects.filter(name='Рабочий').first()
-    executors = Employee.objects.filter(position=worker_position) if worker_position else Employee.objects.none()
     orders = Order.objects.all()
 
     context = {
         'orders': orders,
-        'executors': executors
+        'executors': get_reference_data()['workers']
     }
     return render(request, 'add_activity.html', context)
 
 
 
-def get_order_data(request):
-    order_number = request.GET.get('order_number')
-    try:
-        order = Order.objects.get(number=order_number)
-        tech_spec = TechnicalSpecification.objects.get(order=order)
-        materials = Material.objects.filter(order=order)
+MAX_ORDER_DATA_BATCH = 500
 
-        data = {
+
+# Данные ТЗ и материалов по номерам заказов для формы add_activity.html.
+# ?order_number=НД-1 - один заказ (404, если не найден); ?order_numbers=НД-1,НД-2 - пакет
+# {"orders": {номер: данные}, "missing": [...]}. Число запросов не зависит от количества номеров
+async def get_order_data(request):
+    batch = 'order_numbers' in request.GET
+    if batch:
+        numbers = [number for value in request.GET.getlist('order_numbers') for number in value.split(',') if number]
+    else:
+        numbers = [request.GET.get('order_number')]
+    if len(numbers) > MAX_ORDER_DATA_BATCH:
+        return HttpResponseBadRequest(f"Не больше {MAX_ORDER_DATA_BATCH} номеров за запрос")
+
+    orders = Order.objects.filter(number__in=numbers).prefetch_related(
+        'technical_specifications',
+        Prefetch('material_set', queryset=Material.objects.order_by('pk')),
+    )
+    found = {}
+    async for order in orders:
+        tech_spec = next(iter(order.technical_specifications.all()), None)
+        if tech_spec is None:
+            continue
+        found[order.number] = {
             'furniture_type': tech_spec.furniture_type1,
             'work_types': tech_spec.work_type1,
             'item_type': tech_spec.item_type,
             'items_qty': tech_spec.items_qty,
             'short_descr': tech_spec.short_descr,
-            'materials': list(materials.values('name', 'fitting_name', 'in_stock', 'fitting_in_stock')),
+            'materials': [
+                {'name': m.name, 'fitting_name': m.fitting_name, 'in_stock': m.in_stock,
+                 'fitting_in_stock': m.fitting_in_stock}
+                for m in order.material_set.all()
+            ],
         }
-        return JsonResponse(data)
-    except (Order.DoesNotExist, TechnicalSpecification.DoesNotExist) as e:
+
+    if batch:
+        data = {'orders': found, 'missing': [number for number in numbers if number not in found]}
+    elif numbers[0] in found:
+        data = found[numbers[0]]
+    else:
         return JsonResponse({'error': 'Заказ не найден'}, status=404)
+    return conditional_json_response(request, data)
+
 
 def active_view(request):
-    departments = Department.objects.all()
-    positions = JobTitle.objects.all()
-    employees = Employee.objects.select_related('position', 'department').all()
-    activities = Activity.objects.select_related('employee', 'order').all()
-
-    backlog_activities = []
-    to_do_activities = []
-    in_progress_activities = []
-    in_review_activities = []
-    closed_activities = []
-
-    for activity in activities:
-        try:
-            order = activity.order
-            tech_spec = TechnicalSpecification.objects.get(order=order)
-            contract = Contract.objects.get(order=order)
-            responsible_employee = activity.employee
-
-            activity_data = {
-                'profile_image': responsible_employee.avatar.url if responsible_employee.avatar else None,
-                'employee_name': f"{responsible_employee.first_name} {responsible_employee.last_name}",
-                'order_number': order.number,
-                'short_descr': tech_spec.short_descr,
-                'furniture_type': tech_spec.furniture_type1,
-                'completion_date': contract.completion_date,
-            }
-
-            if activity.status == 'backlog':
-                backlog_activities.append(activity_data)
-            elif activity.status == 'to_do':
-                to_do_activities.append(activity_data)
-            elif activity.status == 'in_progress':
-                in_progress_activities.append(activity_data)
-            elif activity.status == 'in_review':
-                in_review_activities.append(activity_data)
-            elif activity.status in ['closed_positive', 'closed_negative']:
-                closed_activities.append(activity_data)
-        except TechnicalSpecification.DoesNotExist:
-            continue
-        except Contract.DoesNotExist:
-            continue
+    departments = get_reference_data()['departments']
+    board = load_board()
 
     context = {
-        'employees': employees,
         'departments': departments,
-        'positions': positions,
-        'backlog_activities': backlog_activities,
-        'to_do_activities': to_do_activities,
-        'in_progress_activities': in_progress_activities,
-        'in_review_activities': in_review_activities,
-        'closed_activities': closed_activities
+        'board': board,
     }
     return render(request, 'active.html', context)
 
 
+@login_required
+def board_column_view(request, column):
+    if column not in BOARD_COLUMNS:
+        return JsonResponse({'error': 'Колонка не найдена'}, status=404)
 
+    try:
+        data = load_column(column, request.GET.get('cursor'))
+    except CursorError as e:
+        return HttpResponseBadRequest(str(e))
 
+    html = render_to_string('activity_cards.html', {
+        'activities': data['items'],
+        'clock_color': clock_color(column),
+    })
+    return JsonResponse({'html': html, 'next_cursor': data['next_cursor']})
 
 
 
 
-#ЗАКАЗЫ
-def get_payment_status(contract, pickup_delivery):
-    if not contract.is_prepayment_paid and not contract.is_postpayment_paid:
-        return "Ожидает предоплаты"
-    elif contract.is_prepayment_paid and not contract.is_postpayment_paid:
-        if pickup_delivery and pickup_delivery.delivery_date:
-            return "Ожидает оплаты"
-        return "Внесена предоплата"
-    elif contract.is_postpayment_paid:
-        return "Оплата произведена"
-    return "Неопределенный статус"
 
-@login_required
-def orders_view(request):
-    employee = Employee.objects.get(user=request.user)
-
-    if employee.position.access_lvl < 2:
-        return redirect('active')
 
 
-    orders = Order.objects.select_related(
-        'contract', 'manager', 'executor1', 'executor2', 'executor3'
-    ).prefetch_related('technical_specifications', 'pickupdelivery_set')
 
-    total_count = orders.count()
+#ЗАКАЗЫ
+# Поля, по которым таблица заказов сортируется на сервере
+ORDER_SORT_FIELDS = ['number', 'create_date', 'completion_date', 'total_value', 'payment_status']
+
+@async_access_required()
+async def orders_view(request):
+    # Страница отдаёт только фильтры, таблицу заказов она подгружает AJAX-запросами
+    if request.headers.get('X-Requested-With') != 'XMLHttpRequest':
+        return await sync_to_async(render)(request, 'orders.html')
+
+    # Клиент уже видел этот список и с тех пор ничего не менялось - 304 без запросов к списку
+    etag = await sync_to_async(list_etag)(request, ORDER_LIST_TABLES)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return set_revalidation_headers(not_modified, etag)
+
+    sort = request.GET.get('sort', '')
+    descending = request.GET.get('direction', 'desc') != 'asc'
+    if sort and sort not in ORDER_SORT_FIELDS:
+        return HttpResponseBadRequest('Недопустимое поле сортировки')
 
-    # Получаем параметры фильтрации из GET-запроса
     search_query = request.GET.get('search_query', '')
-    status_filter = request.GET.get('status', '')
-    type_filter = request.GET.get('type', '')
-    payment_status_filter = request.GET.get('payment_status', '')
-    start_date = request.GET.get('start_date', '')
-    end_date = request.GET.get('end_date', '')
-
-    # Фильтрация по номеру заказа или описанию
-    if search_query:
-        orders = orders.filter(
-            Q(number__icontains=search_query) |
-            Q(technical_specifications__short_descr__icontains=search_query)
-        ).distinct()
-
-    # Фильтрация по статусу заказа
-    if status_filter:
-        orders = orders.filter(status=status_filter)
-
-    # Фильтрация по типу мебели
-    if type_filter:
-        orders = orders.filter(technical_specifications__furniture_type1=type_filter)
-
-    # Расширенная фильтрация по статусу оплаты
-    if payment_status_filter:
-        if payment_status_filter == "awaiting_prepayment":
-            orders = orders.filter(contract__is_prepayment_paid=False, contract__is_postpayment_paid=False)
-        elif payment_status_filter == "prepayment_made":
-            orders = orders.filter(contract__is_prepayment_paid=True, contract__is_postpayment_paid=False, pickupdelivery_set__delivery_date__isnull=True)
-        elif payment_status_filter == "awaiting_payment":
-            orders = orders.filter(contract__is_prepayment_paid=True, contract__is_postpayment_paid=False, pickupdelivery_set__delivery_date__isnull=False)
-        elif payment_status_filter == "payment_done":
-            orders = orders.filter(contract__is_postpayment_paid=True)
-
-    if start_date and end_date:
-        orders = orders.filter(contract__create_date__range=[start_date, end_date])
-
-    # AJAX запрос для обновления таблицы заказов без перезагрузки страницы
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        data = format_orders_data(orders)
-        return JsonResponse({'data': data, 'total_count': total_count}, safe=False)
-
-    return render(request, 'orders.html', {
-        'orders': orders
-    })
-
-def format_orders_data(orders):
-    data = []
-    for order in orders:
-        pickup_delivery = order.pickupdelivery_set.first()
-        payment_status = get_payment_status(order.contract, pickup_delivery)
-
-        # Список исполнителей
-        executors = []
-        for executor in [order.executor1, order.executor2, order.executor3]:
-            if executor:
-                executors.append({
-                    'avatar_url': executor.avatar.url if executor.avatar else '',
-                    'full_name': f"{executor.first_name} {executor.last_name}"
-                })
-
-        # Добавление информации о менеджере
-        manager = {
-            'full_name': f"{order.manager.first_name} {order.manager.last_name}" if order.manager else "Нет данных",
-            'avatar_url': order.manager.avatar.url if order.manager and order.manager.avatar else ''
-        }
-
-        data.append({
-            'id': order.id,
-            'number': order.number,
-            'create_date': order.contract.create_date.strftime('%d.%m.%Y'),
-            'completion_date': order.contract.completion_date.strftime('%d.%m.%Y'),
-            'total_value': "{:,.2f}".format(order.contract.total_value).replace(",", " ").replace(".", ","),
-            'type': order.technical_specifications.first().get_furniture_type1_display() if order.technical_specifications.exists() else '',
-            'description': order.technical_specifications.first().short_descr if order.technical_specifications.exists() else '',
-            'payment_status': payment_status,
-            'status': order.get_status_display(),
-            'executors': executors,
-            'manager': manager  # Добавление информации о менеджере в вывод
-        })
-    return data
+    # Список читается из плоской таблицы OrderListRow без JOIN-ов; поиск отбирает все совпадения
+    orders = filter_orders(OrderListRow.objects.all(), request.GET)
+    # лучшие SEARCH_LIMIT совпадений нужны только для сортировки по релевантности
+    search_ids = await sync_to_async(search_order_ids)(search_query) if search_query and not sort else None
+
+    if sort:
+        sort_key = sort
+    elif search_ids:
+        # При поиске без явной сортировки строки идут в порядке релевантности, остальные совпадения - после них
+        sort_key = Case(*[When(order_id=order_id, then=Value(rank)) for rank, order_id in enumerate(search_ids)],
+                        default=Value(len(search_ids)), output_field=IntegerField())
+        descending = False
+    else:
+        sort_key = 'create_date'
+    page_size = get_page_size(request.GET.get('page_size'))
 
+    # Страница и оба счётчика друг от друга не зависят и запрашиваются одновременно
+    try:
+        (page, next_cursor), total_count, filtered_count = await gather_queries(
+            lambda: keyset_page(orders, sort_key, descending, request.GET.get('cursor'), page_size,
+                                cursor_key='relevance'),
+            OrderListRow.objects.count,
+            orders.count,
+        )
+    except CursorError as e:
+        return HttpResponseBadRequest(str(e))
+
+    data = format_orders_data(page)
+    return set_revalidation_headers(JsonResponse({
+        'data': data,
+        'total_count': total_count,
+        'filtered_count': filtered_count,
+        'next_cursor': next_cursor,
+    }, safe=False), etag)
+
+# Выгрузка заказов с фильтрами таблицы: ?format=csv|xlsx плюс те же параметры, что у orders_view
+@access_required()
+def export_orders(request):
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Неизвестный формат выгрузки')
+    return export_response(ORDER_EXPORT_HEADER, order_export_rows(request.GET), fmt, 'orders', "Заказы")
 
 @csrf_exempt
-@login_required
+@access_required()
 def add_order(request):
-    employee = Employee.objects.get(user=request.user)
-
-    if employee.position.access_lvl < 2:
-        return redirect('active')
-
-    manager_position = JobTitle.objects.filter(name='Менеджер').first()
-    managers = Employee.objects.filter(position=manager_position) if manager_position else Employee.objects.none()
-    worker_position = JobTitle.objects.filter(name='Рабочий').first()
-    executors = Employee.objects.filter(position=worker_position) if worker_position else Employee.objects.none()
+    reference = get_reference_data()
+    managers = reference['managers']
+    executors = reference['workers']
 
     if request.method == 'POST':
-        #заказ
-        number = request.POST.get('number')
-        manager_id = request.POST.get('manager')
-        executors_ids = request.POST.get('executors', '')
-        executors_ids = executors_ids.split(',') if executors_ids else []
-        source = request.POST.get('source')
-
-        #договор
-        contract_num = request.POST.get('contract_num')
-        create_date = request.POST.get('create_date')
-        completion_date = request.POST.get('completion_date')
-        total_value = request.POST.get('total_value')
-        payment_type = request.POST.get('payment_type')
-        prepayment_share = request.POST.get('prepayment_share')
-        prepayment_value = request.POST.get('prepayment_value')
-        is_prepayment_paid = request.POST.get('is_prepayment_paid') == 'true'
-        prepayment_date = request.POST.get('prepayment_date')
-        postpayment_value = request.POST.get('postpayment_value')
-        is_postpayment_paid = request.POST.get('is_postpayment_paid') == 'true'
-        postpayment_date = request.POST.get('postpayment_date')
-
-        #клиент
-        address = request.POST.get('address')
-        contact_number = request.POST.get('contact_number')
-        full_name = request.POST.get('full_name')
-        comments = request.POST.get('comments')
-
-
-        #тех. задание
-        items_qty = int(request.POST.get('items_qty'))
-        short_descr = request.POST.get('short_descr')
-        item_type = request.POST.get('item_type')
-        furniture_type1 = request.POST.get('furniture_type1')
-        work_types = request.POST.get('work_types').split(',')
-        full_descr = request.POST.get('full_descr')
-        photo1 = request.FILES.get('photo1', None)
-        photo2 = request.FILES.get('photo2', None)
-        photo3 = request.FILES.get('photo3', None)
-        photo4 = request.FILES.get('photo4', None)
-        technicalspecification_comments = request.POST.get('technicalspecification_comments')
-
-        # Сбор данных о материалах из POST запроса
-        material_name = request.POST.get('material_name')
-        stock = request.POST.get('stock') == 'true'
-        fitting_name = request.POST.get('fitting_name')
-        fitting_in_stock = request.POST.get('fitting_in_stock') == 'true'
-        material_comments = request.POST.get('material_comments')
-        material_cost = float(request.POST.get('material_cost'))
-        material_order_status = request.POST.get('material_order_status')
-        material_order_date = request.POST.get('material_order_date')
-        material_payment_status = request.POST.get('material_payment_status')
-        material_payment_date = request.POST.get('material_payment_date')
-
-        # Добавление данных забора
-        is_picked = request.POST.get('pickupdelivery_is_picked') == 'true'
-        pickup_date = request.POST.get('pickupdelivery_pickup_date')
-        pickup_time = request.POST.get('pickupdelivery_pickup_time')
-        pickup_type = request.POST.get('pickupdelivery_pickup_type')
-        pickup_guy_id = request.POST.get('pickup_guy')
-        pickup_comments = request.POST.get('pickupdelivery_pickup_comments')
-
-        # Добавление данных доставки
-        is_delivered = request.POST.get('pickupdelivery_is_delivered') == 'true'
-        delivery_date = request.POST.get('pickupdelivery_delivery_date')
-        delivery_time = request.POST.get('pickupdelivery_delivery_time')
-        delivery_type = request.POST.get('pickupdelivery_delivery_type')
-        delivery_guy_id = request.POST.get('delivery_guy')
-        delivery_comments = request.POST.get('pickupdelivery_delivery_comments')
-
-
-        # Create a Client instance
-        client = Client(
-            first_name=full_name.split()[1],
-            last_name=full_name.split()[0] if len(full_name.split()) > 1 else '',
-            middle_name=full_name.split()[2] if len(full_name.split()) > 2 else '',
-            contact_number=contact_number,
-            address=address,
-            comments=comments
-        )
-        client.save()
-
-        # Parse dates and calculate the duration
-        create_date_dt = datetime.strptime(create_date, '%Y-%m-%d')
-        completion_date_dt = datetime.strptime(completion_date, '%Y-%m-%d')
-        duration = (completion_date_dt - create_date_dt).days
-
-
-        # Create a Contract instance
-        contract = Contract(
-            num=contract_num,
-            client=client,
-            create_date=create_date_dt,
-            completion_date=completion_date_dt,
-            duration=duration,
-            total_value=float(total_value),
-            total_work_cost=float(total_value),
-            payment_type=payment_type,
-            prepayment_share=float(prepayment_share),
-            prepayment_value=float(prepayment_value),
-            is_prepayment_paid=is_prepayment_paid,
-            prepayment_date=datetime.strptime(prepayment_date, '%Y-%m-%d') if prepayment_date else None,
-            postpayment_value=float(postpayment_value),
-            is_postpayment_paid=is_postpayment_paid,
-            postpayment_date=datetime.strptime(postpayment_date, '%Y-%m-%d') if postpayment_date else None,
-            comments=comments,
-        )
-        contract.save()
-
-        # Create an Order instance
-        manager = Employee.objects.get(id=manager_id)
-        new_order = Order(
-            number=number,
-            manager=manager,
-            source=source,
-            contract=contract,
-            status='registered',
-            executor1 = Employee.objects.get(id=executors_ids[0]) if len(executors_ids) > 0 else None,
-            executor2 = Employee.objects.get(id=executors_ids[1]) if len(executors_ids) > 1 else None,
-            executor3 = Employee.objects.get(id=executors_ids[2]) if len(executors_ids) > 2 else None
-        )
-        new_order.save()
-
-        # Создание технического задания
-        TechnicalSpecification.objects.create(
-            order=new_order,
-            items_qty=items_qty,
-            short_descr=short_descr,
-            item_type=item_type,
-            furniture_type1=furniture_type1,
-            work_type1=work_types[0] if len(work_types) > 0 else None,
-            work_type2=work_types[1] if len(work_types) > 1 else None,
-            full_descr=full_descr,
-            photo1=photo1,
-            photo2=photo2,
-            photo3=photo3,
-            photo4=photo4,
-            comments = technicalspecification_comments
-        )
-
-        # Создание объекта Material
-        material = Material(
-            order=new_order,
-            name=material_name,
-            in_stock=stock,
-            cost=material_cost,
-            order_status=material_order_status,
-            order_date=datetime.strptime(material_order_date, '%Y-%m-%d') if material_order_date else None,
-            payment_status=material_payment_status,
-            payment_date=datetime.strptime(material_payment_date, '%Y-%m-%d') if material_payment_date else None,
-            fitting_name=fitting_name,
-            fitting_in_stock=fitting_in_stock,
-            comments=material_comments
-        )
-        material.save()
-
-        pickup = PickupDelivery(
-            order=new_order,
-            is_picked=is_picked,
-            pickup_date=datetime.strptime(pickup_date, '%Y-%m-%d') if pickup_date else None,
-            pickup_time=pickup_time,
-            pickup_type=pickup_type,
-            pickup_guy=Employee.objects.get(id=pickup_guy_id) if pickup_guy_id else None,
-            pickup_comments=pickup_comments,
-            is_delivered = is_delivered,
-            delivery_date = datetime.strptime(delivery_date, '%Y-%m-%d') if delivery_date else None,
-            delivery_time = delivery_time,
-            delivery_type = delivery_type,
-            delivery_guy = Employee.objects.get(id=delivery_guy_id) if delivery_guy_id else None,
-            delivery_comments = delivery_comments
-        )
-        pickup.save()
-
-
-
-
-
+        try:
+            create_order(order_data_from_post(request.POST, request.FILES))
+        except ValidationError as error:
+            return HttpResponseBadRequest('\n'.join(error.messages))
         return redirect('orders')
 
     else:
@@ -535,14 +410,8 @@ def add_order(request):
 
 
 @csrf_exempt
-@login_required
+@access_required()
 def delete_order(request, order_id):
-
-    employee = Employee.objects.get(user=request.user)
-
-    if employee.position.access_lvl < 2:
-        return redirect('active')
-
     if request.method == 'POST':
         try:
             order = Order.objects.get(pk=order_id)
@@ -553,14 +422,11 @@ def delete_order(request, order_id):
     return JsonResponse({'success': False, 'error': 'Неверный запрос'})
 
 
+# Все записи POST идут одной транзакцией: ошибка на середине не оставляет заказ наполовину изменённым
 @csrf_exempt
-@login_required
+@access_required()
+@transaction.atomic
 def refactor_order(request, order_id):
-    employee = Employee.objects.get(user=request.user)
-
-    if employee.position.access_lvl < 2:
-        return redirect('active')
-
     # Получаем заказ по ID
     order = get_object_or_404(Order, id=order_id)
 
@@ -573,12 +439,25 @@ def refactor_order(request, order_id):
 
 
     # Загружаем список менеджеров и исполнителей
-    manager_position = JobTitle.objects.filter(name='Менеджер').first()
-    managers = Employee.objects.filter(position=manager_position) if manager_position else Employee.objects.none()
-    worker_position = JobTitle.objects.filter(name='Рабочий').first()
-    executors = Employee.objects.filter(position=worker_position) if worker_position else Employee.objects.none()
+    reference = get_reference_data()
+    managers = reference['managers']
+    executors = reference['workers']
 
     if request.method == 'POST':
+        try:
+            executor_ids = [int(value) for value in request.POST.get('executors', '').split(',') if value]
+        except ValueError:
+            return HttpResponseBadRequest('Некорректный список исполнителей')
+        number = request.POST.get('number')
+        if not number:
+            return HttpResponseBadRequest('number: обязательное поле')
+        # всё, что отклоняется с 400, проверяется до первой записи
+        errors = order_number_errors([number], exclude_order_id=order.pk) + employee_id_errors(executor_ids)
+        prepayment_value = parse_whole_amount(request.POST.get('prepayment_value'), 'prepayment_value', errors)
+        postpayment_value = parse_whole_amount(request.POST.get('postpayment_value'), 'postpayment_value', errors)
+        if errors:
+            return HttpResponseBadRequest('\n'.join(errors))
+
         # Обновляем клиента
         client.address = request.POST.get('address')
         client.contact_number = request.POST.get('contact_number')
@@ -593,11 +472,11 @@ def refactor_order(request, order_id):
         contract.total_value = float(request.POST.get('total_value'))
         contract.payment_type = request.POST.get('payment_type')
         contract.prepayment_share = float(request.POST.get('prepayment_share'))
-        contract.prepayment_value = float(request.POST.get('prepayment_value'))
+        contract.prepayment_value = prepayment_value
         contract.is_prepayment_paid = request.POST.get('is_prepayment_paid') == 'true'
         contract.prepayment_date = datetime.strptime(request.POST.get('prepayment_date'),
                                                      '%Y-%m-%d') if request.POST.get('prepayment_date') else None
-        contract.postpayment_value = float(request.POST.get('postpayment_value'))
+        contract.postpayment_value = postpayment_value
         contract.is_postpayment_paid = request.POST.get('is_postpayment_paid') == 'true'
         contract.postpayment_date = datetime.strptime(request.POST.get('postpayment_date'),
                                                       '%Y-%m-%d') if request.POST.get('postpayment_date') else None
@@ -605,14 +484,12 @@ def refactor_order(request, order_id):
         contract.save()
 
         # Обновляем заказ
-        order.number = request.POST.get('number')
+        order.number = number
         order.manager_id = request.POST.get('manager')
-        executors_ids = request.POST.get('executors', '').split(',') if request.POST.get('executors') else []
-        order.executor1 = Employee.objects.get(id=executors_ids[0]) if len(executors_ids) > 0 else None
-        order.executor2 = Employee.objects.get(id=executors_ids[1]) if len(executors_ids) > 1 else None
-        order.executor3 = Employee.objects.get(id=executors_ids[2]) if len(executors_ids) > 2 else None
         order.source = request.POST.get('source')
         order.save()
+        # число исполнителей не ограничено
+        set_order_executors(order, executor_ids)
 
         # Обновляем техническое задание
         technical_specification.items_qty = int(request.POST.get('items_qty'))
@@ -673,14 +550,7 @@ def refactor_order(request, order_id):
         return redirect('orders')
 
     else:
-        executors_list = []
-        if order.executor1:
-            executors_list.append(order.executor1)
-        if order.executor2:
-            executors_list.append(order.executor2)
-        if order.executor3:
-            executors_list.append(order.executor3)
-
+        executors_list = [assignment.employee for assignment in order.executor_assignments.select_related('employee')]
 
         context = {
             'order': order,
@@ -698,68 +568,72 @@ def refactor_order(request, order_id):
 
 
 #СОТРУДНИКИ
-@login_required
-def staff_view(request):
-    employee = Employee.objects.get(user=request.user)
-
-    if employee.position.access_lvl < 2:
-        return redirect('active')
-
-    departments = Department.objects.all()
-    positions = JobTitle.objects.all()
-    employees = Employee.objects.select_related('position', 'department').all()
-    total_count = employees.count()
-
-    search_name = request.GET.get('search_name', '')
-    if search_name:
-        query = Q()
-        for term in search_name.split():
-            query |= Q(first_name__icontains=term) | Q(last_name__icontains=term) | Q(middle_name__icontains=term)
-        employees = employees.filter(query)
-
-    status = request.GET.get('status', '')
-    if status:
-        employees = employees.filter(status=status)
-
-    department_id = request.GET.get('department', '')
-    if department_id:
-        employees = employees.filter(department_id=department_id)
-
-    payment_type = request.GET.get('payment_type', '')
-    if payment_type:
-        employees = employees.filter(type_salary=payment_type)
-
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        data = [{
-            'id': employee.id,
-            'full_name': f"{employee.last_name} {employee.first_name} {employee.middle_name}",
-            'position': employee.position.name if employee.position else "",
-            'department': employee.department.name if employee.department else "",
-            'status': employee.get_status_display(),
-            'employment_date': employee.employment_date,
-            'type_salary': employee.get_type_salary_display(),
-            'salary': employee.salary
-        } for employee in employees]
-
-        return JsonResponse({'data': data, 'total_count': total_count}, safe=False)
+@async_access_required()
+async def staff_view(request):
+    # Страница отдаёт только фильтры, таблицу сотрудников она подгружает AJAX-запросами
+    if request.headers.get('X-Requested-With') != 'XMLHttpRequest':
+        reference = await sync_to_async(get_reference_data)()
+        return await sync_to_async(render)(request, 'staff.html', {
+            'departments': reference['departments'],
+            'positions': reference['positions']
+        })
 
-    context = {
-        'employees': employees,
-        'departments': departments,
-        'positions': positions
-    }
-    return render(request, 'staff.html', context)
+    etag = await sync_to_async(list_etag)(request, STAFF_LIST_TABLES)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return set_revalidation_headers(not_modified, etag)
 
-@csrf_exempt
-@login_required
-def add_employee(request):
-    employee = Employee.objects.get(user=request.user)
+    employees = Employee.objects.select_related('position', 'department')
+    filters = staff_filters(request.GET)
+    filtered, rank = filter_employees(employees, filters)
 
-    if employee.position.access_lvl < 2:
-        return redirect('active')
+    # Без поиска - по алфавиту (индекс по search_key), с поиском - по релевантности
+    if rank is not None:
+        sort_key, descending = rank, True
+    else:
+        sort_key, descending = 'search_key', False
+    page_size = get_page_size(request.GET.get('page_size'))
+    try:
+        (page, next_cursor), total_count, filtered_count = await gather_queries(
+            lambda: keyset_page(filtered, sort_key, descending, request.GET.get('cursor'), page_size,
+                                cursor_key='relevance'),
+            lambda: cached_count(employees, STAFF_LIST_TABLES, {}),
+            lambda: cached_count(filtered, STAFF_LIST_TABLES, filters),
+        )
+    except CursorError as e:
+        return HttpResponseBadRequest(str(e))
+
+    data = [{
+        'id': employee.id,
+        'full_name': f"{employee.last_name} {employee.first_name} {employee.middle_name}",
+        'position': employee.position.name if employee.position else "",
+        'department': employee.department.name if employee.department else "",
+        'status': employee.get_status_display(),
+        'employment_date': employee.employment_date,
+        'type_salary': employee.get_type_salary_display(),
+        'salary': employee.salary
+    } for employee in page]
+
+    return set_revalidation_headers(JsonResponse({
+        'data': data,
+        'total_count': total_count,
+        'filtered_count': filtered_count,
+        'next_cursor': next_cursor,
+    }, safe=False), etag)
+
+@access_required()
+def export_staff(request):
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Неизвестный формат выгрузки')
+    return export_response(STAFF_EXPORT_HEADER, staff_export_rows(request.GET), fmt, 'staff', "Сотрудники")
 
-    departments = Department.objects.all()
-    positions = JobTitle.objects.all()
+@csrf_exempt
+@access_required()
+def add_employee(request):
+    reference = get_reference_data()
+    departments = reference['departments']
+    positions = reference['positions']
 
     if request.method == 'POST':
         # Extract and handle form data
@@ -813,13 +687,8 @@ def add_employee(request):
         return render(request, 'add_employee.html', context)
 
 @csrf_exempt
-@login_required
+@access_required()
 def delete_employee(request, employee_id):
-    employee = Employee.objects.get(user=request.user)
-
-    if employee.position.access_lvl < 2:
-        return redirect('active')
-
     if request.method == 'POST':
         try:
             employee = Employee.objects.get(pk=employee_id)
@@ -830,16 +699,12 @@ def delete_employee(request, employee_id):
     return JsonResponse({'success': False, 'error': 'Неверный запрос'})
 
 @csrf_exempt
-@login_required
+@access_required()
 def refactor_employee(request, employee_id):
-    employee = Employee.objects.get(user=request.user)
-
-    if employee.position.access_lvl < 2:
-        return redirect('active')
-
     employee = get_object_or_404(Employee, pk=employee_id)
-    departments = Department.objects.all()
-    positions = JobTitle.objects.all()
+    reference = get_reference_data()
+    departments = reference['departments']
+    positions = reference['positions']
 
     if request.method == 'POST':
         # Парсинг данных из формы
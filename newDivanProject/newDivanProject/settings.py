@@ -49,10 +49,23 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'newDivanApp.middleware.CurrentEmployeeMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'newDivanApp.middleware.QueryBudgetMiddleware',
 ]
 
+# Учёт запросов к БД по представлениям (newDivanApp/querybudget.py).
+# ENABLED включает middleware, REPORT_FILE - ротируемый JSON-отчёт по каждому запросу
+QUERY_BUDGET = {
+    'ENABLED': False,
+    'MAX_QUERIES': 30,
+    'MAX_DB_TIME_MS': 500,
+    'MAX_REPEATS': 5,
+    'RAISE': False,
+    'REPORT_FILE': None,
+}
+
 ROOT_URLCONF = 'newDivanProject.urls'
 
 TEMPLATES = [